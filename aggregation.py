@@ -0,0 +1,254 @@
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def factorize(values):
+    """Encodes values as integer codes in order of first appearance.
+
+    values: (iterable) the values to encode.
+
+    returns: (tuple) the codes as an array and the list of distinct values, so
+                     that `labels[codes[i]]` is the i-th value.
+    """
+    lookup = dict()
+    codes = np.fromiter(
+        (lookup.setdefault(x, len(lookup)) for x in values),
+        dtype=np.int64
+    )
+
+    return codes, list(lookup.keys())
+
+
+class Node:
+    """A group of the expense tree, such as a date or a category on a date.
+
+    The number of table rows and the total price of every group are kept up
+    to date as expenses are added, so a table can be written in a single walk
+    over the tree without counting the rows of any group first.
+
+    label:    (str)   the label of the group.
+    children: (dict)  maps the label of each group in the group to its node,
+                      or of each expense to its price.
+    nrows:    (int)   the number of table rows of the group, counting its
+                      expenses and every subtotal row in it.
+    total:    (float) the total price of the group.
+    subtotal: (bool)  whether the group ends with a subtotal row.
+    """
+    __slots__ = ('label', 'children', 'nrows', 'total', 'subtotal')
+
+    def __init__(self, label=None, subtotal=False):
+        self.label = label
+        self.children = dict()
+        self.nrows = 1 if subtotal else 0
+        self.total = 0.0
+        self.subtotal = subtotal
+
+    def path(self, keys, nsubtotals=0):
+        """Finds the groups down to a group, creating them if needed.
+
+        keys:       ([str]) the labels of the groups from the top.
+        nsubtotals: (int)   the number of levels of groups from the top that
+                            end with a subtotal row.
+
+        returns: ([Node]) this group and every group below it down to the
+                          group of the last key.
+        """
+        path = [self]
+
+        for depth, label in enumerate(keys):
+            node = path[-1].children.get(label)
+
+            if node is None:
+                node = Node(label, depth < nsubtotals)
+                path[-1].children[label] = node
+
+                # A new subtotal row is a row of every group above it
+                if node.subtotal:
+                    for x in path:
+                        x.nrows += 1
+
+            path.append(node)
+
+        return path
+
+    def add(self, keys, price, nsubtotals=0):
+        """Adds an expense, creating the groups it belongs to if needed.
+
+        keys:       ([str]) the labels of the groups of the expense from the
+                            top, followed by the expense.
+        price:      (float) the price of the expense.
+        nsubtotals: (int)   see `path`.
+        """
+        add_expense(self.path(keys[:-1], nsubtotals), keys[-1], price)
+
+
+def add_expense(path, expense, price):
+    """Adds an expense to the last group of a path from `Node.path`, which
+    lets many expenses of the same group be added without finding the group
+    again.
+
+    path:    ([Node]) the groups of the expense from the top.
+    expense: (str)    the expense.
+    price:   (float)  the price of the expense.
+    """
+    children = path[-1].children
+
+    if expense in children:
+        children[expense] += price
+    else:
+        children[expense] = price
+
+        for x in path:
+            x.nrows += 1
+
+    for x in path:
+        x.total += price
+
+
+class Aggregation:
+    """Categorized expenses stored as NumPy columns, with every rollup needed
+    by the report.
+
+    The dates, categories, subcategories and expenses are stored as
+    categorical codes into their labels, in order of first appearance, and the
+    prices as floats, which can be whole numbers of cents so that they sum
+    exactly. All the rollups are computed at once when the aggregation is
+    created, in dollars:
+
+    overall:  (dict)  the total price of each category.
+    category: (dict)  the total price of each subcategory, grouped by category.
+    tree:     (Node)  the total price of each expense, grouped by date,
+                      category and subcategory, with subtotals of each date
+                      and of each category on a date.
+    total:    (float) the total price of every expense.
+
+    columns: (dict)       maps 'date', 'cat', 'subcat' and 'expense' to their
+                          codes.
+    labels:  (dict)       maps 'date', 'cat', 'subcat' and 'expense' to the
+                          labels of their codes.
+    prices:  (np.ndarray) the price of each row.
+    divisor: (float)      the number of prices in a dollar, such as 100 for
+                          prices in cents.
+    """
+    KEYS = ('date', 'cat', 'subcat', 'expense')
+
+    def __init__(self, columns, labels, prices, divisor=1):
+        self.columns = columns
+        self.labels = labels
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.divisor = divisor
+
+        self._rollup()
+
+    @classmethod
+    def from_expenses(cls, expenses):
+        """Creates the aggregation from categorized expenses.
+
+        expenses: (dict) maps each `Expense` key to its price.
+
+        returns: (Aggregation) the aggregation.
+        """
+        columns = dict()
+        labels = dict()
+
+        for i, key in enumerate(cls.KEYS):
+            columns[key], labels[key] = factorize(x[i] for x in expenses.keys())
+
+        prices = np.fromiter(
+            expenses.values(),
+            dtype=np.float64,
+            count=len(expenses)
+        )
+
+        return cls(columns, labels, prices)
+
+    @classmethod
+    def from_table(cls, table):
+        """Creates the aggregation from an `ExpenseTable`, reusing its codes.
+
+        The prices are whole numbers of cents, which are summed exactly as
+        floats up to 2**53 cents, and only divided into dollars once summed.
+
+        table: (ExpenseTable) the categorized expenses.
+
+        returns: (Aggregation) the aggregation.
+        """
+        columns = {
+            key: np.frombuffer(table.columns[key], dtype=np.int32).astype(np.int64)
+            for key in cls.KEYS
+        }
+        labels = {key: table.labels[key] for key in cls.KEYS}
+        prices = np.frombuffer(table.cents, dtype=np.int64).astype(np.float64)
+
+        return cls(columns, labels, prices, divisor=100)
+
+    def _rollup(self):
+        logger.debug('Aggregating expenses')
+
+        cats = self.labels['cat']
+        subcats = self.labels['subcat']
+
+        self.total = float(self.prices.sum()) / self.divisor
+
+        # Totals per category
+        totals = np.bincount(
+            self.columns['cat'],
+            weights=self.prices,
+            minlength=len(cats)
+        ) / self.divisor
+        self.overall = dict(zip(cats, totals.tolist()))
+
+        # Totals per subcategory, grouped on a combined code
+        keys, totals = self._group('cat', 'subcat')
+
+        self.category = dict()
+        for (cat, subcat), price in zip(keys.tolist(), totals.tolist()):
+            self.category.setdefault(cats[cat], dict())[subcats[subcat]] = price
+
+        # Totals per expense, grouped by every key
+        keys, totals = self._group(*self.KEYS)
+
+        columns = [
+            np.array(self.labels[key], dtype=object)[keys[:, i]].tolist()
+            for i, key in enumerate(self.KEYS)
+        ]
+
+        # The groups are sorted, so the path to a subcategory is only found
+        # again where the date, category or subcategory changes. The dates and
+        # the categories on each date have subtotal rows
+        starts = np.ones(len(keys), dtype=bool)
+        starts[1:] = np.any(keys[1:, :3] != keys[:-1, :3], axis=1)
+
+        self.tree = Node()
+        rows = zip(starts.tolist(), *columns, totals.tolist())
+        for start, date, cat, subcat, expense, price in rows:
+            if start:
+                path = self.tree.path((date, cat, subcat), nsubtotals=2)
+
+            add_expense(path, expense, price)
+
+    def _group(self, *keys):
+        """Sums the prices of the rows sharing the same codes in the columns.
+
+        keys: (str) the columns to group by.
+
+        returns: (tuple) the distinct codes of the groups, sorted by the first
+                         column and then the next ones, as an array with one
+                         column per key, and the total price of each group.
+        """
+        dims = tuple(len(self.labels[key]) for key in keys)
+
+        if len(self.prices) == 0:
+            return np.empty((0, len(keys)), dtype=np.int64), np.empty(0)
+
+        combined = np.ravel_multi_index(
+            tuple(self.columns[key] for key in keys),
+            dims
+        )
+        groups, inverse = np.unique(combined, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.prices) / self.divisor
+
+        return np.column_stack(np.unravel_index(groups, dims)), totals
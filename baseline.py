@@ -0,0 +1,271 @@
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+def welford_add(stat, x):
+    """Adds a value to running statistics.
+
+    stat: (dict) the number of values 'n', their 'mean' and the sum of squared
+                 differences from the mean 'm2'. It is updated in place.
+    x:    (float) the value.
+    """
+    stat['n'] += 1
+    delta = x - stat['mean']
+    stat['mean'] += delta / stat['n']
+    stat['m2'] += delta * (x - stat['mean'])
+
+
+def welford_remove(stat, x):
+    """Removes a value that was added to running statistics.
+
+    stat: (dict)  the running statistics, updated in place.
+    x:    (float) the value.
+    """
+    if stat['n'] <= 1:
+        stat.update(n=0, mean=0.0, m2=0.0)
+        return
+
+    mean = (stat['n'] * stat['mean'] - x) / (stat['n'] - 1)
+    stat['m2'] = max(stat['m2'] - (x - mean) * (x - stat['mean']), 0.0)
+    stat['mean'] = mean
+    stat['n'] -= 1
+
+
+class Baseline:
+    """A persistent baseline of the monthly spending per category and
+    subcategory.
+
+    The count, mean and variance of the monthly totals are kept as running
+    statistics, so adding a month only touches the statistics of each
+    category and never the months before it. A category missing from a month
+    counts as no spending in that month.
+
+    The totals of each month are also kept, so a month that is added again
+    with different expenses replaces its earlier totals. The baseline is
+    stored with the structure
+
+    {
+        'n': number of months,
+        'stats': {key: {'n': count, 'mean': mean, 'm2': sum of squares}},
+        'periods': {period: hash of the expenses},
+    }
+
+    where the key of a category is its name and the key of a subcategory is
+    the category and subcategory separated by a slash. The totals of each
+    month are stored in a file of their own, named after the month and the
+    hash of its expenses, so saving a month never writes the other months
+    again, and the totals of a month are only read when it is replaced.
+
+    Several processes can add months to the same baseline at the same time.
+    Each one only keeps the months it added, and `save` reads the file again
+    and adds them to it while holding a lock on the file, so that the months
+    added by other processes since it was read are never lost.
+
+    filename: (str) the JSON file of the baseline.
+    """
+    def __init__(self, filename='baseline.json'):
+        self.filename = filename
+
+        # The directory of the totals of each month
+        self.directory = os.path.splitext(filename)[0] + '.periods'
+
+        # The months added since the baseline was last read
+        self.added = dict()
+
+        self._load()
+
+    def add(self, period, digest, totals):
+        """Adds the totals of a month, replacing its earlier totals if it was
+        already added with different expenses.
+
+        period: (str)  the name of the month.
+        digest: (str)  a hash of the expenses of the month.
+        totals: (dict) the total of each category and subcategory key.
+
+        returns: (bool) whether the baseline changed.
+        """
+        if not self._add(period, digest, totals):
+            return False
+
+        self.added[period] = (digest, totals)
+
+        return True
+
+    def _add(self, period, digest, totals):
+        previous = self.periods.get(period)
+
+        if previous == digest:
+            return False
+
+        if previous is not None:
+            self._remove(self._totals(period, previous))
+
+        # Categories seen for the first time had no spending in earlier months
+        for key in totals.keys():
+            if key not in self.stats.keys():
+                self.stats[key] = {'n': self.n, 'mean': 0.0, 'm2': 0.0}
+
+        for key, stat in self.stats.items():
+            welford_add(stat, totals.get(key, 0.0))
+
+        self.n += 1
+        self.periods[period] = digest
+
+        return True
+
+    def compare(self, period, totals):
+        """Compares the totals of a month with the average of the other months.
+
+        period: (str)  the name of the month, which is left out of the average.
+        totals: (dict) the total of each category and subcategory key.
+
+        returns: (dict) maps each key to its total, the mean and standard
+                        deviation of the other months, and the difference
+                        from the mean. Empty if there are no other months.
+        """
+        stats = {key: dict(stat) for key, stat in self.stats.items()}
+
+        previous = self.periods.get(period)
+        if previous is not None:
+            previous = self._totals(period, previous)
+
+            for key, stat in stats.items():
+                welford_remove(stat, previous.get(key, 0.0))
+
+        comparison = dict()
+        for key in set(totals.keys()) | set(stats.keys()):
+            stat = stats.get(key)
+
+            if stat is None or stat['n'] == 0:
+                continue
+
+            total = totals.get(key, 0.0)
+            std = math.sqrt(stat['m2'] / (stat['n'] - 1)) if stat['n'] > 1 else 0.0
+
+            comparison[key] = {
+                'total': total,
+                'mean': stat['mean'],
+                'std': std,
+                'difference': total - stat['mean'],
+            }
+
+        return comparison
+
+    def save(self):
+        """Adds the months added since the baseline was read to its file.
+
+        The file is read again, and the months are added to it, so the months
+        that other processes saved in the meantime are kept. Only the totals
+        of the added months are written, before the baseline that refers to
+        them, and the totals they replace are deleted after it.
+        """
+        with self._lock():
+            self._load()
+
+            replaced = list()
+            for period, (digest, totals) in self.added.items():
+                previous = self.periods.get(period)
+
+                if self._add(period, digest, totals):
+                    self._write(self._filename(period, digest), totals)
+
+                    if previous is not None:
+                        replaced.append(self._filename(period, previous))
+
+            self._write(
+                self.filename,
+                {'n': self.n, 'stats': self.stats, 'periods': self.periods}
+            )
+
+            for filename in replaced:
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+
+        self.added = dict()
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            logger.info(f'{self.filename} could not be found, creating empty baseline')
+            data = {'n': 0, 'stats': dict(), 'periods': dict()}
+
+        self.n = data['n']
+        self.stats = data['stats']
+        self.periods = dict()
+
+        for period, digest in data['periods'].items():
+            # Baselines saved before the totals had files of their own kept
+            # them with the hash, and they are moved out on the next save
+            if isinstance(digest, dict):
+                filename = self._filename(period, digest['hash'])
+
+                if not os.path.exists(filename):
+                    self._write(filename, digest['totals'])
+
+                digest = digest['hash']
+
+            self.periods[period] = digest
+
+    def _totals(self, period, digest):
+        """Reads the totals of a month.
+
+        period: (str) the name of the month.
+        digest: (str) the hash of its expenses.
+
+        returns: (dict) the total of each category and subcategory key.
+        """
+        added = self.added.get(period)
+        if added is not None and added[0] == digest:
+            return added[1]
+
+        with open(self._filename(period, digest), 'r') as file:
+            return json.load(file)
+
+    def _filename(self, period, digest):
+        content = period + '\0' + digest
+        key = hashlib.sha256(content.encode()).hexdigest()[:16]
+
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _write(self, filename, data):
+        # Written to a temporary file first, so that a file is never read
+        # while it is partially written
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        tmpname = f'{filename}.{os.getpid()}.tmp'
+
+        with open(tmpname, 'w') as file:
+            json.dump(data, file)
+
+        os.replace(tmpname, filename)
+
+    @contextmanager
+    def _lock(self):
+        """Holds an exclusive lock on the baseline while the block runs,
+        waiting for other processes to release it.
+        """
+        with open(self.filename + '.lock', 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _remove(self, totals):
+        for key, stat in self.stats.items():
+            welford_remove(stat, totals.get(key, 0.0))
+
+        self.n -= 1
@@ -0,0 +1,1737 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from difflib import get_close_matches
+from fuzzy_index import TrigramIndex
+
+
+WORDS = [
+    'cafe', 'coffee', 'market', 'grocery', 'pharmacy', 'books', 'burger',
+    'sushi', 'pizza', 'taxi', 'transit', 'hardware', 'garden', 'pet', 'gas',
+    'station', 'bakery', 'deli', 'cinema', 'theatre', 'gym', 'clinic',
+    'dental', 'hotel', 'airline', 'parking', 'liquor', 'electronics', 'shoes',
+    'clothing', 'insurance', 'hydro', 'internet', 'phone', 'rent', 'bank',
+]
+
+CITIES = [
+    'vancouver', 'toronto', 'montreal', 'calgary', 'ottawa', 'victoria',
+    'edmonton', 'winnipeg', 'halifax', 'regina',
+]
+
+
+def make_merchant(rng):
+    """Creates a random merchant string like the ones found in bank exports.
+
+    rng: (random.Random) the random number generator.
+
+    returns: (str) the merchant string.
+    """
+    name = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+
+    return f'{name} #{rng.randint(1, 9999)} {rng.choice(CITIES)}'
+
+
+def make_typo(rng, word):
+    """Introduces a single random typo into a word.
+
+    rng:  (random.Random) the random number generator.
+    word: (str)           the word.
+
+    returns: (str) the word with a typo.
+    """
+    i = rng.randrange(len(word))
+    letter = rng.choice(string.ascii_lowercase)
+    edit = rng.choice(['delete', 'insert', 'replace', 'swap'])
+
+    if edit == 'delete':
+        return word[:i] + word[i+1:]
+    elif edit == 'insert':
+        return word[:i] + letter + word[i:]
+    elif edit == 'replace':
+        return word[:i] + letter + word[i+1:]
+    else:
+        i = min(i, len(word) - 2)
+        return word[:i] + word[i+1] + word[i] + word[i+2:]
+
+
+def write_expenses(
+    filename,
+    catfile,
+    nrows,
+    nmerchants,
+    seed=0,
+    typos=0.0,
+    unknown=0.0,
+    blank_dates=0.0,
+    resfile=None
+):
+    """Writes a CSV file of random expenses and the categories of its merchants.
+
+    The CSV file has the 'Date', 'Expense' and 'Price' columns read by
+    `ExpenseReport`, and is written row by row, so it can be much larger than
+    the memory.
+
+    filename:    (str)   the CSV file to write.
+    catfile:     (str)   the JSON file of the categories to write.
+    nrows:       (int)   the number of expenses.
+    nmerchants:  (int)   the number of distinct merchants.
+    seed:        (int)   the seed of the random number generator.
+    typos:       (float) the share of rows with a misspelled merchant.
+    unknown:     (float) the share of rows with a merchant that is not in the
+                         categories.
+    blank_dates: (float) the share of rows without a date, which reuse the
+                         date of the row before them.
+    resfile:     (str)   the JSON file of the resolutions of the misspelled
+                         and unknown merchants to write, for
+                         `load_resolutions`. If `None`, it is not written.
+    """
+    rng = random.Random(seed)
+
+    merchants = set()
+    while len(merchants) < nmerchants:
+        merchants.add(make_merchant(rng))
+
+    merchants = list(merchants)
+
+    cats = dict()
+    for merchant in merchants:
+        cats[merchant] = {
+            'cat': rng.choice(WORDS[:8]),
+            'subcat': rng.choice(WORDS[8:]),
+            'mean': 0,
+            'npurchases': 0,
+        }
+
+    with open(catfile, 'w') as file:
+        json.dump(cats, file)
+
+    # Every fifth merchant has a misspelling and a stranger that is never
+    # categorized, so the distinct expenses stay bounded as the rows grow
+    npool = max(nmerchants // 5, 1)
+
+    resolutions = dict()
+    for merchant in rng.sample(merchants, min(npool, nmerchants)):
+        typo = make_typo(rng, merchant)
+
+        if typo not in cats.keys():
+            resolutions[typo] = merchant
+
+    misspelled = list(resolutions.keys())
+
+    strangers = list()
+    while len(strangers) < npool:
+        merchant = make_merchant(rng)
+
+        if merchant not in cats.keys() and merchant not in resolutions.keys():
+            strangers.append(merchant)
+            resolutions[merchant] = {
+                'cat': rng.choice(WORDS[:8]),
+                'subcat': rng.choice(WORDS[8:]),
+            }
+
+    if resfile is not None:
+        with open(resfile, 'w') as file:
+            json.dump(resolutions, file)
+
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Date', 'Expense', 'Price'])
+
+        for i in range(nrows):
+            x = rng.random()
+
+            if x < typos:
+                merchant = rng.choice(misspelled)
+            elif x < typos + unknown:
+                merchant = rng.choice(strangers)
+            else:
+                merchant = rng.choice(merchants)
+
+            if i > 0 and rng.random() < blank_dates:
+                date = ''
+            else:
+                date = f'2020-{i % 12 + 1:02d}-{i % 28 + 1:02d}'
+
+            writer.writerow([date, merchant, f'{rng.uniform(1, 200):.2f}'])
+
+
+def _ingest(filename, catfile, chunksize, queue):
+    # Runs in a fresh process so that the peak memory is only the ingestion
+    from expense_report import ExpenseReport
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    expo = ExpenseReport(filename, catfile=catfile, chunksize=chunksize)
+    expo.categorize(resolved=dict())
+    elapsed = time.perf_counter() - start
+
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    queue.put((elapsed, len(expo.expenses), before, after))
+
+
+def bench_ingest(sizes, chunksize, nmerchants=500, seed=0, max_growth=32):
+    """Measures the time and peak memory of categorizing CSV files.
+
+    Every size uses the same merchants and dates, so the peak memory should
+    stay flat as the number of rows grows. Only the distinct expenses are
+    kept, so it still grows a little with them. The check fails if the memory
+    used by ingestion grows by more than max_growth over the smallest size,
+    as it does when whole files are read at once.
+
+    sizes:      ([int]) the number of rows to benchmark with.
+    chunksize:  (int)   the number of rows read at a time.
+    nmerchants: (int)   the number of distinct merchants.
+    seed:       (int)   the seed of the random number generator.
+    max_growth: (float) the most the ingestion memory may grow, in MiB.
+
+    returns: ([dict]) the results for each size.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            filename = os.path.join(tmpdir, f'expenses{size}.csv')
+            catfile = os.path.join(tmpdir, f'cats{size}.json')
+            write_expenses(filename, catfile, size, nmerchants, seed)
+
+            queue = context.Queue()
+            process = context.Process(
+                target=_ingest,
+                args=(filename, catfile, chunksize, queue)
+            )
+            process.start()
+            elapsed, nkeys, before, after = queue.get()
+            process.join()
+
+            # ru_maxrss is in kilobytes on Linux
+            ingest = (after - before) / 1024
+            if not results:
+                smallest = ingest
+
+            results.append({
+                'rows': size,
+                'distinct_keys': nkeys,
+                'categorize_s': elapsed,
+                'peak_rss_mib': after / 1024,
+                'ingest_rss_mib': ingest,
+                'check': _check(ingest - smallest <= max_growth),
+            })
+
+    return results
+
+
+def bench_pipeline(
+    sizes,
+    nmerchants=500,
+    typos=0.05,
+    unknown=0.02,
+    blank_dates=0.1,
+    nqueries=100,
+    seed=0
+):
+    """Measures each stage of creating an expense report separately.
+
+    The unknown expenses are resolved in batch mode from the resolutions
+    written with the CSV file, so no stage ever asks for input. Charts are
+    always drawn again, and the PDF is only compiled if pdflatex is installed.
+
+    sizes:       ([int]) the number of rows to benchmark with.
+    nmerchants:  (int)   the number of distinct merchants.
+    typos:       (float) the share of rows with a misspelled merchant.
+    unknown:     (float) the share of rows with an unknown merchant.
+    blank_dates: (float) the share of rows without a date.
+    nqueries:    (int)   the number of exact and of misspelled queries.
+    seed:        (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from aggregation import Aggregation
+    from category_manager import CategoryManager, load_resolutions
+    from expense_report import ExpenseReport
+    from tex_generator import TexGenerator
+
+    compiles = shutil.which('pdflatex') is not None
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            filename = os.path.join(tmpdir, f'expenses{size}.csv')
+            catfile = os.path.join(tmpdir, f'cats{size}.json')
+            resfile = os.path.join(tmpdir, f'resolutions{size}.json')
+
+            start = time.perf_counter()
+            write_expenses(
+                filename,
+                catfile,
+                size,
+                nmerchants,
+                seed,
+                typos,
+                unknown,
+                blank_dates,
+                resfile
+            )
+            generate = time.perf_counter() - start
+
+            # The first load imports cats.json into the database
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                catman = CategoryManager(catfile)
+                catman_import = time.perf_counter() - start
+                del catman
+
+                start = time.perf_counter()
+                catman = CategoryManager(catfile)
+                catman_load = time.perf_counter() - start
+
+            resolutions = load_resolutions(resfile)
+            rng = random.Random(seed)
+            known = rng.sample(list(catman.expenses.keys()), nqueries)
+            misspelled = [
+                x for x, y in resolutions.items() if isinstance(y, str)
+            ][:nqueries]
+
+            start = time.perf_counter()
+            for expense in known:
+                catman.query(expense)
+            query_exact = (time.perf_counter() - start) / len(known)
+
+            start = time.perf_counter()
+            catman.index
+            index_build = time.perf_counter() - start
+
+            # What `query` does for a typo, short of asking which match to use
+            start = time.perf_counter()
+            for expense in misspelled:
+                catman.index.get_close_matches(expense)
+            query_fuzzy = (time.perf_counter() - start) / max(len(misspelled), 1)
+
+            expo = ExpenseReport(
+                filename,
+                catman=catman,
+                chartdir=None,
+                cachedir=None
+            )
+
+            start = time.perf_counter()
+            resolved = catman.resolve(
+                expo.unresolved_expenses(),
+                resolutions,
+                interactive=False
+            )
+            resolve = time.perf_counter() - start
+
+            start = time.perf_counter()
+            expo._categorize_expenses(resolved)
+            catman.commit()
+            categorize = time.perf_counter() - start
+
+            start = time.perf_counter()
+            expo.aggregation = Aggregation.from_table(expo.expenses)
+            aggregate = time.perf_counter() - start
+
+            start = time.perf_counter()
+            expo._generate_graphs()
+            graphs = time.perf_counter() - start
+
+            # The same document as `ExpenseReport._generate_document`
+            texgen = TexGenerator(os.path.join(tmpdir, f'report{size}.tex'))
+            texgen.add_header()
+            texgen.add_title(f'Report {size}')
+            texgen.add_section('Expense Charts')
+
+            for figure in expo.figures:
+                texgen.add_figure(figure)
+
+            texgen.add_section('Expense Data')
+
+            start = time.perf_counter()
+            texgen.add_table(expo.aggregation.tree, expo.aggregation.total)
+            table = time.perf_counter() - start
+
+            texgen.add_footer()
+            texgen.write()
+
+            compiled, elapsed = texgen.compile() if compiles else (False, None)
+            expo._clean_graphs()
+
+            results.append({
+                'rows': size,
+                'distinct_keys': len(expo.expenses),
+                'generate_s': generate,
+                'catman_import_s': catman_import,
+                'catman_load_s': catman_load,
+                'query_exact_s': query_exact,
+                'index_build_s': index_build,
+                'query_fuzzy_s': query_fuzzy,
+                'resolve_s': resolve,
+                'categorize_s': categorize,
+                'aggregate_s': aggregate,
+                'graphs_s': graphs,
+                'table_s': table,
+                'compile_s': elapsed if compiled else None,
+            })
+
+            del expo, catman
+
+    return results
+
+
+def bench_startup(nrepeats=5):
+    """Measures how long the modules take to import, and how long the command
+    line takes to start, each in a fresh interpreter.
+
+    Importing the modules that the categorization needs should not import
+    matplotlib or NumPy, which are only imported once charts are drawn.
+
+    nrepeats: (int) the number of times each is measured, keeping the fastest.
+
+    returns: ([dict]) the results for each module and command.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    check = (
+        'import sys; print(int("matplotlib" in sys.modules), '
+        'int("numpy" in sys.modules))'
+    )
+
+    targets = [
+        ('import expense_report', [f'import expense_report; {check}']),
+        ('import main', [f'import main; {check}']),
+        ('draw first chart', [
+            'import charts; charts.render_sheet(charts.Sheet('
+            '"x", [("x", {"x": 1})], 1, 1, (1, 1)), dpi=10); ' + check
+        ]),
+        ('main.py --help', None),
+    ]
+
+    results = list()
+    for name, code in targets:
+        if code is None:
+            command = [sys.executable, os.path.join(root, 'main.py'), '--help']
+        else:
+            command = [sys.executable, '-c'] + code
+
+        elapsed = float('inf')
+        for _ in range(nrepeats):
+            start = time.perf_counter()
+            output = subprocess.run(
+                command,
+                cwd=root,
+                stdout=subprocess.PIPE,
+                check=True,
+                text=True
+            ).stdout
+            elapsed = min(elapsed, time.perf_counter() - start)
+
+        if code is None:
+            imported = [None, None]
+        else:
+            imported = [bool(int(x)) for x in output.split()[-2:]]
+
+        results.append({
+            'target': name,
+            'wall_s': elapsed,
+            'imports_matplotlib': imported[0],
+            'imports_numpy': imported[1],
+        })
+
+    return results
+
+
+def bench_server(sizes, nrepeats=5, nmerchants=500, seed=0):
+    """Compares the latency of a report created by a report server with a
+    report created by running main.py once.
+
+    Every report is forced to be rebuilt, so both draw the same charts and
+    write the same PDF, and the difference is what the server keeps loaded.
+    The PDF is only compiled with LaTeX if pdflatex is installed, otherwise
+    it is written by the pdf backend.
+
+    sizes:      ([int]) the number of rows to benchmark with.
+    nrepeats:   (int)   the number of reports of each kind.
+    nmerchants: (int)   the number of distinct merchants.
+    seed:       (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from report_server import request, submit
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    main = os.path.join(root, 'main.py')
+    backend = 'tex' if shutil.which('pdflatex') is not None else 'pdf'
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        catfile = os.path.join(tmpdir, 'cats.db')
+        address = os.path.join(tmpdir, 'server.sock')
+        common = ['-c', catfile, '--backend', backend, '--baseline', os.path.join(tmpdir, 'baseline.json')]
+
+        for size in sizes:
+            filename = os.path.join(tmpdir, f'expenses{size}.csv')
+            write_expenses(filename, os.path.join(tmpdir, 'cats.json'), size, nmerchants, seed)
+
+            oneshot = list()
+            for _ in range(nrepeats):
+                start = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, main, '-f', filename, '--force', '-b'] + common,
+                    cwd=tmpdir,
+                    stdout=subprocess.DEVNULL,
+                    check=True
+                )
+                oneshot.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            server = subprocess.Popen(
+                [sys.executable, main, '--serve', address] + common,
+                cwd=tmpdir
+            )
+
+            while True:
+                try:
+                    request(address, {'command': 'ping'})
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    time.sleep(0.01)
+            startup = time.perf_counter() - start
+
+            try:
+                daemon = list()
+                for _ in range(nrepeats):
+                    start = time.perf_counter()
+                    submit(address, filename, force=True, backend=backend)
+                    daemon.append(time.perf_counter() - start)
+
+                # The client on the command line still starts Python
+                client = list()
+                for _ in range(nrepeats):
+                    start = time.perf_counter()
+                    subprocess.run(
+                        [sys.executable, main, '--server', address, '-f', filename, '--force', '--backend', backend],
+                        cwd=tmpdir,
+                        stdout=subprocess.DEVNULL,
+                        check=True
+                    )
+                    client.append(time.perf_counter() - start)
+            finally:
+                request(address, {'command': 'shutdown'})
+                server.wait()
+
+            results.append({
+                'rows': size,
+                'backend': backend,
+                'oneshot_s': min(oneshot),
+                'server_startup_s': startup,
+                'server_first_s': daemon[0],
+                'server_s': min(daemon),
+                'server_cli_s': min(client),
+                'speedup': min(oneshot) / min(daemon),
+            })
+
+    return results
+
+
+# Stands in for pdflatex when it is not installed, taking a fixed time for
+# each pass and writing an empty PDF, or format file with -ini
+FAKE_PDFLATEX = """#!/bin/sh
+sleep {delay}
+for last in "$@"; do :; done
+case "$*" in
+    *-ini*) touch preamble.fmt ;;
+    *) name=$(basename "$last" .tex); touch "$name.pdf" "$name.log" ;;
+esac
+"""
+
+
+def bench_overlap(sizes, nreports=8, jobs=1, delay=0.5, nmerchants=500, seed=0):
+    """Compares creating many reports one stage after another with the
+    pipeline that overlaps their stages.
+
+    The reports are first created one after another, timing each stage, and
+    then again with `ReportPipeline`. If pdflatex is not installed, it is
+    replaced by a script that takes `delay` seconds for each pass.
+
+    sizes:      ([int]) the number of rows of each report.
+    nreports:   (int)   the number of reports.
+    jobs:       (int)   the number of reports prepared and compiled at a time
+                        by the pipeline.
+    delay:      (float) the time of each pass of the stand-in for pdflatex.
+    nmerchants: (int)   the number of distinct merchants.
+    seed:       (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from category_manager import CategoryManager
+    from expense_report import ExpenseReport
+    from report_pipeline import ReportPipeline
+
+    compiler = 'pdflatex' if shutil.which('pdflatex') is not None else 'simulated'
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.environ['PATH']
+        cwd = os.getcwd()
+
+        if compiler == 'simulated':
+            bindir = os.path.join(tmpdir, 'bin')
+            os.makedirs(bindir)
+
+            with open(os.path.join(bindir, 'pdflatex'), 'w') as file:
+                file.write(FAKE_PDFLATEX.format(delay=delay))
+
+            os.chmod(os.path.join(bindir, 'pdflatex'), 0o755)
+            os.environ['PATH'] = bindir + os.pathsep + path
+
+        # The reports keep their format files in the working directory, which
+        # must not get the empty ones of the stand-in for pdflatex
+        os.chdir(tmpdir)
+
+        try:
+            for size in sizes:
+                catfile = os.path.join(tmpdir, f'cats{size}.json')
+                filenames = [
+                    os.path.join(tmpdir, f'expenses{size}_{i}.csv')
+                    for i in range(nreports)
+                ]
+
+                for filename in filenames:
+                    write_expenses(filename, catfile, size, nmerchants, seed)
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    catman = CategoryManager(catfile)
+
+                def reports():
+                    return [
+                        ExpenseReport(
+                            filename,
+                            catman=catman,
+                            chartdir=None,
+                            cachedir=None
+                        )
+                        for filename in filenames
+                    ]
+
+                stages = {'categorize': 0.0, 'prepare': 0.0, 'compile': 0.0}
+
+                start = time.perf_counter()
+                for expo in reports():
+                    t = time.perf_counter()
+                    expo.categorize(dict())
+                    stages['categorize'] += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    expo.prepare()
+                    stages['prepare'] += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    expo.finish(*expo.compile())
+                    stages['compile'] += time.perf_counter() - t
+                sequential = time.perf_counter() - start
+
+                start = time.perf_counter()
+                ReportPipeline(reports(), dict(), jobs, jobs).run()
+                pipeline = time.perf_counter() - start
+
+                # Each stage of the pipeline runs `jobs` reports at a time,
+                # except for categorizing
+                slowest = max(
+                    stages['categorize'],
+                    stages['prepare'] / jobs,
+                    stages['compile'] / jobs
+                )
+
+                results.append({
+                    'rows': size,
+                    'reports': nreports,
+                    'compiler': compiler,
+                    'categorize_s': stages['categorize'],
+                    'prepare_s': stages['prepare'],
+                    'compile_s': stages['compile'],
+                    'sequential_s': sequential,
+                    'pipeline_s': pipeline,
+                    'slowest_stage_s': slowest,
+                })
+
+                del catman
+        finally:
+            os.environ['PATH'] = path
+            os.chdir(cwd)
+
+    return results
+
+
+def dict_rollups(expenses):
+    """The nested dictionary rollups that the report used before the
+    aggregation, kept as the baseline of `bench_aggregate`.
+
+    expenses: (dict) maps each `Expense` key to its price.
+
+    returns: (tuple) the totals per category, per subcategory, the tree and
+                     the total.
+    """
+    overall = dict()
+    category = dict()
+
+    for x, price in expenses.items():
+        if x.cat not in overall.keys():
+            overall[x.cat] = 0
+
+        overall[x.cat] += price
+
+        if x.cat not in category.keys():
+            category[x.cat] = dict()
+
+        if x.subcat not in category[x.cat].keys():
+            category[x.cat][x.subcat] = 0
+
+        category[x.cat][x.subcat] += price
+
+    total = 0
+    data = dict()
+    for x, price in expenses.items():
+        if x.date not in data.keys():
+            data[x.date] = dict()
+
+        if x.cat not in data[x.date].keys():
+            data[x.date][x.cat] = dict()
+
+        if x.subcat not in data[x.date][x.cat].keys():
+            data[x.date][x.cat][x.subcat] = dict()
+
+        if x.expense not in data[x.date][x.cat][x.subcat].keys():
+            data[x.date][x.cat][x.subcat][x.expense] = 0
+
+        data[x.date][x.cat][x.subcat][x.expense] += price
+        total += price
+
+    return overall, category, data, total
+
+
+def nested_table(data):
+    """The LaTeX table rows that `TexGenerator.add_table` wrote before the
+    expense tree kept the number of rows of each group, kept as the baseline
+    of `bench_rows`. The rows of each group are counted again at every level,
+    and the line under the last row of a group is fixed afterwards.
+
+    data: (dict) the total price of each expense, grouped by date, category
+                 and subcategory.
+
+    yields: (str) the rows of each date.
+    """
+    from tex_generator import escape
+
+    def nitems(data):
+        n = 0
+        for value in data.values():
+            n += nitems(value) if isinstance(value, dict) else 1
+
+        return n
+
+    def generate(data, rows, r=0, c=1):
+        i = 0
+        for key, value in data.items():
+            if isinstance(value, dict):
+                n = nitems(value)
+
+                rows[r + i] += f'\\multirow{{{n}}}{{*}}{{{escape(key.title())}}} '
+
+                for j in range(n):
+                    rows[r + i + j] += '& '
+
+                rows = generate(value, rows, r + i, c + 1)
+                rows[r + i + n - 1] = rows[r + i + n - 1][:-5] + f'{{{c}-5}}'
+
+                i += n
+            else:
+                rows[r + i] += f'{escape(key.title())} & {value:.2f} \\\\ \\cline{{{c}-5}}'
+                i += 1
+
+        return rows
+
+    for key, value in data.items():
+        group = {key: value}
+        yield '  ' + '\n  '.join(generate(group, ['' for _ in range(nitems(group))])) + '\n'
+
+
+def make_categorized(nkeys, seed=0):
+    """Creates random categorized expenses, as kept by `ExpenseReport`.
+
+    nkeys: (int) the number of distinct expenses.
+    seed:  (int) the seed of the random number generator.
+
+    returns: (dict) maps each `Expense` key to its price.
+    """
+    from expense_report import Expense
+
+    rng = random.Random(seed)
+
+    merchants = [make_merchant(rng) for _ in range(max(nkeys // 20, 1))]
+    dates = [f'2020-{m:02d}-{d:02d}' for m in range(1, 13) for d in range(1, 29)]
+
+    expenses = dict()
+    while len(expenses) < nkeys:
+        key = Expense(
+            rng.choice(dates),
+            rng.choice(WORDS[:8]),
+            rng.choice(WORDS[8:]),
+            rng.choice(merchants)
+        )
+        expenses[key] = round(rng.uniform(1, 200), 2)
+
+    return expenses
+
+
+def bench_aggregate(sizes, seed=0):
+    """Compares the NumPy aggregation to the nested dictionary loops.
+
+    sizes: ([int]) the number of distinct expenses to benchmark with.
+    seed:  (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from aggregation import Aggregation
+
+    results = list()
+
+    for size in sizes:
+        expenses = make_categorized(size, seed)
+
+        start = time.perf_counter()
+        overall, category, tree, total = dict_rollups(expenses)
+        loops = time.perf_counter() - start
+
+        start = time.perf_counter()
+        aggregation = Aggregation.from_expenses(expenses)
+        vectorized = time.perf_counter() - start
+
+        assert aggregation.tree.children.keys() == tree.keys()
+        assert abs(aggregation.total - total) < 1e-6 * max(abs(total), 1)
+
+        results.append({
+            'keys': size,
+            'dict_loops_s': loops,
+            'numpy_s': vectorized,
+            'speedup': loops / vectorized,
+        })
+
+    return results
+
+
+def bench_rows(sizes, seed=0):
+    """Compares writing the rows of the LaTeX table of the expenses from the
+    expense tree, which keeps the number of rows of each group, with counting
+    the rows of nested dictionaries at every level.
+
+    The tree also writes a subtotal row for each date and each category on a
+    date, which the nested dictionaries do not.
+
+    sizes: ([int]) the number of expenses in the table.
+    seed:  (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from aggregation import Aggregation
+    from tex_generator import TexGenerator
+
+    results = list()
+
+    for size in sizes:
+        aggregation = Aggregation.from_expenses(make_categorized(size, seed))
+
+        # The same groups as nested dictionaries
+        def nest(node):
+            if isinstance(node, float):
+                return node
+
+            return {label: nest(child) for label, child in node.children.items()}
+
+        data = nest(aggregation.tree)
+
+        start = time.perf_counter()
+        nrows = sum(x.count('\n') for x in nested_table(data))
+        nested = time.perf_counter() - start
+
+        texgen = TexGenerator(os.devnull)
+
+        start = time.perf_counter()
+        texgen.add_table(aggregation.tree, aggregation.total)
+        texgen.write()
+        tree = time.perf_counter() - start
+
+        results.append({
+            'expenses': size,
+            'rows': aggregation.tree.nrows,
+            'nested_rows': nrows,
+            'nested_s': nested,
+            'tree_s': tree,
+            'speedup': nested / tree,
+        })
+
+    return results
+
+
+def bench_charts(sizes, seed=0):
+    """Compares drawing the chart sheets as 300 dpi PNG images and as vector
+    PDF and SVG files.
+
+    The final PDF is only compiled if pdflatex is installed, and never for
+    SVG, which pdflatex cannot embed.
+
+    sizes: ([int]) the number of distinct expenses to benchmark with.
+    seed:  (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size and format.
+    """
+    from aggregation import Aggregation
+    from charts import pie_sheets, render_sheets
+    from tex_generator import TexGenerator
+
+    compiles = shutil.which('pdflatex') is not None
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            aggregation = Aggregation.from_expenses(make_categorized(size, seed))
+            sheets = pie_sheets(aggregation.overall, aggregation.category)
+
+            for fmt in ['png', 'pdf', 'svg']:
+                start = time.perf_counter()
+                images, _ = render_sheets(sheets, fmt=fmt)
+                render = time.perf_counter() - start
+
+                texgen = TexGenerator(os.path.join(tmpdir, f'charts{size}{fmt}.tex'))
+                texgen.add_header()
+                texgen.add_title('Charts')
+
+                for sheet, image in zip(sheets, images):
+                    filename = os.path.join(tmpdir, f'{sheet.name}{size}.{fmt}')
+
+                    with open(filename, 'wb') as file:
+                        file.write(image)
+
+                    texgen.add_figure(filename)
+
+                texgen.add_footer()
+                texgen.write()
+
+                pdfsize = None
+                if compiles and fmt != 'svg':
+                    compiled, _ = texgen.compile()
+
+                    if compiled:
+                        pdfsize = os.path.getsize(texgen.filename[:-4] + '.pdf')
+
+                results.append({
+                    'keys': size,
+                    'format': fmt,
+                    'sheets': len(sheets),
+                    'render_s': render,
+                    'bytes_written': sum(len(image) for image in images),
+                    'pdf_bytes': pdfsize,
+                })
+
+    return results
+
+
+def bench_rules(sizes, nqueries, seed=0):
+    """Compares the compiled rules to trying each rule in turn.
+
+    sizes:    ([int]) the number of rules to benchmark with.
+    nqueries: (int)   the number of expenses looked up for each size.
+    seed:     (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    import re
+
+    from rules import RuleSet
+
+    results = list()
+
+    for size in sizes:
+        rng = random.Random(seed)
+
+        # Mostly merchant prefixes, as in "cafe deli #", with some substrings
+        # and a few regular expressions
+        rules = list()
+        for id in range(size):
+            name = make_merchant(rng).split('#')[0]
+            kind = rng.choices(['prefix', 'substring', 'regex'], [6, 3, 1])[0]
+
+            if kind == 'prefix':
+                pattern = name + '#'
+            elif kind == 'substring':
+                pattern = name.strip()
+            else:
+                pattern = re.escape(name) + r'#\d+ ' + rng.choice(CITIES)
+
+            rules.append((id, kind, pattern, 'cat', 'subcat'))
+
+        queries = [make_merchant(rng) for _ in range(nqueries)]
+
+        start = time.perf_counter()
+        ruleset = RuleSet(rules)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        compiled = [ruleset.match(q) for q in queries]
+        indexed = (time.perf_counter() - start) / nqueries
+
+        # Every rule is tried in turn, in the same order of kinds
+        regexes = {id: re.compile(p) for id, kind, p, _, _ in rules if kind == 'regex'}
+
+        def linear(query):
+            for kinds, test in [
+                ('prefix', lambda p: query.startswith(p)),
+                ('substring', lambda p: p in query),
+            ]:
+                found = [(len(p), id) for id, kind, p, _, _ in rules if kind == kinds and test(p)]
+
+                if len(found) > 0:
+                    return max(found)[1]
+
+            for id, regex in regexes.items():
+                if regex.search(query):
+                    return id
+
+            return None
+
+        start = time.perf_counter()
+        for q in queries:
+            linear(q)
+        scan = (time.perf_counter() - start) / nqueries
+
+        results.append({
+            'rules': size,
+            'build_s': build,
+            'scan_query_s': scan,
+            'compiled_query_s': indexed,
+            'speedup': scan / indexed,
+            'matched': sum(x is not None for x in compiled) / nqueries,
+        })
+
+    return results
+
+
+def bench_table(sizes, seed=0):
+    """Compares the memory of the categorized expenses kept as a dictionary
+    of `Expense` keys and float prices with an `ExpenseTable`, and checks that
+    the totals of the table are exact.
+
+    The dates and expenses of each row are new strings, as they are when read
+    from a CSV file, while the categories and subcategories are shared, as
+    they are when they come from the category manager.
+
+    sizes: ([int]) the number of rows to benchmark with.
+    seed:  (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from expense_report import Expense
+    from expense_table import ExpenseTable
+
+    results = list()
+
+    for size in sizes:
+        rng = random.Random(seed)
+
+        merchants = [make_merchant(rng) for _ in range(max(size // 20, 1))]
+        dates = [f'2020-{m:02d}-{d:02d}' for m in range(1, 13) for d in range(1, 29)]
+        cats = WORDS[:8]
+        subcats = WORDS[8:]
+
+        def rows():
+            rng = random.Random(seed)
+
+            for _ in range(size):
+                # Slicing makes a new string, like the csv module does
+                yield (
+                    (rng.choice(dates) + ' ')[:-1],
+                    rng.choice(cats),
+                    rng.choice(subcats),
+                    (rng.choice(merchants) + ' ')[:-1],
+                    rng.randint(1, 20000)
+                )
+
+        exact = dict()
+        for _, cat, _, _, cents in rows():
+            exact[cat] = exact.get(cat, 0) + cents
+
+        def build_dict():
+            expenses = dict()
+            for date, cat, subcat, expense, cents in rows():
+                key = Expense(date, cat, subcat, expense)
+                expenses[key] = expenses.get(key, 0) + cents / 100
+
+            return expenses
+
+        def build_table():
+            table = ExpenseTable()
+            table.extend(rows())
+
+            return table
+
+        # Each is built once to time it, and again to measure its memory,
+        # since tracing every allocation slows them down unevenly
+        start = time.perf_counter()
+        build_dict()
+        dict_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_table()
+        table_build = time.perf_counter() - start
+
+        tracemalloc.start()
+
+        expenses = build_dict()
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+
+        totals = dict()
+        for x, price in expenses.items():
+            totals[x.cat] = totals.get(x.cat, 0) + price
+        dict_wrong = sum(totals[cat] != exact[cat] / 100 for cat in exact.keys())
+
+        nkeys = len(expenses)
+        del expenses, totals
+        tracemalloc.stop()
+        tracemalloc.start()
+
+        table = build_table()
+        indexed_bytes = tracemalloc.get_traced_memory()[0]
+
+        table.freeze()
+        table_bytes = tracemalloc.get_traced_memory()[0]
+
+        totals = table.totals('cat')
+        table_wrong = sum(totals[cat] != exact[cat] / 100 for cat in exact.keys())
+
+        del table, totals
+        tracemalloc.stop()
+
+        results.append({
+            'rows': size,
+            'distinct_keys': nkeys,
+            'dict_build_s': dict_build,
+            'table_build_s': table_build,
+            'dict_bytes_per_key': dict_bytes / nkeys,
+            'indexed_bytes_per_key': indexed_bytes / nkeys,
+            'table_bytes_per_key': table_bytes / nkeys,
+            'dict_wrong_totals': dict_wrong,
+            'table_wrong_totals': table_wrong,
+        })
+
+    return results
+
+
+def bench_sidecar(sizes, nmerchants=500, seed=0):
+    """Compares categorizing a CSV file with loading its categorized expenses
+    saved next to it, and with reusing them in `ExpenseReport.categorize`.
+
+    sizes:      ([int]) the number of rows to benchmark with.
+    nmerchants: (int)   the number of distinct merchants.
+    seed:       (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from expense_report import ExpenseReport
+
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            filename = os.path.join(tmpdir, f'expenses{size}.csv')
+            catfile = os.path.join(tmpdir, f'cats{size}.json')
+            write_expenses(filename, catfile, size, nmerchants, seed)
+
+            def report():
+                return ExpenseReport(
+                    filename,
+                    catfile=catfile,
+                    chartdir=None,
+                    cachedir=os.path.join(tmpdir, 'build_cache')
+                )
+
+            expo = report()
+            start = time.perf_counter()
+            expo.categorize(resolved=dict())
+            csv_time = time.perf_counter() - start
+            expected = expo.totals()
+
+            # Loading alone maps the columns without reading them
+            start = time.perf_counter()
+            expenses, _ = report().load_expenses()
+            load_time = time.perf_counter() - start
+
+            # Reusing also checks that every expense is categorized the same
+            expo = report()
+            start = time.perf_counter()
+            expo.categorize(resolved=dict())
+            reuse_time = time.perf_counter() - start
+
+            assert expo.summary['categorize'] == 'reused'
+            assert expo.totals() == expected
+
+            results.append({
+                'rows': size,
+                'distinct_keys': len(expenses),
+                'csv_s': csv_time,
+                'load_s': load_time,
+                'reuse_s': reuse_time,
+                'speedup': csv_time / reuse_time,
+            })
+
+    return results
+
+
+def bench_store(sizes, nupdates=100, seed=0):
+    """Compares loading and saving the categories as JSON and with SQLite.
+
+    sizes:    ([int]) the number of stored expenses to benchmark with.
+    nupdates: (int)   the number of expenses updated before saving.
+    seed:     (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    from category_store import CategoryStore
+
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            catfile = os.path.join(tmpdir, f'cats{size}.json')
+            dbfile = os.path.join(tmpdir, f'cats{size}.db')
+            write_expenses(os.devnull, catfile, 0, size, seed)
+
+            # The JSON path parses every record and rewrites the whole file
+            start = time.perf_counter()
+            with open(catfile, 'r') as file:
+                expenses = json.load(file)
+
+            cats = dict()
+            for value in expenses.values():
+                subcats = cats.setdefault(value['cat'], list())
+                if value['subcat'] not in subcats:
+                    subcats.append(value['subcat'])
+            json_load = time.perf_counter() - start
+
+            updates = list(expenses.keys())[:nupdates]
+
+            start = time.perf_counter()
+            for expense in updates:
+                expenses[expense]['npurchases'] += 1
+
+            with open(catfile, 'w') as file:
+                json.dump(expenses, file)
+            json_save = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = CategoryStore(dbfile)
+            store.import_json(catfile)
+            store.close()
+            sqlite_import = time.perf_counter() - start
+
+            # The SQLite path only reads and writes the records that are used
+            start = time.perf_counter()
+            store = CategoryStore(dbfile)
+            store.categories()
+            sqlite_load = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for expense in updates:
+                store.add_purchase(expense, 1.0)
+
+            store.commit()
+            sqlite_save = time.perf_counter() - start
+            store.close()
+
+            results.append({
+                'expenses': size,
+                'json_load_s': json_load,
+                'sqlite_load_s': sqlite_load,
+                'json_save_s': json_save,
+                'sqlite_save_s': sqlite_save,
+                'sqlite_import_s': sqlite_import,
+            })
+
+    return results
+
+
+def _write_purchases(dbfile, expenses, npurchases, batch, merge, seed, queue):
+    # Runs in its own process, like concurrent reports sharing a database
+    from category_store import CategoryStore
+
+    rng = random.Random(seed)
+    store = CategoryStore(dbfile)
+
+    counts = dict()
+    for i in range(npurchases):
+        expense = rng.choice(expenses)
+
+        # Multiples of 1/4 are exact in floating point, so the sums of every
+        # process can be compared exactly whatever order they are added in
+        price = rng.randint(1, 40000) / 4
+
+        if merge:
+            store.add_purchase(expense, price)
+        else:
+            # The read, modify and replace of the original cats.json
+            record = store.get(expense)
+            record['npurchases'] += 1
+            record['total'] += price
+            record['mean'] = record['total'] / record['npurchases']
+            store.put(expense, record)
+
+        n, total = counts.get(expense, (0, 0.0))
+        counts[expense] = (n + 1, total + price)
+
+        if (i + 1) % batch == 0:
+            store.commit()
+
+    store.commit()
+    store.close()
+
+    queue.put(counts)
+
+
+def _write_months(filename, periods, queue):
+    # Runs in its own process, like concurrent reports sharing a baseline
+    from baseline import Baseline
+
+    baseline = Baseline(filename)
+
+    for period in periods:
+        baseline.add(period, period, {'cat': 1.0, 'cat/subcat': 1.0})
+        baseline.save()
+
+    queue.put(len(periods))
+
+
+def bench_concurrency(sizes, nprocesses=8, nexpenses=50, batch=100, seed=0):
+    """Checks that purchases written by concurrent processes to the same
+    database are never lost.
+
+    Every process adds purchases of the same few expenses and commits them in
+    batches. The stored number of purchases and total price of each expense
+    must then be the sums over every process. This is measured both with
+    purchases merged into the stored ones, and with records replaced as with
+    the original cats.json, which loses the purchases of other processes.
+
+    The months saved to the same baseline by concurrent processes are checked
+    in the same way, with one month added and saved for every batch of
+    purchases. The check fails if merged purchases or months are lost.
+
+    sizes:      ([int]) the number of purchases each process adds.
+    nprocesses: (int)   the number of processes.
+    nexpenses:  (int)   the number of expenses the purchases are of.
+    batch:      (int)   the number of purchases committed at a time.
+    seed:       (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size and way of writing.
+    """
+    from category_store import CategoryStore
+
+    context = multiprocessing.get_context('spawn')
+    expenses = [f'expense {i}' for i in range(nexpenses)]
+    results = list()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            for merge in [True, False]:
+                dbfile = os.path.join(tmpdir, f'cats{size}{merge}.db')
+
+                store = CategoryStore(dbfile)
+                for expense in expenses:
+                    store.categorize(expense, 'cat', 'subcat')
+                store.commit()
+                store.close()
+
+                queue = context.Queue()
+                processes = [
+                    context.Process(
+                        target=_write_purchases,
+                        args=(dbfile, expenses, size, batch, merge, seed + i, queue)
+                    )
+                    for i in range(nprocesses)
+                ]
+
+                start = time.perf_counter()
+                for process in processes:
+                    process.start()
+
+                expected = {expense: [0, 0.0] for expense in expenses}
+                for _ in processes:
+                    for expense, (n, total) in queue.get().items():
+                        expected[expense][0] += n
+                        expected[expense][1] += total
+
+                for process in processes:
+                    process.join()
+                elapsed = time.perf_counter() - start
+
+                store = CategoryStore(dbfile)
+                lost = 0
+                wrong = 0
+                for expense, (n, total) in expected.items():
+                    record = store.get(expense)
+                    lost += n - record['npurchases']
+                    wrong += record['total'] != total
+                store.close()
+
+                results.append({
+                    'purchases': size * nprocesses,
+                    'processes': nprocesses,
+                    'writes': 'merge' if merge else 'replace',
+                    'elapsed_s': elapsed,
+                    'purchases_per_s': size * nprocesses / elapsed,
+                    'lost_purchases': lost,
+                    'wrong_totals': wrong,
+                    'check': _check(lost == 0 and wrong == 0) if merge else '-',
+                })
+
+            filename = os.path.join(tmpdir, f'baseline{size}.json')
+            nmonths = max(size // batch, 1)
+
+            queue = context.Queue()
+            processes = [
+                context.Process(
+                    target=_write_months,
+                    args=(filename, [f'{i}-{j}' for j in range(nmonths)], queue)
+                )
+                for i in range(nprocesses)
+            ]
+
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+
+            expected = sum(queue.get() for _ in processes)
+
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - start
+
+            with open(filename, 'r') as file:
+                data = json.load(file)
+
+            lost = expected - len(data['periods'])
+            wrong = sum(
+                stat['n'] != expected or stat['mean'] != 1.0
+                for stat in data['stats'].values()
+            ) + (data['n'] != expected)
+
+            results.append({
+                'purchases': expected,
+                'processes': nprocesses,
+                'writes': 'baseline',
+                'elapsed_s': elapsed,
+                'purchases_per_s': expected / elapsed,
+                'lost_purchases': lost,
+                'wrong_totals': wrong,
+                'check': _check(lost == 0 and wrong == 0),
+            })
+
+    return results
+
+
+def _check(passed):
+    return 'passed' if passed else 'failed'
+
+
+def bench_fuzzy(sizes, nqueries, seed=0):
+    """Compares the trigram index to `difflib.get_close_matches`.
+
+    sizes:    ([int]) the number of known expenses to benchmark with.
+    nqueries: (int)   the number of misspelled queries for each size.
+    seed:     (int)   the seed of the random number generator.
+
+    returns: ([dict]) the results for each size.
+    """
+    results = list()
+
+    for size in sizes:
+        rng = random.Random(seed)
+
+        keys = set()
+        while len(keys) < size:
+            keys.add(make_merchant(rng))
+
+        keys = list(keys)
+        queries = [make_typo(rng, rng.choice(keys)) for _ in range(nqueries)]
+
+        start = time.perf_counter()
+        index = TrigramIndex(keys)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [get_close_matches(q, keys) for q in queries]
+        linear = (time.perf_counter() - start) / nqueries
+
+        start = time.perf_counter()
+        actual = [index.get_close_matches(q) for q in queries]
+        indexed = (time.perf_counter() - start) / nqueries
+
+        # How often the best match agrees with difflib
+        agree = sum(
+            e[:1] == a[:1] for e, a in zip(expected, actual)
+        ) / nqueries
+
+        results.append({
+            'keys': size,
+            'build_s': build,
+            'difflib_query_s': linear,
+            'index_query_s': indexed,
+            'speedup': linear / indexed,
+            'top_match_agreement': agree,
+        })
+
+    return results
+
+
+def print_results(results):
+    """Prints a list of results as a table.
+
+    results: ([dict]) the results, each with the same keys.
+    """
+    columns = list(results[0].keys())
+    print(' '.join(f'{c:>20}' for c in columns))
+
+    for result in results:
+        print(' '.join(
+            f'{v:>20.6g}' if isinstance(v, float) else f'{str(v):>20}'
+            for v in result.values()
+        ))
+
+
+def save_results(filename, benchmark, args, results):
+    """Writes a list of results as JSON, so that runs can be compared to find
+    regressions.
+
+    filename:  (str)       the JSON file to write.
+    benchmark: (str)       the name of the benchmark.
+    args:      (dict)      the options the benchmark was run with.
+    results:   ([dict])    the results.
+    """
+    with open(filename, 'w') as file:
+        json.dump({
+            'benchmark': benchmark,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'args': args,
+            'results': results,
+        }, file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the stages of the expense report.'
+    )
+
+    parser.add_argument(
+        'benchmark',
+        choices=[
+            'aggregate', 'charts', 'concurrency', 'fuzzy', 'ingest',
+            'overlap', 'pipeline', 'rows', 'rules', 'server', 'sidecar',
+            'startup', 'store', 'table',
+        ],
+        help='the benchmark to run'
+    )
+
+    parser.add_argument(
+        '--sizes',
+        nargs='+',
+        default=[1000, 10000, 100000],
+        type=int,
+        help='the problem sizes to benchmark with'
+    )
+
+    parser.add_argument(
+        '--queries',
+        default=20,
+        type=int,
+        help='the number of queries for each problem size'
+    )
+
+    parser.add_argument(
+        '--repeats',
+        default=5,
+        type=int,
+        help='the number of times each startup or report is measured',
+        dest='nrepeats'
+    )
+
+    parser.add_argument(
+        '--reports',
+        default=8,
+        type=int,
+        help='the number of reports created by the overlap benchmark',
+        dest='nreports'
+    )
+
+    parser.add_argument(
+        '--jobs',
+        default=1,
+        type=int,
+        help='the number of reports prepared and compiled at a time by the overlap benchmark',
+        dest='jobs'
+    )
+
+    parser.add_argument(
+        '--compile-delay',
+        default=0.5,
+        type=float,
+        help='the time of each pass of the stand-in for pdflatex when it is not installed',
+        dest='delay'
+    )
+
+    parser.add_argument(
+        '--processes',
+        default=8,
+        type=int,
+        help='the number of processes writing at the same time',
+        dest='nprocesses'
+    )
+
+    parser.add_argument(
+        '--chunk-size',
+        default=10000,
+        type=int,
+        help='the number of rows read from a CSV file at a time',
+        dest='chunksize'
+    )
+
+    parser.add_argument(
+        '--max-growth',
+        default=32,
+        type=float,
+        help='the most the ingestion memory may grow over the smallest size, in MiB',
+        dest='max_growth'
+    )
+
+    parser.add_argument(
+        '--merchants',
+        default=500,
+        type=int,
+        help='the number of distinct merchants in generated CSV files',
+        dest='nmerchants'
+    )
+
+    parser.add_argument(
+        '--typos',
+        default=0.05,
+        type=float,
+        help='the share of rows with a misspelled merchant in generated CSV files'
+    )
+
+    parser.add_argument(
+        '--unknown',
+        default=0.02,
+        type=float,
+        help='the share of rows with an unknown merchant in generated CSV files'
+    )
+
+    parser.add_argument(
+        '--blank-dates',
+        default=0.1,
+        type=float,
+        help='the share of rows without a date in generated CSV files',
+        dest='blank_dates'
+    )
+
+    parser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='the seed of the random number generator'
+    )
+
+    parser.add_argument(
+        '--output', '-o',
+        default=None,
+        type=str,
+        help='also writes the results to this JSON file',
+        dest='output'
+    )
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'aggregate':
+        results = bench_aggregate(args.sizes, args.seed)
+    elif args.benchmark == 'charts':
+        results = bench_charts(args.sizes, args.seed)
+    elif args.benchmark == 'concurrency':
+        results = bench_concurrency(args.sizes, args.nprocesses, seed=args.seed)
+    elif args.benchmark == 'fuzzy':
+        results = bench_fuzzy(args.sizes, args.queries, args.seed)
+    elif args.benchmark == 'ingest':
+        results = bench_ingest(
+            args.sizes,
+            args.chunksize,
+            args.nmerchants,
+            args.seed,
+            args.max_growth
+        )
+    elif args.benchmark == 'sidecar':
+        results = bench_sidecar(args.sizes, args.nmerchants, args.seed)
+    elif args.benchmark == 'overlap':
+        results = bench_overlap(
+            args.sizes,
+            args.nreports,
+            args.jobs,
+            args.delay,
+            args.nmerchants,
+            args.seed
+        )
+    elif args.benchmark == 'pipeline':
+        results = bench_pipeline(
+            args.sizes,
+            args.nmerchants,
+            args.typos,
+            args.unknown,
+            args.blank_dates,
+            args.queries,
+            args.seed
+        )
+    elif args.benchmark == 'rows':
+        results = bench_rows(args.sizes, args.seed)
+    elif args.benchmark == 'rules':
+        results = bench_rules(args.sizes, args.queries, args.seed)
+    elif args.benchmark == 'server':
+        results = bench_server(args.sizes, args.nrepeats, args.nmerchants, args.seed)
+    elif args.benchmark == 'startup':
+        results = bench_startup(args.nrepeats)
+    elif args.benchmark == 'table':
+        results = bench_table(args.sizes, args.seed)
+    elif args.benchmark == 'store':
+        results = bench_store(args.sizes, seed=args.seed)
+
+    print_results(results)
+
+    if args.output is not None:
+        save_results(args.output, args.benchmark, vars(args), results)
+
+    failed = [result for result in results if result.get('check') == 'failed']
+    if failed:
+        sys.exit(f'{args.benchmark}: {len(failed)} of {len(results)} checks failed')
+
+
+if __name__ == '__main__':
+    main()
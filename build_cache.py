@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(filename, blocksize=1 << 20):
+    """Hashes the contents of a file.
+
+    filename:  (str) the file.
+    blocksize: (int) the number of bytes read at a time.
+
+    returns: (str) the SHA-256 hash of the file, `None` if it does not exist.
+    """
+    digest = hashlib.sha256()
+
+    try:
+        with open(filename, 'rb') as file:
+            for block in iter(lambda: file.read(blocksize), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+
+    return digest.hexdigest()
+
+
+def hash_entries(entries):
+    """Hashes the category entries used by a report.
+
+    entries: (iterable) the expense, category and subcategory of every expense
+                        used, in any order and with or without duplicates.
+
+    returns: (str) the SHA-256 hash of the entries.
+    """
+    content = json.dumps(sorted(set(tuple(x) for x in entries)))
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def hash_json(data):
+    """Hashes data that can be written as JSON.
+
+    data: (object) the data.
+
+    returns: (str) the SHA-256 hash of the data.
+    """
+    content = json.dumps(data, sort_keys=True)
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class BuildCache:
+    """Records what each expense report was built from and what it produced.
+
+    There is one JSON file in the directory for each CSV file, so reports that
+    are built at the same time never write to the same file. Each record has
+    the structure
+
+    {
+        'source': the CSV file,
+        'hash': hash of the CSV file,
+        'cats': hash of the category entries used,
+        'artifacts': {
+            name: {
+                'path': the produced file,
+                'hash': hash of the produced file,
+                'inputs': the hashes of the CSV file and category entries it
+                          was produced from,
+            }
+        }
+    }
+
+    directory: (str) the directory of the cache.
+    """
+    def __init__(self, directory='.build_cache'):
+        self.directory = directory
+
+    def load(self, source):
+        """Loads the record of a CSV file.
+
+        source: (str) the CSV file.
+
+        returns: (dict) the record, empty if the file was never built.
+        """
+        try:
+            with open(self._path(source), 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return dict()
+
+    def save(self, source, record):
+        """Saves the record of a CSV file.
+
+        source: (str)  the CSV file.
+        record: (dict) the record.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        filename = self._path(source)
+        tmpname = f'{filename}.{os.getpid()}.tmp'
+
+        with open(tmpname, 'w') as file:
+            json.dump(record, file)
+
+        os.replace(tmpname, filename)
+
+    def is_current(self, source, name, inputs):
+        """Checks if an artifact was produced from the same inputs and has not
+        been modified since.
+
+        source: (str) the CSV file.
+        name:   (str) the name of the artifact.
+        inputs: (str) the hashes of the current inputs.
+
+        returns: (bool) whether the artifact can be reused.
+        """
+        artifact = self.load(source).get('artifacts', dict()).get(name)
+
+        if artifact is None or artifact['inputs'] != inputs:
+            return False
+
+        return hash_file(artifact['path']) == artifact['hash']
+
+    def add_artifact(self, source, name, path, inputs):
+        """Records a produced file.
+
+        source: (str) the CSV file.
+        name:   (str) the name of the artifact.
+        path:   (str) the produced file.
+        inputs: (str) the hashes of the inputs it was produced from.
+        """
+        record = self.load(source)
+        record.setdefault('artifacts', dict())[name] = {
+            'path': path,
+            'hash': hash_file(path),
+            'inputs': inputs,
+        }
+
+        self.save(source, record)
+
+    def _path(self, source):
+        key = hashlib.sha256(os.path.abspath(source).encode()).hexdigest()
+
+        return os.path.join(self.directory, f'{key}.json')
@@ -1,19 +1,22 @@
 import json
 import logging
+import os
 
-from difflib import get_close_matches
+from category_store import REJECTED, CategoryStore
+from fuzzy_index import TrigramIndex
+from rules import KINDS, RuleSet
 
 
 logger = logging.getLogger(__name__)
 
 
 class CategoryManager:
-    """A json-based manager for categories.
+    """A SQLite-based manager for categories.
 
     This class is meant to handle all file reading and writing regarding the
     categories, and for querying and adding categories as needed.
 
-    The data is stored in a dictionary with the structure
+    The data is stored in a `CategoryStore`, with the structure
 
     {
         expense: {
@@ -24,70 +27,198 @@ class CategoryManager:
         }
     }
 
-    filename: (str) the name of the file that stores the categories.
+    Changes are written to the database on `commit`, and when the manager is
+    deleted.
+
+    Expenses without an exact match are categorized by the rules of the
+    database before looking for typos, see `RuleSet`. Expenses categorized by
+    a rule are never stored, so variants such as store numbers of the same
+    merchant do not each add an expense.
+
+    When the user chooses a close match for a typo, or none of them, the
+    choice is stored as an alias, so the same typo is resolved without
+    searching or asking again.
+
+    The outcome of every lookup and query is counted in `counters`: 'hits'
+    for exact matches, 'rules' for matches of a rule, 'aliases' for known
+    typos, 'misses' for expenses that none of these found, and 'fuzzy' for
+    searches of close matches.
+
+    If the database does not exist yet but a cats.json file with the same
+    name does, the JSON file is imported once.
+
+    filename: (str) the name of the database that stores the categories. A
+                    JSON filename refers to the database with the same name.
     """
-    def __init__(self, filename='cats.json'):
-        self.filename = filename
-
-        try:
-            logger.info(f'Loading data from {self.filename}')
-            with open(self.filename, 'r') as file:
-                self.expenses = json.load(file)
-        except FileNotFoundError:
-            logger.warn(
+    def __init__(self, filename='cats.db'):
+        root, ext = os.path.splitext(filename)
+        legacy = root + '.json'
+        self.filename = root + '.db' if ext == '.json' else filename
+
+        exists = os.path.exists(self.filename)
+        self.expenses = CategoryStore(self.filename)
+
+        if not exists and os.path.exists(legacy):
+            self.expenses.import_json(legacy)
+        elif not exists:
+            logger.warning(
                 f'{self.filename} could not be found, creating empty data set'
             )
-            self.expenses = dict()
 
         logger.debug('Creating quick lookup table for categories')
 
-        self.cats = dict()
-        for value in self.expenses.values():
-            cat = value['cat']
-            subcat = value['subcat']
+        self.cats = self.expenses.categories()
+
+        logger.debug('Compiling categorization rules')
 
-            if self.cats.get(cat) is None:
-                self.cats[cat] = [subcat,]
-            elif subcat not in self.cats[cat]:
-                self.cats[cat].append(subcat)
+        self.rules = RuleSet(self.expenses.rules())
+        self._add_categories(self.rules.rules.values())
 
         print(self.cats)
 
+        # The index of close matches is only built on the first typo
+        self._index = None
+
+        self.counters = {'hits': 0, 'rules': 0, 'aliases': 0, 'misses': 0, 'fuzzy': 0}
+
     def __del__(self):
-        with open(self.filename, 'w') as file:
-            json.dump(self.expenses, file)
+        self.expenses.close()
+
+    @property
+    def index(self):
+        """The index for close matches of the expenses."""
+        if self._index is None:
+            logger.debug('Creating index for close matches of expenses')
+            self._index = TrigramIndex(self.expenses.keys())
+
+        return self._index
+
+    def commit(self):
+        """Writes every added or updated expense to the database."""
+        self.expenses.commit()
+
+    def import_json(self, filename):
+        """Imports the categories from a cats.json file.
+
+        filename: (str) the JSON file of the categories.
+        """
+        self.expenses.import_json(filename)
+
+        self.cats = self.expenses.categories()
+        self._index = None
+
+    def add_rule(self, kind, pattern, cat, subcat):
+        """Adds a rule that categorizes every expense matching a pattern.
+
+        kind:    (str) 'prefix', 'substring' or 'regex'.
+        pattern: (str) the pattern. Prefixes and substrings are matched
+                       without regard to case, as are regular expressions,
+                       which only need to match part of the expense.
+        cat:     (str) the category of matching expenses.
+        subcat:  (str) the subcategory of matching expenses.
+
+        returns: (int) the id of the rule.
+        """
+        if kind not in KINDS:
+            raise ValueError(f'"{kind}" is not one of {", ".join(KINDS)}')
+
+        cat = cat.lower()
+        subcat = subcat.lower()
+
+        # The rule is compiled with every other rule before it is stored, so
+        # that a stored rule never stops the rules from loading
+        rules = self.expenses.rules()
+        id = max((x[0] for x in rules), default=0) + 1
+        RuleSet([*rules, (id, kind, pattern, cat, subcat)], strict=True)
+
+        id = self.expenses.add_rule(kind, pattern, cat, subcat)
+        logger.info(f'Added {kind} rule {id} "{pattern}" for {cat}/{subcat}')
+
+        self.rules = RuleSet(self.expenses.rules())
+        self._add_categories([{'cat': cat, 'subcat': subcat}])
+
+        return id
+
+    def remove_rule(self, id):
+        """Removes a rule.
+
+        id: (int) the id of the rule.
+
+        returns: (bool) whether the rule existed.
+        """
+        removed = self.expenses.remove_rule(id)
+
+        if removed:
+            self.rules = RuleSet(self.expenses.rules())
 
-    def add(self, expense, price):
+        return removed
+
+    def add(self, expense, price=None, cat=None, subcat=None):
         """Adds an expense to the currently stored categories and subcategories.
 
+        The user is asked for the category and subcategory unless both are
+        given.
+
         expense: (str)   the expense.
-        price:   (float) the price of expense.
+        price:   (float) the price of expense. If not specified, the expense is
+                         stored without any purchases.
+        cat:     (str)   the category of the expense.
+        subcat:  (str)   the subcategory of the expense.
         """
-        print(f'\nCreating new expense "{expense}"')
+        if cat is None or subcat is None:
+            print(f'\nCreating new expense "{expense}"')
 
-        # Determine category
-        cats = list(sorted(self.cats.keys()))
-        cat = self._get_input(expense, 'category', cats)
+            # Determine category
+            cats = list(sorted(self.cats.keys()))
+            cat = self._get_input(expense, 'category', cats)
 
-        # Determine subcategory
-        subcats = list(sorted(self.cats.get(cat, list())))
-        subcat = self._get_input(expense, 'subcategory', subcats)
+            # Determine subcategory
+            subcats = list(sorted(self.cats.get(cat, list())))
+            subcat = self._get_input(expense, 'subcategory', subcats)
 
         # Update categories
         logger.debug('Updating categories and subcategories')
 
-        self.expenses[expense] = {
-            'cat': cat,
-            'subcat': subcat,
-            'mean': price,
-            'npurchases': 1,
-        }
+        self.expenses.categorize(expense, cat, subcat)
+
+        if price is not None:
+            self.expenses.add_purchase(expense, price)
+
+        if self._index is not None:
+            self._index.add(expense)
+
+        self._add_categories([{'cat': cat, 'subcat': subcat}])
+
+    def lookup(self, expense):
+        """Looks for category information of the expense without asking the
+        user.
+
+        expense: (str) the expense.
+
+        return: (dict) the category information of the expense, `None` if there
+                       is no exact match, matching rule or alias.
+        """
+        expense = expense.lower()
+        query = self.expenses.get(expense)
 
-        if cat not in self.cats.keys():
-            self.cats[cat] = list()
+        if query is not None:
+            self.counters['hits'] += 1
+            return query
 
-        if subcat not in self.cats[cat]:
-            self.cats[cat].append(subcat)
+        query = self.rules.categorize(expense)
+
+        if query is not None:
+            self.counters['rules'] += 1
+            return query
+
+        alias = self.expenses.get_alias(expense)
+
+        if alias is not None and alias != REJECTED:
+            query = self.expenses.get(alias)
+
+        self.counters['misses' if query is None else 'aliases'] += 1
+
+        return query
 
     def query(self, expense):
         """Looks for category information of the queried expense.
@@ -101,55 +232,209 @@ class CategoryManager:
                        expense does not exist.
         """
         expense = expense.lower()
-        query = self.expenses.get(expense)
+        query = self.lookup(expense)
 
-        if query is None:
-            logger.debug('No exact match for "{expense}", look for typo')
+        # Typos the user already rejected every close match for are not
+        # searched again
+        if query is None and self.expenses.get_alias(expense) is None:
+            self.counters['fuzzy'] += 1
+            match = self._find_match(expense)
 
-            matches = get_close_matches(expense, self.expenses.keys())
-            nmatches = len(matches)
+            if match is not None:
+                query = self.expenses.get(match)
 
-            if nmatches > 0:
-                print(f'\nNo matches for "{expense}", did you mean:')
+        return query
 
-                for i in range(nmatches):
-                    print(f'{i+1}) {matches[i]}')
+    def resolve(self, expenses, resolutions=None, interactive=True):
+        """Resolves a batch of expenses in a single session.
 
-                print(f'{nmatches+1}) None of the above')
+        Expenses that are already known resolve to themselves. The others are
+        first looked up in the resolutions, and then the user is asked about
+        the remaining ones, one after another, if the session is interactive.
 
-                valid = False
-                while not valid:
-                    choice = input(f'\n[1-{nmatches+1}]: ')
+        The resolutions map an expense either to a known expense, for typos,
+        or to a dictionary with its 'cat' and 'subcat', for new expenses.
 
-                    try:
-                        choice = int(choice)
-                    except:
-                        print(f'\n{choice} is invalid')
-                        continue
+        expenses:    ([str]) the expenses, with or without duplicates.
+        resolutions: (dict)  the resolutions of unknown expenses.
+        interactive: (bool)  whether the user is asked about expenses that
+                             cannot be resolved otherwise.
 
-                    if 1 <= choice <=nmatches + 1:
-                        valid = True
-                    else:
-                        print(f'\n{choice} is invalid')
+        returns: (dict) maps every resolved expense to the known expense it is
+                        categorized as. Expenses that could not be resolved are
+                        left out.
+        """
+        if resolutions is None:
+            resolutions = dict()
 
-                if choice != nmatches + 1:
-                    query = self.expenses.get(f'{matches[choice-1]}')
+        resolved = dict()
+        pending = list()
 
-        return query
+        for expense in dict.fromkeys(x.lower() for x in expenses):
+            resolution = resolutions.get(expense)
+
+            alias = self.expenses.get_alias(expense)
+
+            if expense in self.expenses or self.rules.match(expense) is not None:
+                resolved[expense] = expense
+            elif isinstance(resolution, str):
+                if resolution.lower() in self.expenses:
+                    resolved[expense] = resolution.lower()
+                    self.expenses.put_alias(expense, resolution.lower())
+                else:
+                    logger.error(
+                        f'"{expense}" resolves to "{resolution}", which is not a known expense'
+                    )
+                    pending.append(expense)
+            elif isinstance(resolution, dict):
+                self.add(
+                    expense,
+                    cat=resolution['cat'].lower(),
+                    subcat=resolution['subcat'].lower()
+                )
+                resolved[expense] = expense
+            elif alias is not None and alias in self.expenses:
+                resolved[expense] = alias
+            else:
+                pending.append(expense)
+
+        logger.info(
+            f'Resolved {len(resolved)} expenses, {len(pending)} remaining'
+        )
+
+        if interactive and len(pending) > 0:
+            print(f'\n{len(pending)} expenses need to be categorized')
+
+            for expense in pending:
+                if self.expenses.get_alias(expense) == REJECTED:
+                    match = None
+                else:
+                    match = self._find_match(expense)
+
+                if match is None:
+                    self.add(expense)
+                    match = expense
+
+                resolved[expense] = match
+
+        return resolved
 
     def update(self, expense, price):
         """Updates the category information of the expense.
 
-        The mean price and number of purchases is updated for the expense.
+        The purchase is added to the purchases of the expense, from which its
+        mean price and number of purchases are computed. The purchases of a
+        typo are added to the known expense it is an alias of.
 
         expense: (str)   the expense.
         price:   (float) the price of the expense.
         """
-        m = self.expenses[expense]['mean']
-        N = self.expenses[expense]['npurchases']
+        if self.expenses.get(expense) is None:
+            expense = self.expenses.get_alias(expense)
+
+        # Expenses categorized by a rule are not stored
+        if expense is None or expense == REJECTED or self.expenses.get(expense) is None:
+            return
+
+        self.expenses.add_purchase(expense, price)
+
+    def _add_categories(self, records):
+        """Adds the categories and subcategories of records to the lookup
+        table of categories.
+
+        records: (iterable) the records, each with a 'cat' and 'subcat'.
+        """
+        for record in records:
+            subcats = self.cats.setdefault(record['cat'], list())
+
+            if record['subcat'] not in subcats:
+                subcats.append(record['subcat'])
+
+    def aliases(self):
+        """Lists every stored alias.
+
+        returns: ([tuple]) each alias and the expense it stands for, or
+                           `REJECTED` if the user rejected every close match.
+        """
+        return list(self.expenses.all_aliases())
+
+    def prune_aliases(self, rejections=False):
+        """Removes the aliases that are no longer needed or no longer valid.
+
+        These are the aliases that are now known expenses or match a rule,
+        and the ones that stand for an expense that is no longer known.
+
+        rejections: (bool) whether every rejection is removed as well, so
+                           that those typos are searched again.
+
+        returns: (int) the number of removed aliases.
+        """
+        stale = list()
+
+        for alias, expense in self.aliases():
+            if expense == REJECTED:
+                obsolete = rejections
+            else:
+                obsolete = expense not in self.expenses
+
+            if (
+                obsolete
+                or alias in self.expenses
+                or self.rules.match(alias) is not None
+            ):
+                stale.append(alias)
+
+        self.expenses.remove_aliases(stale)
+        logger.info(f'Removed {len(stale)} aliases')
+
+        return len(stale)
 
-        self.expenses[expense]['mean'] = (N * m + price) / (N + 1)
-        self.expenses[expense]['npurchases'] = N + 1
+    def _find_match(self, expense):
+        """Asks the user if the expense is a typo of a known expense.
+
+        The choice is stored as an alias of the expense, unless there are no
+        close matches.
+
+        expense: (str) the expense.
+
+        return: (str) the known expense chosen by the user, `None` if there are
+                      no close matches or none of them were chosen.
+        """
+        logger.debug(f'No exact match for "{expense}", look for typo')
+
+        matches = self.index.get_close_matches(expense)
+        nmatches = len(matches)
+
+        if nmatches > 0:
+            print(f'\nNo matches for "{expense}", did you mean:')
+
+            for i in range(nmatches):
+                print(f'{i+1}) {matches[i]}')
+
+            print(f'{nmatches+1}) None of the above')
+
+            valid = False
+            while not valid:
+                choice = input(f'\n[1-{nmatches+1}]: ')
+
+                try:
+                    choice = int(choice)
+                except:
+                    print(f'\n{choice} is invalid')
+                    continue
+
+                if 1 <= choice <=nmatches + 1:
+                    valid = True
+                else:
+                    print(f'\n{choice} is invalid')
+
+            if choice != nmatches + 1:
+                self.expenses.put_alias(expense, matches[choice-1])
+                return matches[choice-1]
+
+            self.expenses.put_alias(expense, REJECTED)
+
+        return None
 
     def _get_input(self, expense, ntype, choices=list()):
         """Asks the user to provide a category and subcategory for the expense.
@@ -210,3 +495,20 @@ class CategoryManager:
 
         return choice
 
+
+def load_resolutions(filename):
+    """Loads the resolutions of unknown expenses for `CategoryManager.resolve`.
+
+    The file is a JSON object that maps each expense either to a known expense
+    or to an object with its 'cat' and 'subcat'.
+
+    filename: (str) the JSON file of the resolutions.
+
+    returns: (dict) the resolutions, with lowercase expenses.
+    """
+    logger.info(f'Loading resolutions from {filename}')
+
+    with open(filename, 'r') as file:
+        resolutions = json.load(file)
+
+    return {key.lower(): value for key, value in resolutions.items()}
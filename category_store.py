@@ -0,0 +1,455 @@
+import json
+import logging
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+# The expense of an alias that the user rejected every close match for
+REJECTED = ''
+
+# The fields of a record, in the order of the columns of the database
+RECORD = ['cat', 'subcat', 'mean', 'npurchases', 'total', 'sumsq']
+
+
+class CategoryStore:
+    """A SQLite store of the categories of expenses.
+
+    Only the records that are used are read from the database, and only the
+    records that were added or updated are written back on `commit`. Each
+    commit is a single transaction, so the database is never left half
+    written if the process crashes.
+
+    Several processes can use the same database at the same time. Each commit
+    takes the write lock of the database for its whole transaction, waiting
+    for other writers if needed. The purchases of an expense are kept as the
+    count, sum and sum of squares of the prices, and a commit only adds the
+    purchases made since the last commit to the stored ones. That way the
+    purchases of concurrent processes combine exactly instead of overwriting
+    each other. The category of an expense is replaced by the last writer.
+
+    The rules that categorize expenses by pattern, see `RuleSet`, are stored
+    in the same database, and are written as soon as they are added.
+
+    So are the aliases that map a misspelled expense to the known expense the
+    user chose for it, or to `REJECTED` if the user chose none of the close
+    matches. Like records, aliases are read when used and written on
+    `commit`.
+
+    Records have the same structure as the values of the original cats.json,
+    with the sums that the mean is computed from
+
+    {
+        'cat': category,
+        'subcat': subcategory,
+        'mean': average price,
+        'npurchases': number of purchases,
+        'total': sum of the prices,
+        'sumsq': sum of the squared prices,
+    }
+
+    filename: (str)   the SQLite database.
+    timeout:  (float) how long to wait for other writers, in seconds.
+    """
+    def __init__(self, filename='cats.db', timeout=60.0):
+        self.filename = filename
+
+        logger.info(f'Opening {self.filename}')
+
+        # Every transaction that writes takes the write lock when it begins,
+        # so concurrent commits queue up instead of failing halfway
+        self.conn = sqlite3.connect(
+            filename,
+            timeout=timeout,
+            isolation_level='IMMEDIATE',
+            check_same_thread=False
+        )
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS expenses (
+                expense TEXT PRIMARY KEY,
+                cat TEXT NOT NULL,
+                subcat TEXT NOT NULL,
+                mean REAL NOT NULL,
+                npurchases INTEGER NOT NULL,
+                total REAL NOT NULL DEFAULT 0,
+                sumsq REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS expenses_cat ON expenses (cat, subcat)
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rules (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                pattern TEXT NOT NULL,
+                cat TEXT NOT NULL,
+                subcat TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT PRIMARY KEY,
+                expense TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self._migrate()
+
+        # Records that were read, the ones that are replaced, the new
+        # categories, and the purchases made since the last commit
+        self.records = dict()
+        self.dirty = set()
+        self.categorized = set()
+        self.purchases = dict()
+
+        # The same for aliases, where unknown aliases are kept as `None`
+        self.aliases = dict()
+        self.dirty_aliases = set()
+
+    def __contains__(self, expense):
+        return self.get(expense) is not None
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]
+
+    def get(self, expense):
+        """Looks up the record of an expense.
+
+        expense: (str) the expense.
+
+        returns: (dict) the record, `None` if the expense is not stored.
+        """
+        record = self.records.get(expense)
+
+        if record is None:
+            row = self.conn.execute(
+                'SELECT cat, subcat, mean, npurchases, total, sumsq FROM expenses WHERE expense = ?',
+                (expense,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            record = dict(zip(RECORD, row))
+            self.records[expense] = record
+
+        return record
+
+    def put(self, expense, record):
+        """Adds or replaces the record of an expense, with its purchases.
+
+        This replaces the purchases that other processes made as well, so it
+        is only meant for imports. The record is only written to the database
+        on the next commit.
+
+        expense: (str)  the expense.
+        record:  (dict) the record. Records without the sums, such as the
+                        ones from cats.json, are taken to have every purchase
+                        at the mean price.
+        """
+        record = dict(record)
+        record.setdefault('total', record['mean'] * record['npurchases'])
+        record.setdefault('sumsq', record['mean'] ** 2 * record['npurchases'])
+
+        self.records[expense] = record
+        self.dirty.add(expense)
+        self.categorized.discard(expense)
+        self.purchases.pop(expense, None)
+
+    def categorize(self, expense, cat, subcat):
+        """Sets the category of an expense, adding it without any purchases
+        if it is not stored yet.
+
+        The category is only written to the database on the next commit.
+
+        expense: (str) the expense.
+        cat:     (str) the category.
+        subcat:  (str) the subcategory.
+        """
+        record = self.get(expense)
+
+        if record is None:
+            record = {
+                'cat': cat,
+                'subcat': subcat,
+                'mean': 0,
+                'npurchases': 0,
+                'total': 0,
+                'sumsq': 0,
+            }
+            self.records[expense] = record
+
+        record['cat'] = cat
+        record['subcat'] = subcat
+
+        if expense not in self.dirty:
+            self.categorized.add(expense)
+
+    def add_purchase(self, expense, price):
+        """Adds a purchase of a stored expense.
+
+        The purchase is only written to the database on the next commit, where
+        it is added to the purchases stored by then.
+
+        expense: (str)   the expense.
+        price:   (float) the price.
+        """
+        record = self.get(expense)
+
+        record['npurchases'] += 1
+        record['total'] += price
+        record['sumsq'] += price ** 2
+        record['mean'] = record['total'] / record['npurchases']
+
+        if expense not in self.dirty:
+            n, total, sumsq = self.purchases.get(expense, (0, 0, 0))
+            self.purchases[expense] = (n + 1, total + price, sumsq + price ** 2)
+
+    def keys(self):
+        """Iterates over every stored expense.
+
+        yields: (str) the expenses.
+        """
+        self.commit()
+
+        for (expense,) in self.conn.execute('SELECT expense FROM expenses'):
+            yield expense
+
+    def categories(self):
+        """Collects the subcategories of every category.
+
+        returns: (dict) maps each category to a list of its subcategories.
+        """
+        self.commit()
+
+        cats = dict()
+        for cat, subcat in self.conn.execute(
+            'SELECT DISTINCT cat, subcat FROM expenses ORDER BY cat, subcat'
+        ):
+            cats.setdefault(cat, list()).append(subcat)
+
+        return cats
+
+    def get_alias(self, alias):
+        """Looks up the expense that an alias stands for.
+
+        alias: (str) the alias.
+
+        returns: (str) the expense, `REJECTED` if the alias was rejected, or
+                       `None` if the alias is not stored.
+        """
+        if alias not in self.aliases.keys():
+            row = self.conn.execute(
+                'SELECT expense FROM aliases WHERE alias = ?',
+                (alias,)
+            ).fetchone()
+
+            self.aliases[alias] = None if row is None else row[0]
+
+        return self.aliases[alias]
+
+    def put_alias(self, alias, expense):
+        """Adds or replaces an alias.
+
+        The alias is only written to the database on the next commit.
+
+        alias:   (str) the alias.
+        expense: (str) the expense it stands for, or `REJECTED`.
+        """
+        self.aliases[alias] = expense
+        self.dirty_aliases.add(alias)
+
+    def remove_aliases(self, aliases):
+        """Removes aliases.
+
+        aliases: ([str]) the aliases.
+        """
+        self.commit()
+
+        with self.conn:
+            self.conn.executemany(
+                'DELETE FROM aliases WHERE alias = ?',
+                ((alias,) for alias in aliases)
+            )
+
+        for alias in aliases:
+            self.aliases[alias] = None
+
+    def all_aliases(self):
+        """Iterates over every stored alias.
+
+        yields: (tuple) each alias and the expense it stands for.
+        """
+        self.commit()
+
+        for alias, expense in self.conn.execute(
+            'SELECT alias, expense FROM aliases ORDER BY alias'
+        ):
+            yield alias, expense
+
+    def rules(self):
+        """Reads every rule, in the order they were added.
+
+        returns: ([tuple]) the id, kind, pattern, category and subcategory of
+                           each rule.
+        """
+        return self.conn.execute(
+            'SELECT id, kind, pattern, cat, subcat FROM rules ORDER BY id'
+        ).fetchall()
+
+    def add_rule(self, kind, pattern, cat, subcat):
+        """Adds a rule.
+
+        kind:    (str) 'prefix', 'substring' or 'regex'.
+        pattern: (str) the pattern.
+        cat:     (str) the category of matching expenses.
+        subcat:  (str) the subcategory of matching expenses.
+
+        returns: (int) the id of the rule.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO rules (kind, pattern, cat, subcat) VALUES (?, ?, ?, ?)',
+                (kind, pattern, cat, subcat)
+            )
+
+        return cursor.lastrowid
+
+    def remove_rule(self, id):
+        """Removes a rule.
+
+        id: (int) the id of the rule.
+
+        returns: (bool) whether the rule existed.
+        """
+        with self.conn:
+            cursor = self.conn.execute('DELETE FROM rules WHERE id = ?', (id,))
+
+        return cursor.rowcount > 0
+
+    def commit(self):
+        """Writes every added or updated record and alias to the database.
+
+        The purchases made since the last commit are added to the stored ones,
+        and the records that were written are read again on their next use, so
+        they include the purchases of other processes.
+        """
+        written = self.dirty | self.categorized | self.purchases.keys()
+
+        if len(written) == 0 and len(self.dirty_aliases) == 0:
+            return
+
+        logger.debug(
+            f'Writing {len(written)} records and {len(self.dirty_aliases)} '
+            f'aliases to {self.filename}'
+        )
+
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO expenses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self._row(expense) for expense in self.dirty)
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO expenses VALUES (?, ?, ?, 0, 0, 0, 0)
+                ON CONFLICT (expense) DO UPDATE
+                SET cat = excluded.cat, subcat = excluded.subcat
+                """,
+                (
+                    (x, self.records[x]['cat'], self.records[x]['subcat'])
+                    for x in self.categorized
+                )
+            )
+            self.conn.executemany(
+                """
+                UPDATE expenses
+                SET npurchases = npurchases + ?1,
+                    total = total + ?2,
+                    sumsq = sumsq + ?3,
+                    mean = (total + ?2) / (npurchases + ?1)
+                WHERE expense = ?4
+                """,
+                ((*x, expense) for expense, x in self.purchases.items())
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO aliases VALUES (?, ?)',
+                ((alias, self.aliases[alias]) for alias in self.dirty_aliases)
+            )
+
+        for expense in written:
+            self.records.pop(expense, None)
+
+        self.dirty = set()
+        self.categorized = set()
+        self.purchases = dict()
+        self.dirty_aliases = set()
+
+    def close(self):
+        """Commits and closes the database."""
+        self.commit()
+        self.conn.close()
+
+    def import_json(self, filename):
+        """Imports the categories from a cats.json file.
+
+        Expenses that are already stored are replaced.
+
+        filename: (str) the JSON file of the categories.
+
+        returns: (int) the number of imported expenses.
+        """
+        logger.info(f'Importing categories from {filename} into {self.filename}')
+
+        with open(filename, 'r') as file:
+            expenses = json.load(file)
+
+        for expense, record in expenses.items():
+            self.put(expense, record)
+
+        self.commit()
+        self.records = dict()
+
+        return len(expenses)
+
+    def _migrate(self):
+        """Adds the sums of the purchases to databases from before they were
+        stored, as if every purchase was at the mean price.
+        """
+        columns = [x[1] for x in self.conn.execute('PRAGMA table_info(expenses)')]
+
+        if 'total' in columns:
+            return
+
+        logger.info(f'Adding the sums of the purchases to {self.filename}')
+
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+
+            # Another process may have migrated the database in the meantime
+            columns = [x[1] for x in self.conn.execute('PRAGMA table_info(expenses)')]
+
+            if 'total' not in columns:
+                self.conn.execute(
+                    'ALTER TABLE expenses ADD COLUMN total REAL NOT NULL DEFAULT 0'
+                )
+                self.conn.execute(
+                    'ALTER TABLE expenses ADD COLUMN sumsq REAL NOT NULL DEFAULT 0'
+                )
+                self.conn.execute(
+                    'UPDATE expenses SET total = mean * npurchases, sumsq = mean * mean * npurchases'
+                )
+
+    def _row(self, expense):
+        record = self.records[expense]
+
+        return (
+            expense,
+            record['cat'],
+            record['subcat'],
+            record['mean'],
+            record['npurchases'],
+            record['total'],
+            record['sumsq'],
+        )
@@ -0,0 +1,257 @@
+import hashlib
+import io
+import json
+import logging
+import os
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+# A page of charts, where each chart is a title and a dictionary of values,
+# drawn as pie charts or as horizontal bar charts
+Sheet = namedtuple(
+    'Sheet',
+    ['name', 'charts', 'nrows', 'ncols', 'figsize', 'kind'],
+    defaults=('pie',)
+)
+
+
+def pie_sheets(overall, category, ncharts=6):
+    """Lays out the pie charts of the report on sheets.
+
+    The first sheet has a single pie chart of the overall expenses, and the
+    pie charts of each category follow on sheets of up to `ncharts`.
+
+    overall:  (dict) the total price of each category.
+    category: (dict) the total price of each subcategory, grouped by category.
+    ncharts:  (int)  the number of category charts on a sheet.
+
+    returns: ([Sheet]) the sheets.
+    """
+    sheets = [Sheet('overall', (('overall', overall),), 1, 1, (6, 6))]
+
+    charts = list(category.items())
+    for i in range(0, len(charts), ncharts):
+        sheets.append(Sheet(
+            f'category{i // ncharts}',
+            tuple(charts[i:i+ncharts]),
+            ncharts // 2,
+            2,
+            (6, 9)
+        ))
+
+    return sheets
+
+
+def comparison_sheet(differences):
+    """Lays out a bar chart of how much each category differs from its
+    average.
+
+    differences: (dict) the difference from the average of each category.
+
+    returns: (Sheet) the sheet.
+    """
+    return Sheet(
+        'comparison',
+        (('difference from average monthly', differences),),
+        1,
+        1,
+        (6, 6),
+        'bar'
+    )
+
+
+def render_sheet(sheet, fmt='png', dpi=300):
+    """Draws a sheet of charts.
+
+    This only uses the object-oriented interface of matplotlib, so sheets can
+    be drawn in separate threads or processes. Matplotlib is only imported
+    once the first sheet is drawn, so runs that never draw charts start
+    quickly.
+
+    sheet: (Sheet) the sheet.
+    fmt:   (str)   the image format.
+    dpi:   (int)   the resolution of the image.
+
+    returns: (bytes) the image.
+    """
+    import matplotlib
+
+    # Charts are only ever written to files, so never start a GUI backend
+    matplotlib.use('Agg')
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    def pformat(pct, total):
+        value = pct / 100.0 * total
+        return f'${value:.2f}\n({pct:.0f}%)'
+
+    logger.debug(f'Drawing sheet "{sheet.name}"')
+
+    fig = Figure(figsize=sheet.figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+
+    axes = fig.subplots(nrows=sheet.nrows, ncols=sheet.ncols, squeeze=False)
+    axes = axes.flatten()
+
+    for ax, (title, values) in zip(axes, sheet.charts):
+        if sheet.kind == 'bar':
+            # Spending above the average is red, below the average is green
+            ax.barh(
+                [label.title() for label in values.keys()],
+                list(values.values()),
+                color=['tab:red' if v > 0 else 'tab:green' for v in values.values()]
+            )
+            ax.axvline(0, color='black', linewidth=0.8)
+            ax.invert_yaxis()
+            ax.set(xlabel='$')
+        else:
+            total = sum(values.values())
+
+            ax.pie(
+                values.values(),
+                labels=values.keys(),
+                autopct=lambda x: pformat(x, total)
+            )
+
+        ax.set(title=f'{title.title()} Expenses')
+
+    if sheet.kind == 'bar':
+        fig.tight_layout()
+
+    # Clear empty plots
+    for ax in axes[len(sheet.charts):]:
+        ax.axis('off')
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt)
+
+    return buffer.getvalue()
+
+
+def render_sheets(sheets, jobs=1, cache=None, fmt='png', dpi=300, reuse=True):
+    """Draws sheets of charts, reusing cached images where possible.
+
+    sheets: ([Sheet])    the sheets.
+    jobs:   (int)        the number of sheets drawn in parallel.
+    cache:  (ChartCache) the cache of drawn sheets. If not specified, every
+                         sheet is drawn.
+    fmt:    (str)        the image format.
+    dpi:    (int)        the resolution of the images.
+    reuse:  (bool)       whether cached images are used. If not, every sheet
+                         is drawn but the cache is still updated.
+
+    returns: (tuple) the image of each sheet, and the number of images that
+                     were reused from the cache.
+    """
+    images = [None for _ in sheets]
+    keys = [None for _ in sheets]
+
+    if cache is not None:
+        for i, sheet in enumerate(sheets):
+            keys[i] = cache.key(sheet, fmt, dpi)
+
+            if reuse:
+                images[i] = cache.get(keys[i])
+
+    missing = [i for i, image in enumerate(images) if image is None]
+    logger.info(
+        f'Drawing {len(missing)} sheets, reusing {len(sheets) - len(missing)}'
+    )
+
+    if jobs > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            drawn = executor.map(
+                render_sheet,
+                [sheets[i] for i in missing],
+                [fmt for _ in missing],
+                [dpi for _ in missing]
+            )
+            drawn = list(drawn)
+    else:
+        drawn = [render_sheet(sheets[i], fmt, dpi) for i in missing]
+
+    for i, image in zip(missing, drawn):
+        images[i] = image
+
+        if cache is not None:
+            cache.put(keys[i], image)
+
+    return images, len(sheets) - len(missing)
+
+
+class ChartCache:
+    """A directory of drawn sheets of charts.
+
+    Each image is stored under a hash of everything that is drawn on its sheet,
+    so a sheet is only drawn again when its values or labels change.
+
+    directory: (str) the directory of the cache.
+    """
+    def __init__(self, directory='.chart_cache'):
+        self.directory = directory
+
+    def key(self, sheet, fmt='png', dpi=300):
+        """Hashes the contents of a sheet.
+
+        sheet: (Sheet) the sheet.
+        fmt:   (str)   the image format.
+        dpi:   (int)   the resolution of the image.
+
+        returns: (str) the hash.
+        """
+        # Prices are rounded to cents so that differences in the order they
+        # were summed in do not change the hash
+        charts = [
+            [title, [[k, round(v, 2)] for k, v in values.items()]]
+            for title, values in sheet.charts
+        ]
+
+        content = json.dumps(
+            [
+                charts,
+                sheet.nrows,
+                sheet.ncols,
+                list(sheet.figsize),
+                sheet.kind,
+                fmt,
+                dpi
+            ]
+        )
+
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key):
+        """Loads a cached image.
+
+        key: (str) the hash of the sheet.
+
+        returns: (bytes) the image, `None` if it is not cached.
+        """
+        try:
+            with open(os.path.join(self.directory, key), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, image):
+        """Stores an image in the cache.
+
+        key:   (str)   the hash of the sheet.
+        image: (bytes) the image.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first, so that concurrent reports never
+        # read a partially written image
+        filename = os.path.join(self.directory, key)
+        tmpname = f'{filename}.{os.getpid()}.tmp'
+
+        with open(tmpname, 'wb') as file:
+            file.write(image)
+
+        os.replace(tmpname, filename)
@@ -1,49 +1,481 @@
 import logging
-import matplotlib.pyplot as plt
-import subprocess
+import os
+import shutil
+import tempfile
 
+from build_cache import BuildCache, hash_entries, hash_file, hash_json
 from category_manager import CategoryManager
-from collections import namedtuple
+from charts import ChartCache
 from csv import DictReader
-from tex_generator import TexGenerator
+from expense_table import Expense, ExpenseTable, to_cents
+from itertools import islice
+from profiler import Profiler
 
 
 logger = logging.getLogger(__name__)
 
+# The category of expenses that could not be resolved in batch mode
+UNCATEGORIZED = {'cat': 'uncategorized', 'subcat': 'uncategorized'}
+
 
 class ExpenseReport:
     """Generates the expense report.
 
-    xfile:   (str) the CSV file containing the expenses.
-    catfile: (str) the JSON file of the categories.
+    The report is created in two steps, so that the categorization can be
+    done with a single shared category manager while the rendering is farmed
+    out to other processes.
+
+    The CSV file is streamed through the categorization in chunks, and only
+    the total price of each distinct expense on each date is kept in an
+    `ExpenseTable`, so the memory used does not grow with the number of rows.
+    The table is saved next to the CSV file, and memory-mapped instead of
+    categorizing the CSV file again for as long as it does not change.
+
+    xfile:     (str)             the CSV file containing the expenses.
+    catfile:   (str)             the database of the categories.
+    catman:    (CategoryManager) an existing category manager to share between
+                                 reports. If not specified, a new one is
+                                 created from `catfile`.
+    chunksize: (int)             the number of rows read from the CSV file at a
+                                 time.
+    jobs:      (int)             the number of chart sheets drawn in parallel.
+    chartdir:  (str)             the directory of the cache of drawn charts. If
+                                 `None`, every chart is drawn again.
+    cachedir:  (str)             the directory of the build cache, which lets
+                                 the stages whose inputs did not change since
+                                 the last run be skipped. If `None`, every
+                                 stage is run.
+    force:     (bool)            whether to run every stage, even if it could
+                                 be skipped.
+    baseline:  (Baseline)        the baseline of monthly spending that the
+                                 report is compared with and then added to.
+                                 If `None`, there is no comparison.
+    profile:   (bool)            whether the time and memory of each stage
+                                 are recorded in the summary.
+    statsdir:  (str)             the directory of the cProfile dumps of each
+                                 stage when profiling. If `None`, cProfile is
+                                 not used.
+    backend:   (str)             how the PDF is written, either 'tex' to
+                                 compile it with pdflatex, or 'pdf' to write
+                                 it directly with matplotlib, which is much
+                                 faster but plainer.
+    chartfmt:  (str)             the format of the charts, either 'pdf' for
+                                 vector charts or 'png'. If `None`, vector
+                                 charts are used with the 'tex' backend, and
+                                 PNG with the 'pdf' backend, which can only
+                                 embed images.
     """
-    def __init__(self, xfile, catfile='cats.json'):
+    def __init__(
+        self,
+        xfile,
+        catfile='cats.db',
+        catman=None,
+        chunksize=10000,
+        jobs=1,
+        chartdir='.chart_cache',
+        cachedir='.build_cache',
+        force=False,
+        baseline=None,
+        profile=False,
+        statsdir=None,
+        backend='tex',
+        chartfmt=None
+    ):
         self.filename = xfile
+        self.chunksize = chunksize
+        self.jobs = jobs
+        self.force = force
+        self.baseline = baseline
+        self.backend = backend
+        self.chartfmt = chartfmt
+
+        # Fail before categorizing if the charts cannot be embedded
+        self._chart_format()
+        self.chartcache = None if chartdir is None else ChartCache(chartdir)
+        self.buildcache = None if cachedir is None else BuildCache(cachedir)
+
+        # Every generated file is named after the CSV file so that reports
+        # created at the same time do not overwrite each other
+        self.prefix = os.path.splitext(xfile)[0]
+
+        self.profiler = Profiler(profile, statsdir, os.path.basename(self.prefix))
 
-        self.catman = CategoryManager(catfile)
+        if catman is None:
+            catman = CategoryManager(catfile)
 
-        self.expenses = list()
+        self.catman = catman
+
+        self.expenses = ExpenseTable()
+        self.aggregation = None
         self.figures = list()
+        self.figdir = None
 
-    def generate_report(self):
-        self._categorize_expenses()
-        self._generate_graphs()
-        self._generate_pdf()
-        self._clean_graphs()
+        # The written document until it is compiled, and the hashes of what
+        # it was written from
+        self.document = None
+        self.inputs = None
 
-    def _categorize_expenses(self):
-        logger.debug(f'Categorizing expenses from {self.filename}')
+        # How the totals of each category and subcategory compare with the
+        # baseline, and the chart of the difference
+        self.comparison = dict()
+        self.comparison_figure = None
+
+        # The hashes of the CSV file and of the category entries it used
+        self.hash = None
+        self.cats = None
+
+        # Whether each stage was reused or rebuilt
+        self.summary = dict()
+
+    def __getstate__(self):
+        # The category manager never leaves the parent process, otherwise
+        # every worker would write its own copy of the categories
+        state = self.__dict__.copy()
+        state['catman'] = None
+        state['baseline'] = None
+
+        return state
+
+    def generate_report(self, backend=None, chartfmt=None):
+        """Categorizes the expenses and creates the charts and the PDF.
+
+        backend:  (str) how the PDF is written, see `ExpenseReport`. If not
+                        specified, the backend of the report is used.
+        chartfmt: (str) the format of the charts, see `ExpenseReport`. If not
+                        specified, the format of the report is used.
+
+        returns: (dict) whether each stage was reused or rebuilt.
+        """
+        if backend is not None:
+            self.backend = backend
+
+        if chartfmt is not None:
+            self.chartfmt = chartfmt
+
+        # Fail before categorizing if the charts cannot be embedded
+        self._chart_format()
+
+        self.categorize()
+
+        return self.render()
+
+    def categorize(self, resolved=None):
+        """Categorizes the expenses.
+
+        resolved: (dict) maps expenses to the known expense they are
+                         categorized as, from `CategoryManager.resolve`. If
+                         specified, the user is never asked for input and
+                         expenses that were not resolved are uncategorized.
+                         Otherwise, the user is asked as soon as an unknown
+                         expense is found.
+        """
+        counters = dict(self.catman.counters)
+
+        with self.profiler.stage('categorize'):
+            if self._reuse_expenses(resolved):
+                logger.info(f'Reusing categorized expenses from {self.filename}')
+                self.summary['categorize'] = 'reused'
+            else:
+                self.hash = hash_file(self.filename)
+                self._categorize_expenses(resolved)
+                self.catman.commit()
+                self.summary['categorize'] = 'rebuilt'
+
+            self.cats = hash_entries(self.expenses.entries())
+
+            if self.summary['categorize'] == 'rebuilt':
+                self._save_expenses()
+
+                if self.buildcache is not None:
+                    self.buildcache.save(self.filename, {
+                        'source': self.filename,
+                        'hash': self.hash,
+                        'cats': self.cats,
+                        'artifacts': dict(),
+                    })
+
+            if self.baseline is not None:
+                self._compare_baseline()
+
+        for name, count in self.catman.counters.items():
+            self.profiler.count(f'query_{name}', count - counters[name])
+
+    def load_expenses(self):
+        """Loads the categorized expenses saved next to the report, if the CSV
+        file has not changed since.
+
+        The columns of the expenses are memory-mapped rather than read, so
+        loading them takes milliseconds however many rows the CSV file has.
+        The CSV file is only hashed if its size or modification time changed.
+
+        returns: (tuple) the `ExpenseTable` of the expenses, and the record of
+                         the CSV file they were categorized from
+
+                         {
+                             'source': the CSV file,
+                             'period': the name of the period,
+                             'hash': hash of the CSV file,
+                             'size': size of the CSV file,
+                             'mtime': modification time of the CSV file in
+                                      nanoseconds,
+                         }
+
+                         `None` if there are no current expenses.
+        """
+        try:
+            expenses, record = ExpenseTable.load(self.prefix + '.expenses')
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logger.warning(f'Ignoring the saved expenses of {self.filename}: {e}')
+            return None
+
+        stat = os.stat(self.filename)
+        if (record['size'], record['mtime']) == (stat.st_size, stat.st_mtime_ns):
+            return expenses, record
+
+        if record['hash'] == hash_file(self.filename):
+            return expenses, record
+
+        return None
+
+    def _save_expenses(self):
+        """Saves the categorized expenses next to the report as NumPy arrays,
+        so that later runs, and reports over several periods, do not need to
+        read and categorize the CSV file again.
+        """
+        stat = os.stat(self.filename)
+
+        self.expenses.save(self.prefix + '.expenses', {
+            'source': self.filename,
+            'period': os.path.basename(self.prefix),
+            'hash': self.hash,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+        })
+
+    def _compare_baseline(self):
+        """Compares the totals of each category and subcategory with the
+        baseline of the other months, and then adds them to the baseline.
+        """
+        totals = self.totals()
+
+        period = os.path.abspath(self.filename)
+        self.comparison = self.baseline.compare(period, totals)
+
+        if self.baseline.add(period, f'{self.hash}:{self.cats}', totals):
+            logger.info(f'Adding {self.filename} to the baseline')
+            self.baseline.save()
+
+    def totals(self):
+        """Sums the categorized expenses by category and by subcategory.
+
+        returns: (dict) maps the key of each category and subcategory to its
+                        total price, where the key of a category is its name
+                        and the key of a subcategory is the category and
+                        subcategory separated by a slash.
+        """
+        totals = self.expenses.totals('cat')
+
+        for (cat, subcat), price in self.expenses.totals('cat', 'subcat').items():
+            totals[f'{cat}/{subcat}'] = price
+
+        return totals
+
+    def unresolved_expenses(self):
+        """Finds the distinct expenses that are not known yet.
+
+        This is the first step of batch categorization, where the unknown
+        expenses of every report are resolved at once before categorizing.
+        If the categorized expenses saved next to the report are current, only
+        their distinct expenses are looked up, without reading the CSV file.
+
+        returns: ([str]) the unknown expenses, in order of appearance.
+        """
+        loaded = self.load_expenses()
+
+        if loaded is None:
+            expenses = (
+                expense
+                for chunk in self._read_expenses()
+                for _, expense, _ in chunk
+            )
+        else:
+            expenses = loaded[0].labels['expense']
+
+        unresolved = dict()
+
+        for expense in expenses:
+            if self.catman.lookup(expense) is None:
+                unresolved[expense] = None
+
+        return list(unresolved.keys())
 
-        Expense = namedtuple(
-            'Expense',
-            ['date', 'cat', 'subcat', 'expense', 'price']
+    def render(self):
+        """Creates the charts and the PDF from the categorized expenses.
+
+        This does not need the category manager, and can be run in a separate
+        process.
+
+        returns: (dict) whether each stage was reused or rebuilt.
+        """
+        if self.prepare():
+            self.finish(*self.compile())
+
+        return self.summarize()
+
+    def prepare(self):
+        """Creates the charts and writes the document, unless the PDF is
+        current. This is the part of `render` that can be run in a separate
+        process from `compile` and `finish`.
+
+        returns: (bool) whether the document was written and needs `compile`
+                        and `finish`.
+        """
+        self.inputs = (
+            f'{self.hash}:{self.cats}:{hash_json(self.comparison)}'
+            f':{self.backend}:{self._chart_format()}'
         )
+        pdfname = self.prefix + '.pdf'
 
-        date = ""
+        if (
+            not self.force
+            and self.buildcache is not None
+            and self.buildcache.is_current(self.filename, 'pdf', self.inputs)
+        ):
+            logger.info(f'Reusing {pdfname}')
+            self.summary['charts'] = 'reused'
+            self.summary['pdf'] = 'reused'
+
+            return False
+
+        # NumPy, matplotlib and the TeX generator are only imported by the
+        # stages that use them, so categorizing alone starts quickly
+        from aggregation import Aggregation
+
+        with self.profiler.stage('aggregate'):
+            self.aggregation = Aggregation.from_table(self.expenses)
+
+        with self.profiler.stage('charts'):
+            self._generate_graphs()
+
+        self.document = self._generate_document()
+
+        return True
+
+    def compile(self):
+        """Compiles the document written by `prepare`.
+
+        returns: (tuple) whether the PDF was created, and how long it took in
+                         seconds.
+        """
+        if self.backend == 'pdf':
+            return self.document.compile()
+
+        with self.profiler.stage('compile'):
+            return self.document.compile()
+
+    async def compile_async(self):
+        """Compiles the document written by `prepare` like `compile`, without
+        blocking the event loop. The compilation is not profiled, since other
+        stages run at the same time.
+
+        returns: (tuple) whether the PDF was created, and how long it took in
+                         seconds.
+        """
+        return await self.document.compile_async()
+
+    def finish(self, compiled, elapsed):
+        """Removes the charts and records the PDF once it is compiled.
+
+        compiled: (bool)  whether the PDF was created.
+        elapsed:  (float) how long it took in seconds.
+        """
+        self._clean_graphs()
+        self.document = None
+
+        self.summary['pdf'] = 'rebuilt' if compiled else 'failed'
+        self.summary['compile_s'] = elapsed
+
+        if compiled and self.buildcache is not None:
+            self.buildcache.add_artifact(
+                self.filename,
+                'pdf',
+                self.prefix + '.pdf',
+                self.inputs
+            )
+
+    def summarize(self):
+        """Collects the summary of the report, with its profile if profiling.
+
+        returns: (dict) whether each stage was reused or rebuilt.
+        """
+        if self.profiler.enabled:
+            self.summary['profile'] = self.profiler.results()
+
+        return self.summary
+
+    def _reuse_expenses(self, resolved=None):
+        """Loads the categorized expenses saved next to the report, if the CSV
+        file has not changed and its expenses are still categorized the same
+        way.
+
+        resolved: (dict) see `categorize`.
+
+        returns: (bool) whether the categorized expenses were reused.
+        """
+        if self.force or self.buildcache is None:
+            return False
+
+        loaded = self.load_expenses()
+
+        if loaded is None:
+            return False
+
+        expenses, record = loaded
+
+        for expense, cat, subcat in expenses.entries():
+            if resolved is None:
+                query = self.catman.lookup(expense)
+            else:
+                query = self.catman.lookup(resolved.get(expense, expense))
+
+            if query is None:
+                query = UNCATEGORIZED
+
+            if (query['cat'], query['subcat']) != (cat, subcat):
+                logger.debug(f'The category of "{expense}" has changed')
+                return False
+
+        self.expenses = expenses
+        self.hash = record['hash']
+
+        return True
+
+    def _read_rows(self):
+        """Reads the rows of the CSV file in chunks.
+
+        yields: ([dict]) up to `chunksize` rows at a time.
+        """
         with open(self.filename, 'r') as file:
             reader = DictReader(file)
 
-            for row in reader:
+            chunk = list(islice(reader, self.chunksize))
+            while len(chunk) > 0:
+                yield chunk
+
+                chunk = list(islice(reader, self.chunksize))
+
+    def _read_expenses(self):
+        """Reads the expenses from the CSV file in chunks.
+
+        yields: ([tuple]) the date, expense and price of each row in a chunk.
+        """
+        date = ""
+        for rows in self._read_rows():
+            chunk = list()
+
+            for row in rows:
                 expense = row['Expense'].lower()
                 price = float(row['Price'])
 
@@ -51,177 +483,187 @@ class ExpenseReport:
                 if row['Date'].strip() != "":
                     date = row['Date']
 
-                query = self.catman.query(expense)
+                chunk.append((date, expense, price))
+
+            yield chunk
+
+    def _categorize_chunks(self, chunks, resolved=None, uncategorized=None):
+        """Categorizes the expenses chunk by chunk.
 
-                if query is None:
-                    self.catman.add(expense, price)
+        chunks:        (iterable) chunks of the date, expense and price of each
+                                  row.
+        resolved:      (dict)     see `categorize`.
+        uncategorized: (set)      collects the expenses that were not resolved.
+
+        yields: ([tuple]) the `Expense` key and price of each row in a chunk.
+        """
+        for rows in chunks:
+            chunk = list()
+
+            self.profiler.count('rows', len(rows))
+
+            for date, expense, price in rows:
+                if resolved is None:
                     query = self.catman.query(expense)
+
+                    if query is None:
+                        self.catman.add(expense, price)
+                        query = self.catman.query(expense)
+                    else:
+                        self.catman.update(expense, price)
                 else:
-                    self.catman.update(expense, price)
+                    known = resolved.get(expense, expense)
+                    query = self.catman.lookup(known)
+
+                    if query is None:
+                        uncategorized.add(expense)
+                        query = UNCATEGORIZED
+                    else:
+                        self.catman.update(known, price)
+
+                key = Expense(date, query['cat'], query['subcat'], expense)
+                chunk.append((key, price))
 
-                self.expenses.append(Expense(
-                    date=date,
-                    cat=query['cat'],
-                    subcat=query['subcat'],
-                    expense=expense,
-                    price=price
-                ))
+            yield chunk
+
+    def _categorize_expenses(self, resolved=None):
+        logger.debug(f'Categorizing expenses from {self.filename}')
+
+        uncategorized = set()
+        chunks = self._categorize_chunks(
+            self._read_expenses(),
+            resolved,
+            uncategorized
+        )
+
+        # Aggregate the prices of each distinct expense
+        for chunk in chunks:
+            self.expenses.extend((*key, to_cents(price)) for key, price in chunk)
+
+        self.expenses.freeze()
+
+        if len(uncategorized) > 0:
+            logger.warning(
+                f'{len(uncategorized)} expenses in {self.filename} could not be resolved: '
+                + ', '.join(sorted(uncategorized))
+            )
 
         logger.info(f'Successfully categorized expenses from {self.filename}')
 
     def _generate_graphs(self):
-        logger.debug('Creating pie charts for overall and categorical expenses')
-
-        # Organize data for pie charts
-        overall = dict()
-        category = dict()
+        from charts import comparison_sheet, pie_sheets, render_sheets
 
-        for x in self.expenses:
-            # Add expense to overall categories
-            if x.cat not in overall.keys():
-                overall[x.cat] = 0
+        logger.debug('Creating pie charts for overall and categorical expenses')
 
-            overall[x.cat] += x.price
+        sheets = pie_sheets(self.aggregation.overall, self.aggregation.category)
+
+        if len(self.comparison) > 0:
+            sheets.append(comparison_sheet({
+                key: x['difference'] for key, x in self.comparison.items()
+                if '/' not in key
+            }))
+
+        fmt = self._chart_format()
+        images, nreused = render_sheets(
+            sheets,
+            self.jobs,
+            self.chartcache,
+            fmt=fmt,
+            reuse=not self.force
+        )
 
-            # Add expense to subcategories
-            if x.cat not in category.keys():
-                category[x.cat] = dict()
+        self.summary['charts'] = f'{len(sheets) - nreused}/{len(sheets)} rebuilt'
+        self.profiler.count('charts_rendered', len(sheets) - nreused)
+        self.profiler.count('charts_reused', nreused)
 
-            if x.subcat not in category[x.cat].keys():
-                category[x.cat][x.subcat] = 0
+        # The charts only live in a private directory until the PDF is made
+        self.figdir = tempfile.mkdtemp(prefix='expense_report_')
 
-            category[x.cat][x.subcat] += x.price
+        for sheet, image in zip(sheets, images):
+            filename = os.path.join(self.figdir, f'{sheet.name}.{fmt}')
 
-        overall = {'overall': overall}
+            with open(filename, 'wb') as file:
+                file.write(image)
 
-        self._generate_pie_chart(overall)
-        self._generate_pie_chart(category)
+            if sheet.kind == 'bar':
+                self.comparison_figure = filename
+            else:
+                self.figures.append(filename)
 
         logger.info('Successfully created all pie charts')
 
-    def _generate_pie_chart(self, data):
-        def pformat(pct, total):
-            value = pct / 100.0 * total
-            return f'${value:.2f}\n({pct:.0f}%)'
+    def _chart_format(self):
+        """Chooses the format of the charts for the backend.
 
-        if len(data) == 1:
-            logger.debug('Creating single pie chart')
+        returns: (str) the format.
+        """
+        if self.chartfmt is None:
+            return 'png' if self.backend == 'pdf' else 'pdf'
 
-            # Clear previous plot
-            plt.clf()
-            plt.cla()
+        if self.backend == 'pdf' and self.chartfmt != 'png':
+            raise ValueError(
+                f'The pdf backend can only embed png charts, not {self.chartfmt}'
+            )
 
-            fig, ax = plt.subplots(nrows=1, ncols=1, dpi=300, figsize=(6, 6))
+        return self.chartfmt
 
-            for title, cats in data.items():
-                # Create pie chart
-                ax.pie(
-                    cats.values(),
-                    labels=cats.keys(),
-                    autopct=lambda x: pformat(x, sum(cats.values()))
-                )
-                ax.set(title=f'{title.title()} Expenses')
+    def _generate_document(self):
+        """Writes the document with the generator of the backend.
 
-                # Keep track of created figures
-                filename = f'{title.replace(" ", "_")}.png'
-                plt.savefig(filename)
-                self.figures.append(filename)
-        else:
-            logger.debug('Creating sheet of pie charts')
-
-            # Clear previous plot
-            plt.clf()
-            plt.cla()
-            fig, ax = plt.subplots(nrows=3, ncols=2, dpi=300, figsize=(6, 9))
-            for indx, (cat, subcats) in enumerate(data.items()):
-                row = (indx % 6) // 2
-                col = indx % 2
-
-                # Create pie chart
-                ax[row, col].pie(
-                    subcats.values(),
-                    labels=subcats.keys(),
-                    autopct=lambda x: pformat(x, sum(subcats.values()))
-                )
-                ax[row, col].set(title=f'{cat.title()} Expenses')
-
-                # Make new plot if all six figures are filled
-                if indx % 6 == 5:
-                    logger.warning('All six pie charts are filled, creating a new sheet')
-
-                    # Keep track of created figures
-                    filename = f'category{indx // 6}.png'
-                    plt.savefig(filename)
-                    self.figures.append(filename)
-
-                    # Clear previous plot
-                    plt.clf()
-                    plt.cla()
-
-                    fig, ax = plt.subplots(nrows=2, ncols=3, dpi=300)
-            else:
-                logger.warning('Clearing empty pie charts')
+        returns: (object) the `TexGenerator` or `PdfGenerator`, after the
+                          document is written.
+        """
+        if self.backend == 'pdf':
+            from pdf_generator import PdfGenerator
 
-                # Clear empty plots
-                for i in range(indx + 1, (indx // 6 + 1) * 6):
-                    row = (i % 6) // 2
-                    col = i % 2
+            # The PDF is written as the document is, so there is no compile
+            with self.profiler.stage('pdf'):
+                return self._write_document(PdfGenerator(self.prefix + '.pdf'))
 
-                    ax[row, col].axis('off')
+        from tex_generator import TexGenerator
 
-                # Save the last figure
-                filename = f'category{indx // 6}.png'
-                plt.savefig(filename)
-                self.figures.append(filename)
-
-    def _generate_pdf(self):
-        texgen = TexGenerator(self.filename[:-4] + '.tex')
-        texgen.add_header()
-        texgen.add_title(self.filename[:-4].replace('_', ' ').title())
+        with self.profiler.stage('tex'):
+            return self._write_document(TexGenerator(self.prefix + '.tex'))
 
-        texgen.add_section('Expense Charts')
+    def _write_document(self, generator):
+        """Writes the report with a `TexGenerator` or a `PdfGenerator`.
 
-        for filename in self.figures:
-            texgen.add_figure(filename)
+        generator: (object) the generator.
 
-        texgen.add_section('Expense Data')
+        returns: (object) the generator, after the document is written.
+        """
+        generator.add_header()
+        generator.add_title(
+            os.path.basename(self.prefix).replace('_', ' ').title()
+        )
 
-        # Reorganize data with date first
-        total = 0
-        data = dict()
-        for x in self.expenses:
-            if x.date not in data.keys():
-                data[x.date] = dict()
+        generator.add_section('Expense Charts')
 
-            if x.cat not in data[x.date].keys():
-                data[x.date][x.cat] = dict()
+        for filename in self.figures:
+            generator.add_figure(filename)
 
-            if x.subcat not in data[x.date][x.cat].keys():
-                data[x.date][x.cat][x.subcat] = dict()
+        if len(self.comparison) > 0:
+            generator.add_section('Comparison With Average Monthly Spending')
+            generator.add_figure(self.comparison_figure)
+            generator.add_comparison(self.comparison)
 
-            if x.expense not in data[x.date][x.cat][x.subcat].keys():
-                data[x.date][x.cat][x.subcat][x.expense] = 0
+        generator.add_section('Expense Data')
 
-            data[x.date][x.cat][x.subcat][x.expense] += x.price
-            total += x.price
+        generator.add_table(self.aggregation.tree, self.aggregation.total)
 
-        texgen.add_table(data, total)
+        generator.add_footer()
 
-        texgen.add_footer()
+        generator.write()
 
-        texgen.write()
-        texgen.compile()
+        return generator
 
     def _clean_graphs(self):
         logger.debug('Removing created graphs')
 
-        for filename in self.figures:
-            rmrf = subprocess.run(['rm', '-rf', filename])
-
-        if rmrf.returncode == 0:
+        if self.figdir is not None:
+            shutil.rmtree(self.figdir, ignore_errors=True)
             logger.info('Successfully removed graphs')
-        else:
-            logger.error('Failed to remove graphs')
 
         self.figures = list()
-
+        self.figdir = None
+        self.comparison_figure = None
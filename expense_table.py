@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+
+from array import array
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
+
+# The key that the prices of categorized expenses are summed under
+Expense = namedtuple('Expense', ['date', 'cat', 'subcat', 'expense'])
+
+
+def to_cents(price):
+    """Converts a price to a whole number of cents.
+
+    price: (float or str) the price.
+
+    returns: (int) the price in cents.
+    """
+    return round(float(price) * 100)
+
+
+class ExpenseTable:
+    """The total price of each distinct categorized expense on each date,
+    stored compactly.
+
+    Each distinct date, category, subcategory and expense is stored once, and
+    each row only holds their codes in 32-bit arrays, along with its total
+    price in cents in a 64-bit array. Prices are whole numbers of cents, so
+    totals never drift however many prices are summed, and are only divided
+    into dollars when they are read.
+
+    While rows are added, an index from the codes of each row to its position
+    finds the row that a price is added to. The index can be dropped with
+    `freeze` once every row is added.
+
+    A table can be saved to a directory of NumPy arrays, one for each column,
+    and loaded again with its columns memory-mapped, so that loading it takes
+    the same time however many rows it has.
+
+    labels:  (dict)  maps 'date', 'cat', 'subcat' and 'expense' to the labels
+                     of their codes, in order of first appearance.
+    columns: (dict)  maps 'date', 'cat', 'subcat' and 'expense' to the codes
+                     of each row.
+    cents:   (array) the total price of each row in cents.
+    """
+    KEYS = ('date', 'cat', 'subcat', 'expense')
+
+    def __init__(self):
+        self.labels = {key: list() for key in self.KEYS}
+        self.codes = {key: dict() for key in self.KEYS}
+        self.columns = {key: array('i') for key in self.KEYS}
+        self.cents = array('q')
+
+        self.index = dict()
+
+    @classmethod
+    def load(cls, directory):
+        """Loads a table saved by `save`, with its columns memory-mapped
+        read-only. Rows can still be added to it, but its columns are copied
+        into memory first.
+
+        directory: (str) the directory of the table.
+
+        returns: (tuple) the table, and the information saved with it.
+
+        raises: (FileNotFoundError) if the table was never saved.
+                (ValueError)        if the columns do not match the labels.
+        """
+        import numpy as np
+
+        with open(os.path.join(directory, 'table.json'), 'r') as file:
+            content = json.load(file)
+
+        table = cls()
+        table.labels = content['labels']
+        table.codes = {
+            key: {label: code for code, label in enumerate(table.labels[key])}
+            for key in cls.KEYS
+        }
+
+        dtypes = dict.fromkeys(cls.KEYS, np.int32)
+        dtypes['cents'] = np.int64
+
+        for key, dtype in dtypes.items():
+            column = np.load(os.path.join(directory, f'{key}.npy'), mmap_mode='r')
+
+            if column.dtype != dtype or column.shape != (content['nrows'],):
+                raise ValueError(f'The {key} column of {directory} is invalid')
+
+            if key == 'cents':
+                table.cents = column
+            else:
+                table.columns[key] = column
+
+        table.index = None
+
+        return table, content['info']
+
+    def save(self, directory, info=None):
+        """Saves the table to a directory, as a NumPy array for each column
+        and a JSON file of the labels.
+
+        Each file is replaced at once, and the labels are written last, so a
+        table is never loaded while its columns are being written.
+
+        directory: (str)  the directory of the table, created if needed.
+        info:      (dict) information saved with the table, such as what it
+                          was made from, which `load` returns with it.
+        """
+        import numpy as np
+
+        os.makedirs(directory, exist_ok=True)
+
+        columns = {
+            key: np.frombuffer(self.columns[key], dtype=np.int32)
+            for key in self.KEYS
+        }
+        columns['cents'] = np.frombuffer(self.cents, dtype=np.int64)
+
+        for key, column in columns.items():
+            filename = os.path.join(directory, f'{key}.npy')
+            tmpname = f'{filename}.{os.getpid()}.tmp'
+
+            with open(tmpname, 'wb') as file:
+                np.save(file, column)
+
+            os.replace(tmpname, filename)
+
+        filename = os.path.join(directory, 'table.json')
+        tmpname = f'{filename}.{os.getpid()}.tmp'
+
+        with open(tmpname, 'w') as file:
+            json.dump({'nrows': len(self), 'labels': self.labels, 'info': info}, file)
+
+        os.replace(tmpname, filename)
+
+    def __len__(self):
+        return len(self.cents)
+
+    def add(self, date, cat, subcat, expense, cents):
+        """Adds a price to the row of an expense, creating the row if needed.
+
+        date:    (str) the date.
+        cat:     (str) the category.
+        subcat:  (str) the subcategory.
+        expense: (str) the expense.
+        cents:   (int) the price in cents.
+        """
+        self.extend([(date, cat, subcat, expense, cents)])
+
+    def extend(self, rows):
+        """Adds the prices of several expenses, like `add` but much faster
+        for many rows.
+
+        rows: (iterable) the date, category, subcategory, expense and price
+                         in cents of each row.
+        """
+        if self.index is None:
+            self._reindex()
+
+        # The lookups are bound once for every row, which makes adding a row
+        # about as fast as adding to a dictionary of `Expense` keys
+        index = self.index
+        encode = self._encode
+        dates, cats, subcats, expenses = (self.codes[key] for key in self.KEYS)
+        columns = [self.columns[key] for key in self.KEYS]
+        prices = self.cents
+
+        for date, cat, subcat, expense, cents in rows:
+            d = dates.get(date)
+            if d is None:
+                d = encode('date', date)
+
+            c = cats.get(cat)
+            if c is None:
+                c = encode('cat', cat)
+
+            s = subcats.get(subcat)
+            if s is None:
+                s = encode('subcat', subcat)
+
+            e = expenses.get(expense)
+            if e is None:
+                e = encode('expense', expense)
+
+            # The codes of a row are packed into a single integer, which takes
+            # much less memory as a key than a tuple
+            packed = d << 96 | c << 64 | s << 32 | e
+            row = index.get(packed)
+
+            if row is None:
+                index[packed] = len(prices)
+
+                columns[0].append(d)
+                columns[1].append(c)
+                columns[2].append(s)
+                columns[3].append(e)
+
+                prices.append(cents)
+            else:
+                prices[row] += cents
+
+    def freeze(self):
+        """Drops the index of the rows. Prices can still be added afterwards,
+        but the index is built again first.
+        """
+        self.index = None
+
+    def keys(self):
+        """Yields the `Expense` key of each row."""
+        labels = [self.labels[key] for key in self.KEYS]
+        columns = [memoryview(self.columns[key]) for key in self.KEYS]
+
+        for codes in zip(*columns):
+            yield Expense(*(x[code] for x, code in zip(labels, codes)))
+
+    def items(self):
+        """Yields the `Expense` key of each row and its total price in cents."""
+        return zip(self.keys(), memoryview(self.cents))
+
+    def entries(self):
+        """Finds the distinct category and subcategory of each expense.
+
+        returns: ([tuple]) the distinct expense, category and subcategory of
+                           the rows.
+        """
+        keys = ['expense', 'cat', 'subcat']
+        columns = [memoryview(self.columns[key]) for key in keys]
+        expenses, cats, subcats = (self.labels[key] for key in keys)
+
+        packed = {e << 64 | c << 32 | s for e, c, s in zip(*columns)}
+
+        return [
+            (expenses[x >> 64], cats[x >> 32 & 0xffffffff], subcats[x & 0xffffffff])
+            for x in packed
+        ]
+
+    def total(self):
+        """Sums the price of every row.
+
+        returns: (float) the total price in dollars.
+        """
+        return sum(memoryview(self.cents)) / 100
+
+    def totals(self, *keys):
+        """Sums the prices of the rows sharing the same labels.
+
+        keys: (str) the columns to group by, such as 'cat' and 'subcat'.
+
+        returns: (dict) maps the labels of each group, or the label if there
+                        is a single column, to its total price in dollars.
+        """
+        labels = [self.labels[key] for key in keys]
+        columns = [memoryview(self.columns[key]) for key in keys]
+
+        totals = dict()
+        for *codes, cents in zip(*columns, memoryview(self.cents)):
+            totals[tuple(codes)] = totals.get(tuple(codes), 0) + cents
+
+        return {
+            (
+                labels[0][codes[0]] if len(keys) == 1
+                else tuple(x[code] for x, code in zip(labels, codes))
+            ): cents / 100
+            for codes, cents in totals.items()
+        }
+
+    def _encode(self, key, label):
+        codes = self.codes[key]
+        code = codes.get(label)
+
+        if code is None:
+            code = codes[label] = len(codes)
+            self.labels[key].append(label)
+
+        return code
+
+    def _reindex(self):
+        logger.debug('Indexing the rows of the expense table')
+
+        # Memory-mapped columns are read-only, and are copied before rows are
+        # added to them
+        if not isinstance(self.cents, array):
+            self.columns = {
+                key: array('i', self.columns[key].tobytes()) for key in self.KEYS
+            }
+            self.cents = array('q', self.cents.tobytes())
+
+        self.index = dict()
+
+        columns = [self.columns[key] for key in self.KEYS]
+        for row, codes in enumerate(zip(*columns)):
+            packed = codes[0] << 96 | codes[1] << 64 | codes[2] << 32 | codes[3]
+            self.index[packed] = row
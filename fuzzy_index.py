@@ -0,0 +1,113 @@
+import heapq
+
+from collections import Counter
+from difflib import SequenceMatcher
+
+
+def trigrams(word):
+    """Splits a word into its set of trigrams.
+
+    The word is padded with spaces so that short words and the start of a word
+    still produce trigrams.
+
+    word: (str) the word.
+
+    returns: (set) the trigrams of the word.
+    """
+    padded = f'  {word} '
+
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """An inverted index of trigrams for finding close matches of a word.
+
+    This is a drop-in replacement for `difflib.get_close_matches` that does not
+    compare the word against every possibility. The possibilities sharing the
+    most trigrams with the word are found from the index first, and only those
+    are scored with `difflib.SequenceMatcher`, so the returned matches are
+    ranked and cut off the same way as with `get_close_matches`.
+
+    words:       (iterable) the initial possibilities.
+    n:           (int)      the maximum number of close matches to return.
+    cutoff:      (float)    the minimum similarity score in [0, 1] of a match.
+    ncandidates: (int)      the number of possibilities taken from the index
+                            that are scored for each query.
+    """
+    def __init__(self, words=(), n=3, cutoff=0.6, ncandidates=50):
+        self.n = n
+        self.cutoff = cutoff
+        self.ncandidates = ncandidates
+
+        self.postings = dict()
+        self.grams = dict()
+
+        for word in words:
+            self.add(word)
+
+    def __contains__(self, word):
+        return word in self.grams
+
+    def __len__(self):
+        return len(self.grams)
+
+    def add(self, word):
+        """Adds a word to the index, doing nothing if it already exists.
+
+        word: (str) the word.
+        """
+        if word in self.grams:
+            return
+
+        grams = trigrams(word)
+        self.grams[word] = grams
+
+        for gram in grams:
+            if gram not in self.postings.keys():
+                self.postings[gram] = set()
+
+            self.postings[gram].add(word)
+
+    def get_close_matches(self, word, n=None, cutoff=None):
+        """Finds the best close matches of the word in the index.
+
+        word:   (str)   the word.
+        n:      (int)   the maximum number of close matches to return, defaults
+                        to the one of the index.
+        cutoff: (float) the minimum similarity score of a match, defaults to the
+                        one of the index.
+
+        returns: ([str]) the close matches, with the most similar first.
+        """
+        n = self.n if n is None else n
+        cutoff = self.cutoff if cutoff is None else cutoff
+
+        grams = trigrams(word)
+
+        # Count the shared trigrams of every possibility
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        # Only score the possibilities with the highest Dice coefficient
+        candidates = heapq.nlargest(
+            self.ncandidates,
+            shared.keys(),
+            key=lambda x: 2 * shared[x] / (len(grams) + len(self.grams[x]))
+        )
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(word)
+
+        result = list()
+        for candidate in candidates:
+            matcher.set_seq1(candidate)
+
+            if (
+                matcher.real_quick_ratio() >= cutoff
+                and matcher.quick_ratio() >= cutoff
+                and matcher.ratio() >= cutoff
+            ):
+                result.append((matcher.ratio(), candidate))
+
+        return [x for _, x in heapq.nlargest(n, result)]
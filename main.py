@@ -1,16 +1,61 @@
 import argparse
+import csv
+import json
 import logging
+import os
+import re
+import sys
 
+from baseline import Baseline
+from category_manager import CategoryManager, load_resolutions
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from expense_report import ExpenseReport
+from period_report import PeriodReport
 
 
 def parse_args():
     """Prases command line arguments.
 
-    There are only two attributes for the returned parser.
+    The attributes for the returned parser are
 
-    filenames:    ([str]) a list of filenames.
+    filenames:   ([str]) a list of filenames.
     directories: ([str]) a list of directories.
+    jobs:        (int)   the number of reports, or the chart sheets of a single
+                         report, rendered at the same time.
+    chunksize:   (int)   the number of rows read from a CSV file at a time.
+    batch:       (bool)  whether unknown expenses are resolved in one session.
+    resolutions: (str)   the JSON file of resolutions for unknown expenses.
+    combine:     (str)   the name of a single report over every CSV file.
+    pipeline:    (int)   the number of reports that can wait between two
+                         overlapped stages, `None` to not overlap the stages.
+    force:       (bool)  whether to rebuild every stage of every report.
+    baseline:    (str)   the JSON file of the baseline of monthly spending,
+                         `None` to not use a baseline.
+    backend:     (str)   how the PDFs are written, 'tex' or 'pdf'.
+    chartfmt:    (str)   the format of the charts, 'pdf' or 'png'.
+    profile:     (str)   the JSON file the time and memory of each stage are
+                         written to, `None` to not profile.
+    statsdir:    (str)   the directory of cProfile dumps of each stage.
+    totals:      (str)   the JSON or CSV file the category totals are written
+                         to instead of creating the reports, `None` to create
+                         the reports.
+    catfile:     (str)   the database of the categories.
+    imports:     ([str]) cats.json files to import into the database.
+    add_rules:   ([[str]]) the kind, pattern, category and subcategory of
+                           each rule to add.
+    remove_rules: ([int]) the ids of the rules to remove.
+    list_rules:  (bool)  whether to print the rules.
+    list_aliases: (bool) whether to print the aliases of typos.
+    prune_aliases: (bool) whether to remove aliases that are no longer needed.
+    forget_rejections: (bool) whether to also remove the typos that every
+                              close match was rejected for.
+    serve:       (str)   the Unix socket to serve reports on, `None` to create
+                         the reports in this process.
+    backlog:     (int)   the number of reports the server accepts at a time.
+    server:      (str)   the Unix socket of a running server to send the
+                         reports to, `None` to create them in this process.
+    stop:        (bool)  whether to shut down the server.
+    debug:       (str)   the logging level.
     """
     parser = argparse.ArgumentParser(
         description="""
@@ -37,6 +82,221 @@ def parse_args():
         dest='directories'
     )
 
+    parser.add_argument(
+        '--jobs', '-j',
+        default=1,
+        type=int,
+        help='the number of reports to render in parallel, the categorization is always done one file at a time',
+        dest='jobs'
+    )
+
+    parser.add_argument(
+        '--chunk-size',
+        default=10000,
+        type=int,
+        help='the number of rows read from a CSV file at a time',
+        dest='chunksize'
+    )
+
+    parser.add_argument(
+        '--batch', '-b',
+        action='store_true',
+        help='collects the unknown expenses of every file first and asks about each one only once',
+        dest='batch'
+    )
+
+    parser.add_argument(
+        '--resolutions', '-r',
+        default=None,
+        type=str,
+        help='resolves unknown expenses from a JSON file without asking for input, implies --batch',
+        dest='resolutions'
+    )
+
+    parser.add_argument(
+        '--combine',
+        default=None,
+        type=str,
+        help='creates a single report with this name over every CSV file, such as an annual report, from the summaries saved by earlier reports',
+        dest='combine'
+    )
+
+    parser.add_argument(
+        '--pipeline',
+        nargs='?',
+        default=None,
+        const=2,
+        type=int,
+        help='overlaps the stages of the reports, so that one report compiles while the next ones render their charts and are categorized, with --jobs reports rendered and compiled at the same time and at most this many reports (2 by default) waiting between two stages',
+        dest='pipeline'
+    )
+
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='rebuilds every stage of every report, even if its inputs have not changed',
+        dest='force'
+    )
+
+    parser.add_argument(
+        '--baseline',
+        default='baseline.json',
+        type=str,
+        help='the baseline of monthly spending that each report is compared with and added to, assuming one CSV file per month',
+        dest='baseline'
+    )
+
+    parser.add_argument(
+        '--no-baseline',
+        action='store_const',
+        const=None,
+        help='neither compares the reports with a baseline nor adds them to one',
+        dest='baseline'
+    )
+
+    parser.add_argument(
+        '--backend',
+        default=None,
+        choices=['tex', 'pdf'],
+        type=str,
+        help='"tex" compiles the PDFs with pdflatex, the default, while "pdf" writes plainer PDFs directly, which is much faster and does not need LaTeX, for bulk runs',
+        dest='backend'
+    )
+
+    parser.add_argument(
+        '--chart-format',
+        default=None,
+        choices=['pdf', 'png'],
+        type=str,
+        help='draws the charts as vector "pdf" or as 300 dpi "png" images, by default pdf for the tex backend and png for the pdf backend',
+        dest='chartfmt'
+    )
+
+    parser.add_argument(
+        '--categorize-only',
+        nargs='?',
+        default=None,
+        const='totals.json',
+        type=str,
+        help='only categorizes the expenses and updates the categories, and writes the total of each category to this JSON or CSV file (totals.json by default) instead of creating any charts or PDF',
+        dest='totals'
+    )
+
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        default=None,
+        const='profile.json',
+        type=str,
+        help='records the wall time, CPU time and peak memory of each stage of each report, and writes them to this JSON file (profile.json by default)',
+        dest='profile'
+    )
+
+    parser.add_argument(
+        '--profile-stats',
+        default=None,
+        type=str,
+        help='with --profile, also writes a cProfile dump of each stage of each report to this directory',
+        dest='statsdir'
+    )
+
+    parser.add_argument(
+        '--categories', '-c',
+        default='cats.db',
+        type=str,
+        help='the database of the categories, a cats.json file with the same name is imported if it does not exist yet',
+        dest='catfile'
+    )
+
+    parser.add_argument(
+        '--import-cats',
+        nargs='+',
+        default=list(),
+        type=str,
+        help='imports the categories from cats.json files into the database, replacing existing expenses',
+        dest='imports'
+    )
+
+    parser.add_argument(
+        '--add-rule',
+        nargs=4,
+        action='append',
+        default=list(),
+        type=str,
+        metavar=('KIND', 'PATTERN', 'CATEGORY', 'SUBCATEGORY'),
+        help='adds a rule that categorizes every expense matching a "prefix", "substring" or "regex" pattern, can be given more than once',
+        dest='add_rules'
+    )
+
+    parser.add_argument(
+        '--remove-rule',
+        action='append',
+        default=list(),
+        type=int,
+        metavar='ID',
+        help='removes the rule with this id, can be given more than once',
+        dest='remove_rules'
+    )
+
+    parser.add_argument(
+        '--list-rules',
+        action='store_true',
+        help='prints every rule with its id',
+        dest='list_rules'
+    )
+
+    parser.add_argument(
+        '--list-aliases',
+        action='store_true',
+        help='prints every typo whose close match was chosen or rejected before',
+        dest='list_aliases'
+    )
+
+    parser.add_argument(
+        '--prune-aliases',
+        action='store_true',
+        help='removes the aliases of typos that are now known expenses, match a rule, or stand for an expense that is no longer known',
+        dest='prune_aliases'
+    )
+
+    parser.add_argument(
+        '--forget-rejections',
+        action='store_true',
+        help='with --prune-aliases, also removes the typos that every close match was rejected for, so they are asked about again',
+        dest='forget_rejections'
+    )
+
+    parser.add_argument(
+        '--serve',
+        default=None,
+        type=str,
+        help='keeps running and creates the reports sent to this Unix socket, keeping the categories and matplotlib loaded between reports, with --jobs reports rendered at the same time and unknown expenses resolved from --resolutions',
+        dest='serve'
+    )
+
+    parser.add_argument(
+        '--backlog',
+        default=16,
+        type=int,
+        help='with --serve, the number of reports accepted at a time, including the ones being rendered, clients wait while there are more',
+        dest='backlog'
+    )
+
+    parser.add_argument(
+        '--server',
+        default=None,
+        type=str,
+        help='sends the reports to the server running on this Unix socket instead of creating them in this process',
+        dest='server'
+    )
+
+    parser.add_argument(
+        '--stop-server',
+        action='store_true',
+        help='with --server, shuts down the server once the reports are done',
+        dest='stop'
+    )
+
     parser.add_argument(
         '--debug',
         default='WARNING',
@@ -48,27 +308,365 @@ def parse_args():
     return parser.parse_args()
 
 
+def find_reports(filenames, directories):
+    """Collects every CSV file that an expense report should be created for.
+
+    filenames:   ([str]) a list of CSV files.
+    directories: ([str]) a list of directories to search for CSV files. The
+                         search is not recursive.
+
+    returns: ([str]) the CSV files without duplicates, in the order given.
+    """
+    reports = list(filenames)
+
+    for directory in directories:
+        for filename in sorted(os.listdir(directory)):
+            if filename.lower().endswith('.csv'):
+                reports.append(os.path.join(directory, filename))
+
+    return list(dict.fromkeys(reports))
+
+
 def main():
     # Take command line input
     parser = parse_args()
 
     logging.basicConfig(level=parser.debug.upper())
 
-    # TODO: Annual report
-    # TODO: Compare with average monthly spending
-    for filename in parser.filenames:
-        expo = ExpenseReport(filename)
-        expo.generate_report()
+    filenames = find_reports(parser.filenames, parser.directories)
+
+    # Only the options that were given are sent to a server, which has its
+    # own defaults
+    if parser.server is not None:
+        submit_reports(parser, filenames)
+        return
+
+    if parser.backend is None:
+        parser.backend = 'tex'
+
+    if parser.serve is not None:
+        serve(parser)
+        return
+
+    # Categorization may ask for user input, so it is always done in this
+    # process with a single category manager, while the charts and the PDF
+    # are rendered by the workers
+    catman = CategoryManager(parser.catfile)
+
+    for filename in parser.imports:
+        catman.import_json(filename)
+
+    for id in parser.remove_rules:
+        if not catman.remove_rule(id):
+            logging.warning(f'There is no rule {id} to remove')
+
+    for kind, pattern, cat, subcat in parser.add_rules:
+        try:
+            catman.add_rule(kind, pattern, cat, subcat)
+        except (re.error, ValueError) as e:
+            logging.error(f'Failed to add {kind} rule "{pattern}": {e}')
+            sys.exit(1)
+
+    if parser.list_rules:
+        print_rules(catman.rules)
+
+    if parser.prune_aliases:
+        catman.prune_aliases(parser.forget_rejections)
+
+    if parser.list_aliases:
+        print_aliases(catman.aliases())
+
+    # A single report draws its charts in parallel instead
+    single = len(filenames) == 1 or parser.combine is not None
+
+    # Only reports are compared with the baseline, and only they add to it
+    baseline = None
+    if parser.baseline is not None and parser.totals is None:
+        baseline = Baseline(parser.baseline)
+
+    options = {
+        'catman': catman,
+        'chunksize': parser.chunksize,
+        'jobs': parser.jobs if single else 1,
+        'force': parser.force,
+        'baseline': baseline,
+        'profile': parser.profile is not None,
+        'statsdir': parser.statsdir,
+        'backend': parser.backend,
+        'chartfmt': parser.chartfmt,
+    }
+
+    if parser.combine is not None:
+        reports = [PeriodReport(filenames, parser.combine, **options)]
+    else:
+        reports = [ExpenseReport(f, **options) for f in filenames]
+
+    # Batch mode resolves every unknown expense up front, so categorizing the
+    # files never stops to ask for input
+    resolved = None
+    if parser.batch or parser.resolutions is not None:
+        unresolved = list()
+        for expo in reports:
+            unresolved.extend(expo.unresolved_expenses())
+
+        if parser.resolutions is None:
+            resolved = catman.resolve(unresolved)
+        else:
+            resolved = catman.resolve(
+                unresolved,
+                load_resolutions(parser.resolutions),
+                interactive=False
+            )
+
+        catman.commit()
+
+    if parser.totals is not None:
+        for expo in reports:
+            expo.categorize(resolved)
+
+        write_totals(parser.totals, reports)
+
+        return
+
+    summaries = dict()
+    if parser.pipeline is not None:
+        from report_pipeline import ReportPipeline
+
+        summaries = ReportPipeline(
+            reports,
+            resolved,
+            jobs=parser.jobs,
+            ncompiles=parser.jobs,
+            depth=parser.pipeline
+        ).run()
+    elif parser.jobs > 1:
+        with ProcessPoolExecutor(max_workers=parser.jobs) as executor:
+            futures = dict()
+            for expo in reports:
+                expo.categorize(resolved)
+
+                futures[executor.submit(expo.render)] = expo
+
+            for future in as_completed(futures):
+                expo = futures[future]
+
+                try:
+                    summaries[expo.filename] = future.result()
+                except Exception:
+                    logging.exception(
+                        f'Failed to create expense report for {expo.filename}'
+                    )
+                    summaries[expo.filename] = dict(expo.summary, pdf='failed')
+    else:
+        for expo in reports:
+            expo.categorize(resolved)
+            summaries[expo.filename] = expo.render()
+
+    print_summary(summaries)
+
+    if parser.profile is not None:
+        write_profiles(parser.profile, summaries)
+
+
+def serve(parser):
+    """Runs a report server until it is shut down.
+
+    parser: (Namespace) the command line arguments.
+    """
+    from report_server import ReportServer
+
+    server = ReportServer(
+        parser.serve,
+        catfile=parser.catfile,
+        baseline=parser.baseline,
+        resolutions=parser.resolutions,
+        jobs=parser.jobs,
+        backlog=parser.backlog,
+        chunksize=parser.chunksize,
+        backend=parser.backend,
+        chartfmt=parser.chartfmt
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def submit_reports(parser, filenames):
+    """Sends the reports to a running report server, all at the same time,
+    and waits for them. Reports beyond the backlog of the server are sent
+    again until it accepts them.
+
+    parser:    (Namespace) the command line arguments.
+    filenames: ([str])     the CSV files.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from report_server import request, submit
+
+    options = {
+        'force': parser.force,
+        'profile': parser.profile is not None,
+        'statsdir': None if parser.statsdir is None else os.path.abspath(parser.statsdir),
+        'backend': parser.backend,
+        'chartfmt': parser.chartfmt,
+    }
 
-    #for directory in parse.directories:
-        #for filename in os.listdir(directory):
-            #if filename[-3:] != 'csv':
-                #continue
+    # The server uses its own settings for the options that were not given
+    options = {key: value for key, value in options.items() if value is not None}
 
-            #expo = ExpenseReport(filename)
-            #expo.generate_report()
+    summaries = dict()
+    if len(filenames) > 0:
+        with ThreadPoolExecutor(max_workers=len(filenames)) as executor:
+            futures = {
+                filename: executor.submit(submit, parser.server, filename, **options)
+                for filename in filenames
+            }
+
+            for filename, future in futures.items():
+                try:
+                    summaries[filename] = future.result()
+                except Exception as e:
+                    logging.error(f'Failed to create expense report for {filename}: {e}')
+                    summaries[filename] = {'pdf': 'failed'}
+
+    print_summary(summaries)
+
+    if parser.profile is not None:
+        write_profiles(parser.profile, summaries)
+
+    if parser.stop:
+        request(parser.server, {'command': 'shutdown'})
+
+
+def write_profiles(filename, summaries):
+    """Writes the profiles of the reports to a JSON file, and prints them.
+
+    filename:  (str)  the JSON file.
+    summaries: (dict) maps each CSV file to the summary of its report.
+    """
+    profiles = {
+        filename: summary['profile']
+        for filename, summary in summaries.items()
+        if 'profile' in summary.keys()
+    }
+
+    with open(filename, 'w') as file:
+        json.dump(profiles, file, indent=2)
+
+    print_profile(profiles)
+
+
+def write_totals(filename, reports):
+    """Writes the total of each category and subcategory of each report.
+
+    A JSON file maps each CSV file to its total and the totals from
+    `ExpenseReport.totals`, while a CSV file has a row for each category and
+    subcategory of each report, with an empty subcategory for categories.
+
+    filename: (str)             the JSON or CSV file.
+    reports:  ([ExpenseReport]) the categorized reports.
+    """
+    logging.info(f'Writing the category totals to {filename}')
+
+    if filename.lower().endswith('.csv'):
+        with open(filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Report', 'Category', 'Subcategory', 'Total'])
+
+            for expo in reports:
+                for key, total in sorted(expo.totals().items()):
+                    cat, _, subcat = key.partition('/')
+                    writer.writerow([expo.filename, cat, subcat, f'{total:.2f}'])
+    else:
+        with open(filename, 'w') as file:
+            json.dump({
+                expo.filename: {
+                    'total': expo.expenses.total(),
+                    'totals': expo.totals(),
+                }
+                for expo in reports
+            }, file, indent=2)
+
+
+def print_rules(rules):
+    """Prints every rule with its id.
+
+    rules: (RuleSet) the rules.
+    """
+    print(f'\n{"id":>6}  {"kind":<10} {"category":<30} pattern')
+
+    for id, rule in rules.rules.items():
+        category = f'{rule["cat"]}/{rule["subcat"]}'
+        print(f'{id:>6}  {rule["kind"]:<10} {category:<30} {rule["pattern"]}')
+
+
+def print_aliases(aliases):
+    """Prints every alias with the expense it stands for.
+
+    aliases: ([tuple]) each alias and its expense, which is empty if every
+                       close match was rejected.
+    """
+    print(f'\n{"alias":<40} expense')
+
+    for alias, expense in aliases:
+        print(f'{alias:<40} {expense or "(rejected)"}')
+
+
+def print_summary(summaries):
+    """Prints which stages of each report were reused and which were rebuilt.
+
+    summaries: (dict) maps each CSV file to the status of each of its stages.
+    """
+    if len(summaries) == 0:
+        return
+
+    stages = ['categorize', 'charts', 'pdf']
+    width = max(len(filename) for filename in summaries.keys())
+
+    print(
+        '\n' + f'{"report":<{width}}  '
+        + '  '.join(f'{s:<12}' for s in stages)
+        + '  compile (s)'
+    )
+
+    for filename, summary in summaries.items():
+        elapsed = summary.get('compile_s')
+
+        print(
+            f'{filename:<{width}}  '
+            + '  '.join(f'{summary.get(s, "-"):<12}' for s in stages)
+            + ('  -' if elapsed is None else f'  {elapsed:.2f}')
+        )
+
+
+def print_profile(profiles):
+    """Prints the wall time, CPU time and peak memory of each stage of each
+    report, followed by its counters.
+
+    profiles: (dict) maps each CSV file to the results of its `Profiler`.
+    """
+    if len(profiles) == 0:
+        return
+
+    width = max(len(filename) for filename in profiles.keys())
+
+    print(
+        '\n' + f'{"report":<{width}}  {"stage":<12}'
+        + '  wall (s)    cpu (s)     peak (MiB)  growth (MiB)'
+    )
+
+    for filename, profile in profiles.items():
+        for stage, x in profile['stages'].items():
+            print(
+                f'{filename:<{width}}  {stage:<12}'
+                + f'  {x["wall_s"]:<10.3f}  {x["cpu_s"]:<10.3f}'
+                + f'  {x["peak_mib"]:<10.1f}  {x["growth_mib"]:.1f}'
+            )
+
+        counters = ', '.join(f'{k}={v}' for k, v in profile['counters'].items())
+        print(f'{filename:<{width}}  {counters}')
 
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,325 @@
+import logging
+import numpy as np
+import time
+
+from itertools import chain, islice
+from matplotlib import rc_context
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+# The margins of a page, as fractions of its width and height
+LEFT, RIGHT, TOP, BOTTOM = 0.08, 0.92, 0.92, 0.08
+
+# The number of characters in each column of the expense and comparison
+# tables, which fill the width of a page at the default font size
+EXPENSE_COLUMNS = [10, 14, 14, 40, 12]
+COMPARISON_COLUMNS = [34, 14, 14, 14, 14]
+
+# The weight of regular text in the standard PDF fonts
+WEIGHT = 'medium'
+
+
+class PdfGenerator:
+    """Writes the report straight to a multi-page PDF with matplotlib, without
+    LaTeX.
+
+    This has the same methods as `TexGenerator`, so the same report can be
+    written with either. The pages are plainer than the LaTeX ones, but are
+    written in the same process, much faster, and without a TeX installation.
+
+    Every page is written as soon as it is complete, and long tables are
+    broken across pages with their column names repeated on every page.
+
+    filename: (str)   the filename of the PDF.
+    pagesize: (tuple) the width and height of the pages in inches.
+    nrows:    (int)   the number of table rows on a page.
+    fontsize: (float) the font size of the tables.
+    """
+    def __init__(self, filename, pagesize=(8.5, 11), nrows=50, fontsize=8):
+        self.filename = filename
+        self.pagesize = pagesize
+        self.nrows = nrows
+        self.fontsize = fontsize
+
+        self.pdf = None
+        self.title = None
+        self.section = None
+        self.npages = 0
+        self.elapsed = 0.0
+
+    def add_header(self):
+        """Does nothing, a PDF has no preamble."""
+
+    def add_title(self, title):
+        logger.debug('Adding title')
+
+        self.title = title
+
+        fig = self._page()
+        fig.text(
+            0.5,
+            0.6,
+            title,
+            ha='center',
+            va='center',
+            fontsize=28,
+            weight=WEIGHT,
+            parse_math=False
+        )
+        self._save(fig)
+
+    def add_section(self, section):
+        logger.debug('Adding section')
+
+        # The heading is drawn at the top of the next page, unless the
+        # section has no pages of its own
+        if self.section is not None:
+            self._save(self._page())
+
+        self.section = section
+
+    def add_figure(self, filename):
+        logger.debug(f'Adding a figure from {filename}')
+
+        fig = self._page()
+
+        # The image is read as bytes, since matplotlib would read it as
+        # floats four times the size, and is embedded as it is, without
+        # resampling
+        with Image.open(filename) as image:
+            pixels = np.asarray(image.convert('RGB'))
+
+        ax = fig.add_axes([LEFT, BOTTOM, RIGHT - LEFT, TOP - BOTTOM - 0.05])
+        ax.imshow(pixels, interpolation='none')
+        ax.axis('off')
+
+        self._save(fig)
+
+    def add_table(self, data, total):
+        """Adds the expenses as a table that breaks across pages, with a
+        subtotal row after each date and each category on a date.
+
+        data:  (Node)  the total price of each expense, grouped by date,
+                       category and subcategory.
+        total: (float) the total price of every expense.
+        """
+        logger.debug('Adding data to a table')
+
+        rows = chain(
+            self._expense_rows(data),
+            [('', '', '', 'TOTAL', f'{total:.2f}')]
+        )
+
+        self._add_rows(
+            ['Date', 'Category', 'Subcategory', 'Expense', 'Price ($)'],
+            rows,
+            EXPENSE_COLUMNS,
+            ngrouped=3
+        )
+
+    def add_comparison(self, comparison):
+        """Adds a table comparing the totals of each category and subcategory
+        with their average.
+
+        comparison: (dict) maps each category, and each subcategory as
+                           "category/subcategory", to its 'total', 'mean',
+                           'std' and 'difference'.
+        """
+        logger.debug('Adding comparison to a table')
+
+        def rows():
+            # Each category is followed by its subcategories
+            for key in sorted(comparison.keys(), key=lambda x: x.split('/', 1)):
+                x = comparison[key]
+                cat, _, subcat = key.partition('/')
+
+                yield (
+                    cat.title() if subcat == '' else '  ' + subcat.title(),
+                    f'{x["total"]:.2f}',
+                    f'{x["mean"]:.2f}',
+                    f'{x["std"]:.2f}',
+                    f'{x["difference"]:+.2f}',
+                )
+
+        self._add_rows(
+            ['Category', 'Total ($)', 'Average ($)', 'Std. Dev. ($)', 'Difference ($)'],
+            rows(),
+            COMPARISON_COLUMNS
+        )
+
+    def add_footer(self):
+        """Writes the page of a section that has no pages of its own."""
+        if self.section is not None:
+            self._save(self._page())
+
+    def write(self):
+        """Finishes writing the PDF."""
+        if self.pdf is not None:
+            self.pdf.close()
+            self.pdf = None
+
+        logger.info(
+            f'Finished writing {self.npages} pages to "{self.filename}" '
+            f'in {self.elapsed:.2f}s'
+        )
+
+    def compile(self):
+        """Does nothing, the PDF is already written.
+
+        returns: (tuple) whether the PDF was written, and how long it took in
+                         seconds.
+        """
+        return self.npages > 0, self.elapsed
+
+    async def compile_async(self):
+        """Does nothing, like `compile`.
+
+        returns: (tuple) whether the PDF was written, and how long it took in
+                         seconds.
+        """
+        return self.compile()
+
+    def _expense_rows(self, node, labels=()):
+        """Flattens the expenses of a group into table rows, in a single walk,
+        with a subtotal row after each group that has one.
+
+        node:   (Node)  the group.
+        labels: (tuple) the labels of the groups above the group.
+
+        yields: (tuple) the date, category, subcategory, expense and price.
+        """
+        for key, child in node.children.items():
+            if isinstance(child, (int, float)):
+                yield (*labels, key.title(), f'{child:.2f}')
+            else:
+                yield from self._expense_rows(child, (*labels, key.title()))
+
+        if node.subtotal:
+            padding = ('',) * (3 - len(labels))
+            yield (*labels, *padding, 'Subtotal', f'{node.total:.2f}')
+
+    def _add_rows(self, header, rows, columns, ngrouped=0):
+        """Adds a table, a page at a time.
+
+        header:   ([str])    the names of the columns.
+        rows:     (iterable) the rows, each a tuple of strings.
+        columns:  ([int])    the number of characters in each column, where
+                             the last column is aligned to the right.
+        ngrouped: (int)      the number of leading columns that rows are
+                             grouped by. Their values are only written on the
+                             first row of each group and of each page.
+        """
+        page = list(islice(rows, self.nrows))
+
+        while len(page) > 0:
+            following = list(islice(rows, self.nrows))
+
+            fig = self._page()
+            top = TOP - (0.05 if fig.texts else 0.0)
+
+            lines = [self._format_row(header, columns), '']
+
+            for j, row in enumerate(page):
+                if j > 0:
+                    # Only the first row of a group shows what it is grouped by
+                    row = [
+                        '' if i < ngrouped and row[:i+1] == page[j-1][:i+1] else x
+                        for i, x in enumerate(row)
+                    ]
+
+                lines.append(self._format_row(row, columns))
+
+            # The whole page is a single block of monospaced text, which is
+            # much faster to write than a text for each cell
+            fig.text(
+                LEFT,
+                top,
+                '\n'.join(lines),
+                va='top',
+                family='monospace',
+                fontsize=self.fontsize,
+                weight=WEIGHT,
+                linespacing=1.4,
+                parse_math=False
+            )
+
+            # The line under the column names
+            y = top - 1.7 * self.fontsize * 1.4 / 72 / self.pagesize[1]
+            fig.add_artist(Line2D(
+                [LEFT, RIGHT], [y, y],
+                color='black',
+                linewidth=0.8
+            ))
+
+            if len(following) > 0:
+                fig.text(
+                    RIGHT,
+                    BOTTOM - 0.03,
+                    'Continued on next page',
+                    ha='right',
+                    fontsize=self.fontsize,
+                    weight=WEIGHT,
+                    style='italic'
+                )
+
+            self._save(fig)
+            page = following
+
+    def _format_row(self, row, columns):
+        """Pads or cuts the cells of a row to the widths of the columns.
+
+        row:     ([str]) the cells.
+        columns: ([int]) the number of characters in each column.
+
+        returns: (str) the row.
+        """
+        cells = [f'{x[:w]:<{w}}' for x, w in zip(row[:-1], columns[:-1])]
+        cells.append(f'{row[-1][:columns[-1]]:>{columns[-1]}}')
+
+        return '  '.join(cells)
+
+    def _page(self):
+        """Creates a page, with the heading of the current section.
+
+        returns: (Figure) the page.
+        """
+        fig = Figure(figsize=self.pagesize)
+
+        if self.section is not None:
+            fig.text(
+                LEFT,
+                TOP + 0.02,
+                self.section,
+                fontsize=16,
+                weight='bold',
+                parse_math=False
+            )
+            self.section = None
+
+        return fig
+
+    def _save(self, fig):
+        """Writes a page to the PDF, opening the PDF on the first page.
+
+        fig: (Figure) the page.
+        """
+        start = time.perf_counter()
+
+        if self.pdf is None:
+            logger.info(f'Writing PDF to "{self.filename}"')
+            metadata = None if self.title is None else {'Title': self.title}
+            self.pdf = PdfPages(self.filename, metadata=metadata)
+
+        # The standard PDF fonts are not embedded, which makes pages with a
+        # lot of text several times faster to write
+        with rc_context({'pdf.use14corefonts': True}):
+            self.pdf.savefig(fig)
+
+        self.npages += 1
+
+        self.elapsed += time.perf_counter() - start
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+
+from build_cache import hash_entries
+from expense_report import ExpenseReport
+from expense_table import ExpenseTable, to_cents
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodReport(ExpenseReport):
+    """Generates a single expense report over several periods, such as an
+    annual report from monthly CSV files.
+
+    Each period is read from the categorized expenses saved next to its CSV
+    file by `ExpenseReport`, and only periods without current expenses are
+    categorized from their CSV file. The table of the report groups the
+    expenses by period instead of by date.
+
+    xfiles: ([str]) the CSV files of the periods, in order.
+    name:   (str)   the name of the report, which is used for its title and the
+                    names of its files.
+    kwargs: (dict)  the options of `ExpenseReport`, which are used for the
+                    report and each of its periods.
+    """
+    def __init__(self, xfiles, name, **kwargs):
+        super().__init__(name, **kwargs)
+
+        # The periods are measured as part of the stages of the report, since
+        # stages cannot be nested
+        kwargs['catman'] = self.catman
+        kwargs['profile'] = False
+        self.periods = [ExpenseReport(xfile, **kwargs) for xfile in xfiles]
+
+    def __getstate__(self):
+        # The periods hold on to the category manager as well
+        state = super().__getstate__()
+        state['periods'] = None
+
+        return state
+
+    def categorize(self, resolved=None):
+        """Merges the categorized expenses of every period, categorizing the
+        periods that do not have current expenses.
+
+        resolved: (dict) see `ExpenseReport.categorize`.
+        """
+        with self.profiler.stage('categorize'):
+            loaded = list()
+            nrebuilt = 0
+
+            for period in self.periods:
+                expenses = None if self.force else period.load_expenses()
+
+                if expenses is None:
+                    period.categorize(resolved)
+                    expenses = period.load_expenses()
+                    nrebuilt += 1
+
+                    for name, count in period.profiler.counters.items():
+                        self.profiler.count(name, count)
+
+                loaded.append(expenses)
+
+            logger.info(
+                f'Merging {len(loaded)} periods, {nrebuilt} categorized again'
+            )
+
+            self.expenses = ExpenseTable()
+            for expenses, record in loaded:
+                totals = expenses.totals('cat', 'subcat', 'expense')
+
+                self.expenses.extend(
+                    (record['period'], cat, subcat, expense, to_cents(price))
+                    for (cat, subcat, expense), price in totals.items()
+                )
+
+            self.expenses.freeze()
+
+            content = json.dumps([record['hash'] for _, record in loaded])
+            self.hash = hashlib.sha256(content.encode()).hexdigest()
+            self.cats = hash_entries(self.expenses.entries())
+
+            self.summary['categorize'] = f'{nrebuilt}/{len(loaded)} rebuilt'
+
+    def unresolved_expenses(self):
+        """Finds the distinct expenses that are not known yet, only in the
+        periods without current expenses.
+
+        returns: ([str]) the unknown expenses, in order of appearance.
+        """
+        unresolved = dict()
+
+        for period in self.periods:
+            if self.force or period.load_expenses() is None:
+                unresolved.update(dict.fromkeys(period.unresolved_expenses()))
+
+        return list(unresolved.keys())
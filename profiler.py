@@ -0,0 +1,140 @@
+import cProfile
+import logging
+import os
+import resource
+import sys
+import time
+
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """Records how long each stage of an expense report takes and how much it
+    does.
+
+    The wall time, CPU time and peak memory of each stage are recorded, along
+    with counters such as the number of rows processed. The peak memory is the
+    highest resident memory of the process so far, from `getrusage`, which
+    costs nothing while the stage runs, unlike tracing every allocation. It
+    never goes down, so how much a stage raised it is recorded as well. Memory
+    of worker processes is not included, and stages must not be nested.
+
+    Stages are only measured when the profiler is enabled, while counters are
+    always kept because they are cheap.
+
+    The results have the structure
+
+    {
+        'stages': {
+            stage: {
+                'wall_s': wall time,
+                'cpu_s': CPU time,
+                'peak_mib': peak memory of the process by the end of the
+                            stage,
+                'growth_mib': how much the stage raised the peak memory,
+            }
+        },
+        'counters': {counter: count},
+    }
+
+    enabled:  (bool) whether stages are measured.
+    statsdir: (str)  the directory that a cProfile dump of each stage is
+                     written to, as `<name>.<stage>.prof`. If `None`, stages
+                     are not run under cProfile.
+    name:     (str)  the name of the report.
+    """
+    def __init__(self, enabled=False, statsdir=None, name='report'):
+        self.enabled = enabled
+        self.statsdir = statsdir
+        self.name = name
+
+        self.stages = dict()
+        self.counters = dict()
+
+    @contextmanager
+    def stage(self, name):
+        """Measures a stage while the block runs.
+
+        A stage that runs more than once adds to its earlier times and growth
+        of the peak memory, and keeps the highest peak memory.
+
+        name: (str) the name of the stage.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        before = _peak_mib()
+
+        profile = None
+        if self.statsdir is not None:
+            profile = cProfile.Profile()
+            profile.enable()
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            peak = _peak_mib()
+
+            if profile is not None:
+                profile.disable()
+                self._dump(profile, name)
+
+            stage = self.stages.setdefault(
+                name,
+                {'wall_s': 0.0, 'cpu_s': 0.0, 'peak_mib': 0.0, 'growth_mib': 0.0}
+            )
+            stage['wall_s'] += wall
+            stage['cpu_s'] += cpu
+            stage['peak_mib'] = max(stage['peak_mib'], peak)
+            stage['growth_mib'] += peak - before
+
+            logger.debug(
+                f'{self.name}: {name} took {wall:.3f}s wall, {cpu:.3f}s CPU, '
+                f'{peak:.1f} MiB peak'
+            )
+
+    def count(self, name, n=1):
+        """Adds to a counter.
+
+        name: (str) the name of the counter.
+        n:    (int) the amount added.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def results(self):
+        """Collects the results.
+
+        returns: (dict) the stages and counters.
+        """
+        return {'stages': self.stages, 'counters': self.counters}
+
+    def _dump(self, profile, stage):
+        os.makedirs(self.statsdir, exist_ok=True)
+
+        filename = os.path.join(self.statsdir, f'{self.name}.{stage}.prof')
+        profile.dump_stats(filename)
+
+        logger.info(f'Wrote the profile of {stage} to {filename}')
+
+
+def _peak_mib():
+    """Finds the highest resident memory of the process so far.
+
+    returns: (float) the memory in MiB.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return maxrss / (1 << 20)
+
+    return maxrss / (1 << 10)
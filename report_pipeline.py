@@ -0,0 +1,138 @@
+import asyncio
+import logging
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+def _prepare(expo):
+    # Runs in a worker process, and sends the report back without its
+    # aggregation, which is only needed to write the document
+    written = expo.prepare()
+    expo.aggregation = None
+
+    return expo, written
+
+
+class ReportPipeline:
+    """Creates many expense reports with their stages overlapped, so that
+    while one report compiles, the next one renders its charts and the one
+    after that is categorized.
+
+    The stages are
+
+    - categorize: one report at a time in a thread, since every report shares
+      the category manager.
+    - prepare: the charts and the document of up to `jobs` reports at a time
+      in worker processes.
+    - compile: up to `ncompiles` documents at a time with pdflatex, as
+      asynchronous subprocesses.
+
+    Each stage is only allowed to get `depth` reports ahead of the next one,
+    so reports that are waiting never pile up in memory. With many reports,
+    the total time approaches the time of the slowest stage rather than the
+    sum of every stage.
+
+    reports:   ([ExpenseReport]) the reports.
+    resolved:  (dict)            see `ExpenseReport.categorize`.
+    jobs:      (int)             the number of reports prepared at a time.
+    ncompiles: (int)             the number of documents compiled at a time.
+    depth:     (int)             the number of reports that can wait between
+                                 two stages.
+    """
+    def __init__(self, reports, resolved=None, jobs=1, ncompiles=1, depth=2):
+        self.reports = reports
+        self.resolved = resolved
+        self.jobs = jobs
+        self.ncompiles = ncompiles
+        self.depth = depth
+
+        self.summaries = dict()
+
+    def run(self):
+        """Creates every report.
+
+        returns: (dict) maps each CSV file to the summary of its report.
+        """
+        asyncio.run(self._run())
+
+        return {
+            expo.filename: self.summaries[expo.filename]
+            for expo in self.reports
+        }
+
+    async def _run(self):
+        categorized = asyncio.Queue(self.depth)
+        prepared = asyncio.Queue(self.depth)
+
+        thread = ThreadPoolExecutor(max_workers=1)
+        processes = ProcessPoolExecutor(max_workers=self.jobs)
+
+        with thread, processes:
+            preparing = [
+                self._prepare(processes, categorized, prepared)
+                for _ in range(self.jobs)
+            ]
+            compiling = [
+                self._compile(prepared)
+                for _ in range(self.ncompiles)
+            ]
+
+            async def categorize_all():
+                await self._categorize(thread, categorized)
+
+                for _ in preparing:
+                    await categorized.put(None)
+
+            async def prepare_all():
+                await asyncio.gather(*preparing)
+
+                for _ in compiling:
+                    await prepared.put(None)
+
+            await asyncio.gather(categorize_all(), prepare_all(), *compiling)
+
+    async def _categorize(self, executor, output):
+        loop = asyncio.get_running_loop()
+
+        for expo in self.reports:
+            try:
+                await loop.run_in_executor(executor, expo.categorize, self.resolved)
+            except Exception:
+                logger.exception(f'Failed to categorize {expo.filename}')
+                self.summaries[expo.filename] = dict(expo.summary, pdf='failed')
+                continue
+
+            # Waits while the reports that are already categorized have not
+            # been picked up
+            await output.put(expo)
+
+    async def _prepare(self, executor, source, output):
+        loop = asyncio.get_running_loop()
+
+        while (expo := await source.get()) is not None:
+            try:
+                expo, written = await loop.run_in_executor(executor, _prepare, expo)
+            except Exception:
+                logger.exception(
+                    f'Failed to create expense report for {expo.filename}'
+                )
+                self.summaries[expo.filename] = dict(expo.summary, pdf='failed')
+                continue
+
+            if written:
+                await output.put(expo)
+            else:
+                self.summaries[expo.filename] = expo.summarize()
+
+    async def _compile(self, source):
+        while (expo := await source.get()) is not None:
+            try:
+                expo.finish(*await expo.compile_async())
+            except Exception:
+                logger.exception(f'Failed to compile {expo.filename}')
+                expo.summary['pdf'] = 'failed'
+
+            self.summaries[expo.filename] = expo.summarize()
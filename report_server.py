@@ -0,0 +1,286 @@
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from baseline import Baseline
+from category_manager import CategoryManager, load_resolutions
+from concurrent.futures import ProcessPoolExecutor
+from expense_report import ExpenseReport
+
+
+logger = logging.getLogger(__name__)
+
+# The options of `ExpenseReport` that each job can set
+OPTIONS = ['force', 'profile', 'statsdir', 'backend', 'chartfmt']
+
+
+def _warm_up():
+    """Imports everything the rendering needs and draws a tiny chart in each
+    format, so that matplotlib and its font cache are loaded before the first
+    report reaches the worker.
+    """
+    import aggregation
+    import pdf_generator
+    import tex_generator
+
+    from charts import Sheet, render_sheet
+
+    sheet = Sheet('warm-up', (('warm-up', {'warm-up': 1}),), 1, 1, (1, 1))
+
+    for fmt in ['png', 'pdf']:
+        render_sheet(sheet, fmt=fmt, dpi=10)
+
+
+def _render(expo):
+    return expo.render()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Reads a request and writes the response, each a line of JSON."""
+    def handle(self):
+        line = self.rfile.readline()
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {'status': 'error', 'error': f'Invalid request: {e}'}
+        else:
+            response = self.server.reports.handle(request)
+
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ReportServer:
+    """A long-lived process that creates expense reports on request, so that
+    each report does not pay again for starting Python, importing matplotlib,
+    loading its fonts and opening the categories.
+
+    Requests are read from a Unix socket, one connection for each request,
+    and each is a line of JSON
+
+    {'command': 'report', 'filename': the CSV file, 'options': {...}}
+    {'command': 'ping'}
+    {'command': 'shutdown'}
+
+    where the options are any of `OPTIONS`, and the response is a line of JSON
+    with its 'status', 'ok', 'busy' or 'error', and the 'summary' of the
+    report or the 'error'.
+
+    The categorization is done one report at a time by a single category
+    manager, which never asks for input. Unknown expenses are resolved from
+    the resolutions file, and the ones that are not resolved are
+    uncategorized. The charts and the PDF are rendered by a pool of `jobs`
+    worker processes, which are started and warmed up before the first
+    request, and at most `backlog` reports are accepted at a time. Requests
+    beyond that are answered with 'busy' right away, and `submit` sends them
+    again until they are accepted.
+
+    The precompiled LaTeX preamble is already kept on disk by `TexCompiler`,
+    so it is shared with one-shot runs.
+
+    address:     (str)  the path of the Unix socket.
+    catfile:     (str)  the database of the categories.
+    baseline:    (str)  the JSON file of the baseline of monthly spending,
+                        `None` for no comparison.
+    resolutions: (str)  the JSON file of resolutions of unknown expenses.
+    jobs:        (int)  the number of reports rendered at the same time.
+    backlog:     (int)  the number of reports accepted at the same time,
+                        including the ones being rendered.
+    kwargs:      (dict) the other options of `ExpenseReport`, used for every
+                        report.
+    """
+    def __init__(
+        self,
+        address,
+        catfile='cats.db',
+        baseline=None,
+        resolutions=None,
+        jobs=1,
+        backlog=16,
+        **kwargs
+    ):
+        self.address = address
+        self.catman = CategoryManager(catfile)
+        self.baseline = None if baseline is None else Baseline(baseline)
+        self.resolutions = dict()
+        self.kwargs = kwargs
+
+        if resolutions is not None:
+            self.resolutions = load_resolutions(resolutions)
+
+        # The category manager and the baseline are only used by one report
+        # at a time
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(backlog)
+
+        # The workers are started before any thread is, and each of them
+        # warms up on its own before the server accepts requests
+        self.executor = ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_up
+        )
+
+        for future in [self.executor.submit(os.getpid) for _ in range(jobs)]:
+            future.result()
+
+        if os.path.exists(address):
+            os.remove(address)
+
+        self.server = _Server(address, _Handler)
+        self.server.reports = self
+
+        logger.info(f'Serving expense reports on {address} with {jobs} workers')
+
+    def serve_forever(self):
+        """Handles requests until the server is shut down."""
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops accepting requests and releases the workers and categories."""
+        self.server.server_close()
+        self.executor.shutdown()
+        self.catman.commit()
+
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+    def handle(self, request):
+        """Handles a request.
+
+        request: (dict) the request.
+
+        returns: (dict) the response.
+        """
+        command = request.get('command', 'report')
+
+        if command == 'ping':
+            return {'status': 'ok'}
+
+        if command == 'shutdown':
+            # The server can only be shut down from another thread than the
+            # one that serves it
+            threading.Thread(target=self.server.shutdown).start()
+            return {'status': 'ok'}
+
+        if command != 'report':
+            return {'status': 'error', 'error': f'Unknown command "{command}"'}
+
+        if not self.slots.acquire(blocking=False):
+            return {'status': 'busy'}
+
+        try:
+            return {'status': 'ok', 'summary': self.report(
+                request['filename'],
+                **request.get('options', dict())
+            )}
+        except Exception as e:
+            logger.exception(f'Failed to create expense report for {request.get("filename")}')
+            return {'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+        finally:
+            self.slots.release()
+
+    def report(self, filename, **options):
+        """Categorizes a CSV file and renders its report in a worker.
+
+        filename: (str)  the CSV file.
+        options:  (dict) any of `OPTIONS`, where `None` keeps the setting of
+                         the server.
+
+        returns: (dict) whether each stage was reused or rebuilt.
+        """
+        unknown = set(options.keys()) - set(OPTIONS)
+        if len(unknown) > 0:
+            raise ValueError(f'Unknown options: {", ".join(sorted(unknown))}')
+
+        # Options set to `None` keep the setting of the server
+        kwargs = dict(self.kwargs)
+        kwargs.update({key: value for key, value in options.items() if value is not None})
+
+        with self.lock:
+            expo = ExpenseReport(
+                filename,
+                catman=self.catman,
+                baseline=self.baseline,
+                **kwargs
+            )
+
+            resolved = self.catman.resolve(
+                expo.unresolved_expenses(),
+                self.resolutions,
+                interactive=False
+            )
+            expo.categorize(resolved)
+
+        return self.executor.submit(_render, expo).result()
+
+
+def request(address, message, timeout=None):
+    """Sends a request to a `ReportServer` and waits for its response.
+
+    address: (str)   the path of the Unix socket of the server.
+    message: (dict)  the request.
+    timeout: (float) how long to wait for the response in seconds, `None` to
+                     wait until it comes.
+
+    returns: (dict) the response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(address)
+        conn.sendall((json.dumps(message) + '\n').encode())
+
+        with conn.makefile('r') as file:
+            return json.loads(file.readline())
+
+
+def submit(address, filename, timeout=None, wait=True, **options):
+    """Creates an expense report with a `ReportServer`.
+
+    While the server is busy with as many reports as it accepts, the report
+    is sent again after a delay that doubles up to a second.
+
+    address:  (str)   the path of the Unix socket of the server.
+    filename: (str)   the CSV file, relative to this process.
+    timeout:  (float) how long to wait for the report in seconds, `None` to
+                      wait until it is done.
+    wait:     (bool)  whether to wait while the server is busy, instead of
+                      raising an error.
+    options:  (dict)  any of `OPTIONS`.
+
+    returns: (dict) whether each stage was reused or rebuilt.
+    """
+    message = {
+        'command': 'report',
+        'filename': os.path.abspath(filename),
+        'options': options,
+    }
+
+    delay = 0.05
+    response = request(address, message, timeout)
+
+    while wait and response['status'] == 'busy':
+        time.sleep(delay)
+        delay = min(2 * delay, 1.0)
+
+        response = request(address, message, timeout)
+
+    if response['status'] == 'busy':
+        raise RuntimeError(f'The server on {address} is busy')
+
+    if response['status'] != 'ok':
+        raise RuntimeError(response['error'])
+
+    return response['summary']
@@ -0,0 +1,211 @@
+import logging
+import re
+
+
+logger = logging.getLogger(__name__)
+
+# The kinds of rules, in the order they are tried
+KINDS = ['prefix', 'substring', 'regex']
+
+
+class RuleSet:
+    """Categorizes expenses with user-defined rules, such as every expense
+    that starts with "starbucks #" being coffee.
+
+    Rules are either a prefix, a substring or a regular expression of the
+    expense, and are compiled into a single matcher so that a lookup does not
+    get slower with more rules:
+
+    - prefixes and substrings are stored in tries, so an expense is only
+      walked once for prefixes, and once from each position for substrings.
+    - regular expressions are joined into a single regular expression. The
+      ones that cannot be joined, because they have groups that backreferences
+      could refer to or inline flags, are tried one at a time instead.
+
+    Prefixes are tried first, then substrings and then regular expressions.
+    The longest matching prefix or substring wins, and of the regular
+    expressions, the one that matches earliest in the expense, with ties going
+    to the rule that was added first.
+
+    rules:  (iterable) the id, kind, pattern, category and subcategory of each
+                       rule.
+    strict: (bool)     whether invalid rules raise an error instead of being
+                       ignored.
+    """
+    def __init__(self, rules=(), strict=False):
+        self.rules = dict()
+
+        self.prefixes = dict()
+        self.substrings = dict()
+        self.regex = None
+
+        # The regular expressions that are tried one at a time, with their id
+        self.regexes = list()
+
+        patterns = list()
+        for id, kind, pattern, cat, subcat in rules:
+            if kind not in KINDS:
+                logger.warning(f'Ignoring rule {id} of unknown kind "{kind}"')
+                continue
+
+            if kind == 'regex':
+                try:
+                    regex = re.compile(pattern, re.IGNORECASE)
+                except re.error as e:
+                    if strict:
+                        raise
+
+                    logger.warning(f'Ignoring rule {id} with invalid pattern "{pattern}": {e}')
+                    continue
+
+            self.rules[id] = {
+                'kind': kind,
+                'pattern': pattern,
+                'cat': cat,
+                'subcat': subcat,
+            }
+
+            if kind == 'prefix':
+                self._insert(self.prefixes, pattern.lower(), id)
+            elif kind == 'substring':
+                self._insert(self.substrings, pattern.lower(), id)
+            elif self._joinable(id, pattern, regex):
+                patterns.append(f'(?P<r{id}>{pattern})')
+            else:
+                self.regexes.append((id, regex))
+
+        if len(patterns) > 0:
+            try:
+                self.regex = re.compile('|'.join(patterns), re.IGNORECASE)
+            except re.error as e:
+                if strict:
+                    raise
+
+                logger.warning(f'Trying every regular expression rule on its own: {e}')
+                self.regexes = [
+                    (id, re.compile(self.rules[id]['pattern'], re.IGNORECASE))
+                    for id in self.rules.keys()
+                    if self.rules[id]['kind'] == 'regex'
+                ]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, expense):
+        """Finds the rule that categorizes an expense.
+
+        expense: (str) the expense, in lowercase.
+
+        returns: (int) the id of the rule, `None` if no rule matches.
+        """
+        id = self._walk(self.prefixes, expense, 0)
+        if id is not None:
+            return id
+
+        if len(self.substrings) > 0:
+            best = None
+            for start in range(len(expense)):
+                found = self._walk(self.substrings, expense, start, with_length=True)
+
+                if found is not None and (best is None or found[1] > best[1]):
+                    best = found
+
+            if best is not None:
+                return best[0]
+
+        # The earliest match wins, and then the rule that was added first
+        best = None
+
+        if self.regex is not None:
+            found = self.regex.search(expense)
+
+            if found is not None:
+                best = (found.start(), int(found.lastgroup[1:]))
+
+        for id, regex in self.regexes:
+            found = regex.search(expense)
+
+            if found is not None and (best is None or (found.start(), id) < best):
+                best = (found.start(), id)
+
+        if best is not None:
+            return best[1]
+
+        return None
+
+    def categorize(self, expense):
+        """Categorizes an expense with the rules.
+
+        expense: (str) the expense, in lowercase.
+
+        returns: (dict) the 'cat' and 'subcat' of the expense, and the 'rule'
+                        that categorized it, `None` if no rule matches.
+        """
+        id = self.match(expense)
+
+        if id is None:
+            return None
+
+        rule = self.rules[id]
+
+        return {'cat': rule['cat'], 'subcat': rule['subcat'], 'rule': id}
+
+    def _joinable(self, id, pattern, regex):
+        """Checks if a regular expression can be joined with the others.
+
+        Expressions with groups are kept apart, since their groups are
+        numbered differently once joined and backreferences to them would
+        refer to other groups. Expressions with inline flags can only be
+        compiled at the start of the whole expression.
+
+        id:      (int)     the id of the rule.
+        pattern: (str)     the regular expression.
+        regex:   (Pattern) the regular expression compiled on its own.
+
+        returns: (bool) whether the expression can be joined.
+        """
+        if regex.groups > 0:
+            return False
+
+        try:
+            re.compile(f'(?P<r{id}>{pattern})')
+        except re.error:
+            return False
+
+        return True
+
+    def _insert(self, trie, pattern, id):
+        node = trie
+        for c in pattern:
+            node = node.setdefault(c, dict())
+
+        # A rule that was added later for the same pattern replaces it
+        node[None] = id
+
+    def _walk(self, trie, expense, start, with_length=False):
+        """Walks a trie along an expense to find its longest match.
+
+        trie:        (dict) the trie.
+        expense:     (str)  the expense.
+        start:       (int)  the position in the expense to start from.
+        with_length: (bool) whether the length of the match is returned.
+
+        returns: (int) the id of the rule of the longest match, along with its
+                       length if `with_length`. `None` if nothing matches.
+        """
+        node = trie
+        found = None
+
+        for i in range(start, len(expense)):
+            node = node.get(expense[i])
+
+            if node is None:
+                break
+
+            if None in node:
+                found = (node[None], i + 1 - start)
+
+        if found is None or with_length:
+            return found
+
+        return found[0]
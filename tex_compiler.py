@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from functools import lru_cache
+
+
+logger = logging.getLogger(__name__)
+
+BEGIN = r'\begin{document}'
+
+
+@lru_cache(maxsize=None)
+def pdflatex_version():
+    """Finds the version of pdflatex, which format files only work with.
+
+    returns: (str) the output of `pdflatex --version`, empty if pdflatex is
+                   not installed.
+    """
+    try:
+        return subprocess.run(
+            ['pdflatex', '--version'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        ).stdout
+    except OSError:
+        return ''
+
+
+class TexCompiler:
+    """Compiles LaTeX documents with a precompiled preamble.
+
+    Everything before `\\begin{document}` is dumped once into a format file,
+    named after a hash of the preamble and of the version of pdflatex, so that
+    later documents with the same preamble do not load their packages again.
+    Each document is compiled in its own temporary directory, so that
+    documents compiled at the same time never share auxiliary files, and is
+    compiled again until its table of contents and tables are up to date.
+
+    If the format cannot be built, documents are compiled without it. If a
+    document fails to compile with the format, the format is deleted, since
+    it may be truncated or stale, and the whole document is compiled again
+    once without it.
+
+    fmtdir:    (str) the directory of the format files.
+    minpasses: (int) the number of times each document is always compiled.
+    maxpasses: (int) the maximum number of times each document is compiled.
+    """
+    def __init__(self, fmtdir='.tex_format', minpasses=2, maxpasses=3):
+        self.fmtdir = os.path.abspath(fmtdir)
+        self.minpasses = minpasses
+        self.maxpasses = maxpasses
+
+    def compile(self, texfile):
+        """Compiles a document into a PDF next to it.
+
+        texfile: (str) the LaTeX document.
+
+        returns: (tuple) whether the document compiled successfully, and how
+                         long it took in seconds.
+        """
+        start = time.perf_counter()
+
+        with tempfile.TemporaryDirectory(prefix='expense_report_tex_') as tmpdir:
+            command, fmt = self._setup(texfile, tmpdir)
+            ok = self._passes(texfile, tmpdir, command)
+
+            if not ok and fmt is not None:
+                tmpdir = self._retry(texfile, tmpdir, fmt)
+                command, _ = self._setup(texfile, tmpdir, precompiled=False)
+                ok = self._passes(texfile, tmpdir, command)
+
+            return self._collect(texfile, tmpdir, ok, start)
+
+    async def compile_async(self, texfile):
+        """Compiles a document into a PDF next to it, without blocking the
+        event loop while pdflatex runs.
+
+        texfile: (str) the LaTeX document.
+
+        returns: (tuple) whether the document compiled successfully, and how
+                         long it took in seconds.
+        """
+        start = time.perf_counter()
+
+        with tempfile.TemporaryDirectory(prefix='expense_report_tex_') as tmpdir:
+            # Building the format of a new preamble runs pdflatex as well
+            command, fmt = await asyncio.to_thread(self._setup, texfile, tmpdir)
+            ok = await self._passes_async(texfile, tmpdir, command)
+
+            if not ok and fmt is not None:
+                tmpdir = self._retry(texfile, tmpdir, fmt)
+                command, _ = self._setup(texfile, tmpdir, precompiled=False)
+                ok = await self._passes_async(texfile, tmpdir, command)
+
+            return self._collect(texfile, tmpdir, ok, start)
+
+    def _passes(self, texfile, tmpdir, command):
+        """Compiles a document until it needs no more passes.
+
+        texfile: (str)   the LaTeX document.
+        tmpdir:  (str)   the directory it is compiled in.
+        command: ([str]) the command from `_setup`.
+
+        returns: (bool) whether the document compiled successfully.
+        """
+        ok = False
+        for npass in range(self.maxpasses):
+            pdflatex = subprocess.run(
+                command,
+                cwd=tmpdir,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            ok = pdflatex.returncode == 0
+
+            if self._done(texfile, tmpdir, ok, npass):
+                break
+
+        return ok
+
+    async def _passes_async(self, texfile, tmpdir, command):
+        """Compiles a document until it needs no more passes, without blocking
+        the event loop while pdflatex runs.
+
+        texfile: (str)   the LaTeX document.
+        tmpdir:  (str)   the directory it is compiled in.
+        command: ([str]) the command from `_setup`.
+
+        returns: (bool) whether the document compiled successfully.
+        """
+        ok = False
+        for npass in range(self.maxpasses):
+            pdflatex = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=tmpdir,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            ok = await pdflatex.wait() == 0
+
+            if self._done(texfile, tmpdir, ok, npass):
+                break
+
+        return ok
+
+    def _retry(self, texfile, tmpdir, fmt):
+        """Deletes a format that a document failed to compile with, and makes
+        a clean directory to compile the document again in.
+
+        texfile: (str) the LaTeX document.
+        tmpdir:  (str) the directory it was compiled in.
+        fmt:     (str) the format file.
+
+        returns: (str) the new directory, inside the old one.
+        """
+        logger.warning(
+            f'Failed to compile {texfile} with the precompiled preamble, '
+            'compiling it again without it'
+        )
+
+        try:
+            os.remove(fmt)
+        except FileNotFoundError:
+            pass
+
+        retrydir = os.path.join(tmpdir, 'retry')
+        os.mkdir(retrydir)
+
+        return retrydir
+
+    def _setup(self, texfile, tmpdir, precompiled=True):
+        """Copies a document to the directory it is compiled in, with its
+        preamble replaced by the precompiled format if possible.
+
+        texfile:     (str)  the LaTeX document.
+        tmpdir:      (str)  the directory.
+        precompiled: (bool) whether to use the precompiled format.
+
+        returns: (tuple) the command that compiles the document, and the
+                         format file it uses, `None` if it uses none.
+        """
+        name = os.path.splitext(os.path.basename(texfile))[0]
+        command = ['pdflatex', '-interaction=nonstopmode', '-halt-on-error']
+
+        with open(texfile, 'r') as file, \
+                open(os.path.join(tmpdir, name + '.tex'), 'w') as copy:
+            # Only the preamble is read, the body is copied as it is
+            lines = list()
+            line = file.readline()
+            while precompiled and line and BEGIN not in line:
+                lines.append(line)
+                line = file.readline()
+
+            # Only the body is compiled when the preamble is precompiled
+            index = line.find(BEGIN)
+            preamble = ''.join(lines) + line[:index]
+            fmt = self._format(preamble) if index >= 0 and precompiled else None
+
+            if fmt is not None:
+                os.symlink(fmt, os.path.join(tmpdir, 'preamble.fmt'))
+                command.append('-fmt=preamble')
+                lines = [line[index:]]
+            else:
+                lines.append(line)
+
+            copy.writelines(lines)
+            shutil.copyfileobj(file, copy)
+
+        return command + [name + '.tex'], fmt
+
+    def _done(self, texfile, tmpdir, ok, npass):
+        """Checks if a document needs no more passes.
+
+        texfile: (str)  the LaTeX document.
+        tmpdir:  (str)  the directory it is compiled in.
+        ok:      (bool) whether the last pass succeeded.
+        npass:   (int)  the number of the last pass, from 0.
+
+        returns: (bool) whether to stop compiling.
+        """
+        name = os.path.splitext(os.path.basename(texfile))[0]
+
+        return not ok or (
+            npass + 1 >= self.minpasses
+            and not self._needs_rerun(os.path.join(tmpdir, name + '.log'))
+        )
+
+    def _collect(self, texfile, tmpdir, ok, start):
+        """Moves the compiled PDF next to the document, or logs why it failed.
+
+        texfile: (str)   the LaTeX document.
+        tmpdir:  (str)   the directory it was compiled in.
+        ok:      (bool)  whether it compiled successfully.
+        start:   (float) when compiling started.
+
+        returns: (tuple) whether the document compiled successfully, and how
+                         long it took in seconds.
+        """
+        name = os.path.splitext(os.path.basename(texfile))[0]
+        pdfname = os.path.splitext(texfile)[0] + '.pdf'
+
+        if ok:
+            shutil.move(os.path.join(tmpdir, name + '.pdf'), pdfname)
+        else:
+            logger.error(
+                f'Failed to compile {texfile}, see the log below\n'
+                + self._read(os.path.join(tmpdir, name + '.log'))
+            )
+
+        elapsed = time.perf_counter() - start
+        logger.info(f'Compiled {texfile} in {elapsed:.2f}s')
+
+        return ok, elapsed
+
+    def _format(self, preamble):
+        """Builds the format file of a preamble, unless it already exists.
+
+        preamble: (str) everything before `\\begin{document}`.
+
+        returns: (str) the format file, `None` if it could not be built.
+        """
+        # A format only loads in the version of pdflatex that dumped it
+        content = pdflatex_version() + '\0' + preamble
+        key = hashlib.sha256(content.encode()).hexdigest()[:16]
+        fmt = os.path.join(self.fmtdir, f'preamble-{key}.fmt')
+
+        if os.path.exists(fmt) and os.path.getsize(fmt) > 0:
+            return fmt
+
+        logger.info('Precompiling the LaTeX preamble')
+        os.makedirs(self.fmtdir, exist_ok=True)
+
+        with tempfile.TemporaryDirectory(prefix='expense_report_fmt_') as tmpdir:
+            with open(os.path.join(tmpdir, 'preamble.tex'), 'w') as file:
+                file.write(preamble + '\n\\dump\n')
+
+            try:
+                pdflatex = subprocess.run(
+                    [
+                        'pdflatex',
+                        '-ini',
+                        '-interaction=nonstopmode',
+                        '-jobname=preamble',
+                        '&pdflatex',
+                        'preamble.tex'
+                    ],
+                    cwd=tmpdir,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+            except OSError:
+                logger.warning('Failed to run pdflatex to precompile the preamble')
+                return None
+
+            built = os.path.join(tmpdir, 'preamble.fmt')
+            if pdflatex.returncode != 0 or not os.path.exists(built):
+                logger.warning('Failed to precompile the preamble, compiling without it')
+                return None
+
+            # Other reports may be building the same format at the same time,
+            # so it is moved into place in one step
+            tmpname = f'{fmt}.{os.getpid()}.tmp'
+            shutil.move(built, tmpname)
+            os.replace(tmpname, fmt)
+
+        return fmt
+
+    def _needs_rerun(self, logfile):
+        """Checks if LaTeX asked to be run again to get references right.
+
+        logfile: (str) the log of the last run.
+
+        returns: (bool) whether to run again.
+        """
+        return 'Rerun' in self._read(logfile)
+
+    def _read(self, filename):
+        try:
+            with open(filename, 'r', errors='replace') as file:
+                return file.read()
+        except FileNotFoundError:
+            return ''
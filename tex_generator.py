@@ -1,28 +1,58 @@
 import logging
-import subprocess
+import os
+
+from tex_compiler import TexCompiler
 
 
 logger = logging.getLogger(__name__)
 
+# Characters with a special meaning in LaTeX and how to write them as text
+SPECIAL = {
+    '\\': r'\textbackslash{}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+}
+
+
+def escape(text):
+    """Escapes the characters of a text that have a special meaning in LaTeX.
+
+    text: (str) the text.
+
+    returns: (str) the escaped text.
+    """
+    return ''.join(SPECIAL.get(c, c) for c in text)
+
 
 class TexGenerator:
     """A class that formats and creates a basic template for a LaTeX document.
 
+    The document is streamed to the file as it is added to, so large tables
+    never have to be held in memory as a single string.
+
     filename: (str) the filename of the LaTeX document.
     """
     def __init__(self, filename):
         self.filename = filename
-        self.text = ""
+        self.file = None
 
     def add_header(self):
         logger.debug('Adding header')
 
-        self.text += r"""
+        self._emit(r"""
 \documentclass[12pt, onecolumn, twoside]{article}
 
 \usepackage[paperwidth=215.9mm, paperheight=279mm, hmargin=2.5cm, vmargin=2.5cm, centering]{geometry}
 \usepackage{graphicx}
 \usepackage{lettrine}
+\usepackage{longtable}
 \usepackage{multirow}
 \usepackage{scrextend}
 \usepackage{siunitx}
@@ -30,13 +60,13 @@ class TexGenerator:
 
 \begin{document}
 
-"""
+""")
 
     def add_title(self, title):
         logger.debug('Adding title')
 
-        self.text += f"""
-\\title{{{title}}}
+        self._emit(f"""
+\\title{{{escape(title)}}}
 \\date{{}}
 \\maketitle
 \\newpage
@@ -45,140 +75,193 @@ class TexGenerator:
 \\tableofcontents
 \\newpage
 
-"""
+""")
 
     def add_section(self, section):
         logger.debug('Adding section')
 
-        self.text += f'\n\\section{{section}}'
+        self._emit(f'\n\\section{{{escape(section)}}}\n')
 
     def add_figure(self, filename):
+        """Adds a figure the width of the page.
+
+        Vector PDF figures are embedded by pdflatex as they are, so they stay
+        sharp at any zoom and are much smaller than high resolution images.
+
+        filename: (str) the figure, as a PDF or PNG file.
+        """
         logger.debug(f'Adding a figure from {filename}')
 
-        self.text += f"""
+        self._emit(f"""
 \\begin{{figure}}[ht]
   \\centering
   \\includegraphics[width=\\textwidth]{{{filename}}}
 \\end{{figure}}
 
-"""
+""")
 
     def add_table(self, data, total):
+        """Adds the expenses as a table that can break across pages, with a
+        subtotal row after each date and each category on a date.
+
+        data:  (Node)  the total price of each expense, grouped by date,
+                       category and subcategory.
+        total: (float) the total price of every expense.
+        """
         logger.debug('Adding data to a table')
 
-        # Open table and create column names
-        self.text += r"""
-\begin{table}[ht]
-  \centering
-  \begin{tabular}{llllr}
-    Date & Category & Subcategory & Expense & Price (\$) \\ \hline \hline
-    """
+        # Open table and create column names, repeated on every page
+        self._emit(r"""
+\begin{longtable}{llllr}
+  Date & Category & Subcategory & Expense & Price (\$) \\ \hline \hline
+\endfirsthead
+  Date & Category & Subcategory & Expense & Price (\$) \\ \hline \hline
+\endhead
+  \multicolumn{5}{r}{\textit{Continued on next page}} \\
+\endfoot
+\endlastfoot
+""")
+
+        # Each row is written as soon as it is complete, so the table is
+        # never held in memory
+        for cells, end in self._table_rows(data):
+            self._emit(f'  {" & ".join(cells)} \\\\ \\cline{{{end}-5}}\n')
+
+        # Add final row for total expenses and close table
+        self._emit(
+            f'  \\hline \\hline\n  \\multicolumn{{4}}{{c}}{{TOTAL}} & {total:.2f} \\\\\n'
+            + '\\end{longtable}\n'
+        )
+
+    def add_comparison(self, comparison):
+        """Adds a table comparing the totals of each category and subcategory
+        with their average.
+
+        comparison: (dict) maps each category, and each subcategory as
+                           "category/subcategory", to its 'total', 'mean',
+                           'std' and 'difference'.
+        """
+        logger.debug('Adding comparison to a table')
 
-        # Create table rows
-        rows = ['' for _ in range(self._nitems(data))]
-        rows = self._generate_table(data, rows)
-        self.text += '\n    '.join(rows)
+        self._emit(r"""
+\begin{longtable}{lrrrr}
+  Category & Total (\$) & Average (\$) & Std. Dev. (\$) & Difference (\$) \\ \hline \hline
+\endhead
+""")
+
+        # Each category is followed by its subcategories
+        keys = sorted(comparison.keys(), key=lambda x: x.split('/', 1))
+        for i, key in enumerate(keys):
+            x = comparison[key]
+            cat, _, subcat = key.partition('/')
+
+            if subcat == '':
+                label = escape(cat.title())
+
+                if i > 0:
+                    self._emit('  \\hline\n')
+            else:
+                label = '\\quad ' + escape(subcat.title())
 
-        # Add final row for total expenses
-        self.text += f' \\hline \\hline\n    \multicolumn{{4}}{{c}}{{TOTAL}} & {total:.2f}'
+            self._emit(
+                f'  {label} & {x["total"]:.2f} & {x["mean"]:.2f} & {x["std"]:.2f} & {x["difference"]:+.2f} \\\\\n'
+            )
 
-        # Close table
-        self.text += r"""
-  \end{tabular}
-\end{table}
-"""
+        self._emit('\\end{longtable}\n')
 
     def add_footer(self):
         logger.debug('Adding footer')
 
-        self.text += '\n\\end{document}'
+        self._emit('\n\\end{document}')
 
     def write(self):
-        logger.info(f'Writing tex document to "{self.filename}"')
-        with open(self.filename, 'w') as file:
-            file.write(self.text)
+        """Finishes writing the document."""
+        logger.info(f'Finished writing tex document to "{self.filename}"')
 
-    def compile(self):
-        pdflatex = subprocess.run(['pdflatex', self.filename])
+        if self.file is not None:
+            self.file.close()
+            self.file = None
 
-        if pdflatex.returncode == 0:
+    def compile(self, compiler=None):
+        """Compiles the written document to a PDF next to it, and removes the
+        document.
+
+        compiler: (TexCompiler) the compiler to use. If not specified, a new
+                                one with the default format directory is used.
+
+        returns: (tuple) whether the document compiled successfully, and how
+                         long it took in seconds.
+        """
+        if compiler is None:
+            compiler = TexCompiler()
+
+        return self._compiled(*compiler.compile(self.filename))
+
+    async def compile_async(self, compiler=None):
+        """Compiles the written document like `compile`, without blocking the
+        event loop while pdflatex runs.
+
+        compiler: (TexCompiler) see `compile`.
+
+        returns: (tuple) whether the document compiled successfully, and how
+                         long it took in seconds.
+        """
+        if compiler is None:
+            compiler = TexCompiler()
+
+        return self._compiled(*await compiler.compile_async(self.filename))
+
+    def _compiled(self, ok, elapsed):
+        if ok:
             logger.info('Successfully compiled LaTeX document')
         else:
             logger.error('Failed to compile LaTeX document')
 
-        prefix = self.filename[:-4]
-        rmrf = subprocess.run([
-            'rm',
-            '-rf',
-            prefix + '.aux',
-            prefix + '.log',
-            prefix + '.tex',
-            prefix + '.toc'
-        ])
-
-        if rmrf.returncode == 0:
-            logger.info('Successfully removed residual files')
-        else:
-            logger.error('Failed to remove residual files')
-
-    def _generate_table(self, data, rows, r=0, c=1):
-        """Recursively creates a table using multirows.
-
-        This method only writes the contents of the table, and does not
-        initialize it nor closes it.
-
-        data: (dict) the data can either be a nested dictionary, in which case
-              this function is called again recursively, or a simple dictionary,
-              in which case the key and value are assumed to be the expense and
-              price.
-        rows: (list) a list of strings representing each row of the table. When
-              initally calling this method, this should be a list of empty
-              strings.
-        r:    (int) the current row. This does not need to be specified for the
-              initial call.
-        c:    (int) the current column. This does not need to be specified for
-              the initial call.
-
-        returns: (list) the updated rows of strings.
-        """
-        i = 0
-        for key, value in data.items():
-            if isinstance(value, dict):
-                # Nested dictionaries are assumed to be multirows
-                n = self._nitems(value)
+        os.remove(self.filename)
 
-                rows[r + i] += f'\\multirow{{{n}}}{{*}}{{{key.title()}}} '
+        return ok, elapsed
 
-                for j in range(n):
-                    rows[r + i + j] += '& '
+    def _emit(self, text):
+        """Writes text to the document, opening the file on the first write.
 
-                rows = self._generate_table(value, rows, r + i, c + 1)
+        text: (str) the text.
+        """
+        if self.file is None:
+            logger.info(f'Writing tex document to "{self.filename}"')
+            self.file = open(self.filename, 'w', buffering=1 << 16)
 
-                # Retroactively fix column line
-                rows[r + i + n - 1] = rows[r + i + n - 1][:-5] + f'{{{c}-5}}'
+        self.file.write(text)
 
-                i += n
-            else:
-                # Last columns are assumed to be expense and price
-                rows[r + i] += f'{key.title()} & {value:.2f} \\\\ \\cline{{{c}-5}}'
+    def _table_rows(self, node, c=1):
+        """Yields the rows of the expenses in a group, in a single walk.
 
-                i += 1
+        The label of each group is a multirow over as many rows as the group
+        has, which is known from the group before its rows are written.
 
-        return rows
+        node: (Node) the group.
+        c:    (int)  the column of the labels of the groups or expenses in
+                     the group.
 
-    def _nitems(self, data):
-        """Recursively counts the number of items in a nested dictionary.
+        yields: (tuple) the cells of each row from column `c`, and the first
+                        column of the line under the row, which spans every
+                        group that ends on the row.
+        """
+        for key, child in node.children.items():
+            if isinstance(child, (int, float)):
+                # Last columns are assumed to be expense and price
+                yield [escape(key.title()), f'{child:.2f}'], c
+                continue
 
-        data: (dict) a nested dictionary.
+            label = f'\\multirow{{{child.nrows}}}{{*}}{{{escape(child.label.title())}}}'
 
-        returns: (int) the number of items in the data.
-        """
-        n = 0
-        for key, value in data.items():
-            if isinstance(value, dict):
-                n += self._nitems(value)
-            else:
-                n += 1
+            for i, (cells, end) in enumerate(self._table_rows(child, c + 1)):
+                if i + 1 == child.nrows:
+                    end = c
 
-        return n
+                yield [label if i == 0 else ''] + cells, end
 
+        if node.subtotal:
+            yield [
+                f'\\multicolumn{{{4 - c + 1}}}{{l}}{{\\textit{{Total {escape(node.label.title())}}}}}',
+                f'\\textit{{{node.total:.2f}}}',
+            ], c